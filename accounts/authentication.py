@@ -0,0 +1,111 @@
+"""
+JWT authentication with an in-process user cache.
+
+simplejwt's JWTAuthentication loads the user row on every request.
+CachedJWTAuthentication keeps resolved users for a short time, keyed by the
+token's user id and checked against its public_id claim, so most requests
+skip that query. Saving or deleting a user (which covers password and
+is_active changes) and changing their groups or permissions evicts the
+entry through the receivers in accounts/signals.py.
+
+The cache is per process: a change made by another process is picked up
+when the entry expires. Settings:
+
+    ACCOUNTS_USER_CACHE_TTL = 60            # seconds, 0 disables the cache
+    ACCOUNTS_USER_CACHE_MAX_ENTRIES = 1024
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Thread-safe LRU of user instances by id, with a TTL.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+def get_user_cache():
+    global _user_cache
+    with _user_cache_lock:
+        if _user_cache is None:
+            _user_cache = UserCache(
+                getattr(settings, 'ACCOUNTS_USER_CACHE_TTL', 60),
+                getattr(settings, 'ACCOUNTS_USER_CACHE_MAX_ENTRIES', 1024),
+            )
+        return _user_cache
+
+def invalidate_user(user_id):
+    """
+    Drop a user from the cache, e.g. after it changed.
+    """
+    get_user_cache().delete(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        cache = get_user_cache()
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or not cache.ttl:
+            return super().get_user(validated_token)
+
+        public_id = validated_token.get('public_id')
+        user = cache.get(str(user_id))
+        if user is None or (public_id and str(user.public_id) != public_id):
+            # Loads and checks the user (active, password not changed)
+            user = super().get_user(validated_token)
+            if public_id and str(user.public_id) != public_id:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(str(user_id), user)
+        elif api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."),
+                                       code="password_changed")
+
+        # Requests must not share (and mutate) the cached instance
+        return copy.copy(user)
@@ -0,0 +1,28 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import get_user_cache, invalidate_user
+from .models import CustomUser
+
+# Evict users from the JWT authentication cache when they change. Saves cover
+# password, is_active and profile changes.
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def invalidate_user_permissions(sender, instance, reverse, pk_set, **kwargs):
+    if kwargs['action'] not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_user(instance.pk)
+    elif pk_set:
+        # A group or permission was changed from its side
+        for user_id in pk_set:
+            invalidate_user(user_id)
+    else:
+        # Cleared from the group/permission side: the users are unknown here
+        get_user_cache().clear()
@@ -1,3 +1,111 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from . import authentication
+from .authentication import CachedJWTAuthentication, UserCache
+from .models import CustomUser
+from .serializers import CustomTokenObtainPairSerializer
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('viewer@example.com', 'pw', first_name='Ada')
+        self.token = str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+        # A new cache, built from the settings of the test
+        patcher = mock.patch.object(authentication, '_user_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def authenticate(self, token=None):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def test_cached_user_is_served_without_a_query(self):
+        first = self.authenticate()
+        with self.assertNumQueries(0):
+            second = self.authenticate()
+        self.assertEqual(second.pk, self.user.pk)
+        # Each request gets its own copy
+        self.assertIsNot(first, second)
+        first.first_name = 'Changed'
+        self.assertEqual(self.authenticate().first_name, 'Ada')
+
+    def test_saved_users_are_loaded_again(self):
+        self.authenticate()
+        self.user.first_name = 'Grace'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().first_name, 'Grace')
+
+    def test_deactivated_and_deleted_users_are_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+        self.user.is_active = True
+        self.user.save()
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_group_changes_are_seen_from_either_side(self):
+        editors = Group.objects.create(name='editors')
+        self.authenticate()
+        self.user.groups.add(editors)
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        editors.user_set.remove(self.user)
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        self.user.groups.add(editors)
+        self.authenticate()
+        editors.user_set.clear()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    def test_token_of_another_user_with_the_same_id_is_rejected(self):
+        self.authenticate()
+        # e.g. issued to a deleted user whose id was reused
+        token = CustomTokenObtainPairSerializer.get_token(self.user).access_token
+        token['public_id'] = '00000000-0000-0000-0000-000000000000'
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(str(token))
+        self.assertEqual(self.authenticate().pk, self.user.pk)
+
+    @override_settings(ACCOUNTS_USER_CACHE_TTL=60)
+    def test_entries_expire_after_the_ttl(self):
+        now = 1000.0
+        with mock.patch.object(authentication.time, 'monotonic', lambda: now):
+            self.authenticate()
+            now += 59
+            with self.assertNumQueries(0):
+                self.authenticate()
+            now += 2
+            with self.assertNumQueries(1):
+                self.authenticate()
+
+    @override_settings(ACCOUNTS_USER_CACHE_TTL=0)
+    def test_zero_ttl_disables_the_cache(self):
+        self.authenticate()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+
+class UserCacheTests(TestCase):
+    def test_least_recently_used_users_are_evicted(self):
+        cache = UserCache(ttl=60, max_entries=2)
+        cache.set('1', 'first')
+        cache.set('2', 'second')
+        self.assertEqual(cache.get('1'), 'first')
+        cache.set('3', 'third')
+        self.assertIsNone(cache.get('2'))
+        self.assertEqual((cache.get('1'), cache.get('3')), ('first', 'third'))
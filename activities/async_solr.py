@@ -0,0 +1,169 @@
+"""
+Asynchronous Solr queries for the async dashboard views.
+
+The same requests as activities/solr.py, built and parsed by the same
+helpers, but sent with an httpx.AsyncClient so an ASGI worker can keep many
+of them in flight. Clients are configured from the HAYSTACK_CONNECTIONS
+entry (URL, TIMEOUT, CONNECT_TIMEOUT, MAX_RETRIES and ASYNC_POOL_MAXSIZE,
+default 100 connections) and live as long as the client_scope() the
+requests run in: the event loop of an ASGI server, or a single request.
+Requests go through the connection's circuit breaker and send
+solr_request_finished like the synchronous backend.
+"""
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+from pysolr import SolrError
+
+from . import solr
+from .resilience import SolrResponseError, get_circuit_breaker
+from .solr_backend import QTIME_RE, solr_request_finished
+
+# Longer query strings are POSTed, as pysolr does
+MAX_GET_URL_LENGTH = 1024
+
+# Clients shared by every scope of an event loop, see client_scope()
+_loop_clients = weakref.WeakKeyDictionary()
+_loop_clients_lock = threading.Lock()
+
+# using -> AsyncClient of the current client_scope()
+_scope_clients = contextvars.ContextVar('async_solr_clients', default=None)
+
+def create_client(using='default'):
+    options = settings.HAYSTACK_CONNECTIONS[using]
+    pool_size = options.get('ASYNC_POOL_MAXSIZE', 100)
+    return httpx.AsyncClient(
+        base_url=options['URL'].rstrip('/') + '/',
+        timeout=httpx.Timeout(options.get('TIMEOUT', 10),
+                              connect=options.get('CONNECT_TIMEOUT', 2)),
+        # Retries connection failures only, which is safe for any request
+        transport=httpx.AsyncHTTPTransport(
+            retries=options.get('MAX_RETRIES', 2),
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_size),
+        ),
+    )
+
+@contextlib.asynccontextmanager
+async def client_scope(shared=False):
+    """
+    Provide the clients of the requests run inside. Shared clients belong
+    to the running event loop and stay open: use them when the loop serves
+    every request (ASGI). Otherwise the clients are created for the scope
+    and closed on exit, since the loop may end with it (async_to_sync runs
+    each call in a new one, e.g. async views under WSGI).
+    """
+    if shared:
+        with _loop_clients_lock:
+            clients = _loop_clients.setdefault(asyncio.get_running_loop(), {})
+    else:
+        clients = {}
+    token = _scope_clients.set(clients)
+    try:
+        yield
+    finally:
+        _scope_clients.reset(token)
+        if not shared:
+            for client in clients.values():
+                await client.aclose()
+
+def get_client(using='default'):
+    """
+    The AsyncClient of a connection alias in the current client_scope(),
+    None outside any scope.
+    """
+    clients = _scope_clients.get()
+    if clients is None:
+        return None
+    client = clients.get(using)
+    if client is None:
+        client = clients[using] = create_client(using)
+    return client
+
+def _query(filters, q, params):
+    query = [('q', q), ('wt', 'json')]
+    query += [('fq', fq) for fq in solr.filter_queries(filters)]
+    for name, value in params.items():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            query.append((name, str(item).lower() if isinstance(item, bool) else item))
+    return query
+
+async def _send(client, query):
+    request = client.build_request('GET', 'select', params=query)
+    if len(str(request.url)) > MAX_GET_URL_LENGTH:
+        request = client.build_request('POST', 'select', data=query)
+    return await client.send(request)
+
+async def search(filters, q='*:*', using='default', **params):
+    """
+    Run a select request with the dashboard filters applied and return the
+    decoded JSON response. Raises SolrError like pysolr.
+    """
+    client = get_client(using)
+    if client is None:
+        # Not run by a view (e.g. a stale result refresh): close the client after
+        async with client_scope():
+            return await search(filters, q, using, **params)
+
+    breaker = get_circuit_breaker(using)
+    breaker.before_call()
+    started = time.monotonic()
+    response = error = None
+    try:
+        response = await _send(client, _query(filters, q, params))
+        if response.status_code != 200:
+            raise SolrResponseError("Solr responded with an error (HTTP %s): %s"
+                                    % (response.status_code, response.reason_phrase),
+                                    response.status_code)
+        breaker.record_success()
+        return response.json()
+    except httpx.TimeoutException as e:
+        error = SolrError("Connection to server '%s' timed out: %s" % (client.base_url, e))
+    except httpx.HTTPError as e:
+        error = SolrError("Failed to connect to server at %s: %s" % (client.base_url, e))
+    except SolrError as e:
+        error = e
+    finally:
+        if error:
+            breaker.record_error(error)
+        match = QTIME_RE.search(response.text[:200]) if response is not None else None
+        await solr_request_finished.asend(
+            sender=search,
+            method='get',
+            path='select/',
+            elapsed=time.monotonic() - started,
+            qtime=int(match.group(1)) if match else None,
+            error=error,
+        )
+    raise error
+
+async def date_bounds(filters, field='start_date', using='default'):
+    data = await search(filters, using=using, **solr.stats_params(field))
+    return solr.parse_date_bounds(data.get('stats', {}), field)
+
+async def facet_counts(filters, fields=(), range_field=None, gap='year', using='default'):
+    data = await search(filters, using=using, **solr.facet_params(filters, fields, range_field, gap))
+    facets = data.get('facet_counts', {})
+    facet_data = solr.parse_facet_counts(facets, range_field, gap)
+    if range_field and solr.outside_window(facets, range_field):
+        bounds = await date_bounds(filters, range_field, using=using)
+        data = await search(filters, using=using, **solr.facet_params(filters, (), range_field, gap, bounds))
+        facet_data['ranges'] = solr.parse_facet_counts(data.get('facet_counts', {}), range_field, gap)['ranges']
+    return facet_data
+
+async def time_series(filters, gap='year', using='default'):
+    facet_data = await facet_counts(filters, range_field='start_date', gap=gap, using=using)
+    return [
+        {'period': period, 'count': count}
+        for period, count in facet_data['ranges']['start_date']
+    ]
+
+async def pivot_counts(filters, fields, using='default'):
+    data = await search(filters, using=using, **solr.pivot_params(fields))
+    return solr.parse_pivot(data.get('facet_counts', {}), fields)
@@ -0,0 +1,237 @@
+"""
+Async (ASGI) versions of the facet, summary and stacked dashboard endpoints.
+The paginated list has none: a page takes a single Solr request (and one
+database lookup depending on it for legacy urls), so it has nothing to run
+concurrently and the synchronous view serves it.
+
+They answer exactly like their counterparts in activities/views.py and share
+their result cache entries, stale fallbacks and ETags, but query Solr with
+the async client of activities/async_solr.py, so a request waiting on Solr
+does not hold a worker thread. Database work (the 'database'/'summary'
+engines, the 'auto' fallback, authentication) runs in
+threads; responses needing several aggregations run them concurrently.
+
+Serve the project with an ASGI server (eyeview/asgi.py) to benefit: its
+event loop keeps the Solr clients and their connections. Under WSGI they
+still work, but each request runs in its own event loop and opens (and
+closes) its own clients.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError, close_old_connections
+from django.http import JsonResponse
+from django.views import View
+from pysolr import SolrError
+from rest_framework.exceptions import (APIException, AuthenticationFailed, NotAuthenticated,
+                                       PermissionDenied)
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import async_solr, resilience
+from .conditional import DashboardConditionalMixin, conditional_get
+from .engines import DatabaseEngine, as_solr_error, get_dashboard_engine
+from .filters import get_filters
+from .views import DashboardSummaryView, StackedDatasetView, DASHBOARD_FACETS, _facet_items
+
+log = logging.getLogger(__name__)
+
+async def _in_thread(func, *args, **kwargs):
+    """
+    Run blocking (database) work in a worker thread, closing its connection
+    afterwards as the request cycle would.
+    """
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return await sync_to_async(call, thread_sensitive=False)()
+
+async def _database_facet_counts(engine, filters, fields=(), range_field=None, gap='year'):
+    # One aggregation per field (and the time series), run concurrently
+    results = await asyncio.gather(
+        *(_in_thread(engine.facet_counts, filters, [field]) for field in fields),
+        *([_in_thread(engine.time_series, filters, gap)] if range_field else []),
+    )
+    facet_data = {'fields': {}, 'ranges': {}}
+    for result in results[:len(fields)]:
+        facet_data['fields'].update(result['fields'])
+    if range_field:
+        facet_data['ranges'][range_field] = [
+            (bucket['period'], bucket['count']) for bucket in results[-1]
+        ]
+    return facet_data
+
+async def dashboard_query(method, *args, **kwargs):
+    """
+    Run a dashboard engine method (facet_counts, time_series, pivot_counts)
+    following ACTIVITIES_DASHBOARD_ENGINE: async Solr for 'solr' and 'auto',
+    the database engines in threads otherwise or when 'auto' falls back.
+    Like AutoEngine, a failing fallback raises the Solr error.
+    """
+    name = getattr(settings, 'ACTIVITIES_DASHBOARD_ENGINE', 'auto')
+    solr_error = None
+    if name in ('solr', 'auto'):
+        try:
+            return await getattr(async_solr, method)(*args, **kwargs)
+        except (SolrError, IOError) as e:
+            if name != 'auto':
+                raise
+            log.warning("Solr unavailable for %s, using the database: %s", method, e)
+            solr_error = e
+            engine = DatabaseEngine()
+    else:
+        engine = get_dashboard_engine()
+
+    try:
+        if method == 'facet_counts':
+            return await _database_facet_counts(engine, *args, **kwargs)
+        return await _in_thread(getattr(engine, method), *args, **kwargs)
+    except DatabaseError as e:
+        if solr_error is None:
+            raise
+        log.warning("Database fallback for %s failed: %s", method, e)
+        raise as_solr_error(solr_error) from e
+
+def _result_response(result, stale):
+    response = JsonResponse(result, safe=False)
+    if stale:
+        # Last good result served while Solr is failing
+        response['Warning'] = resilience.STALE_WARNING
+    return response
+
+def _backend_unavailable(e):
+    return JsonResponse({"detail": f"Search backend unavailable: {e}"}, status=503)
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of DRF's APIView: the default authentication
+    classes and the view's permission_classes run (in a thread) before the
+    handler, which receives a DRF Request; API exceptions become JSON
+    error responses.
+    """
+    permission_classes = ()
+
+    def initial(self, request):
+        request = Request(request, authenticators=[
+            auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        request.user  # Authenticates, raising AuthenticationFailed for bad tokens
+        for permission in (permission_class() for permission_class in self.permission_classes):
+            if not permission.has_permission(request, self):
+                if request.successful_authenticator:
+                    raise PermissionDenied()
+                raise NotAuthenticated()
+        return request
+
+    def handle_exception(self, request, exc):
+        detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+        response = JsonResponse(detail, status=exc.status_code, safe=False)
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            authenticators = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+            header = authenticators[0]().authenticate_header(request) if authenticators else None
+            if header:
+                response['WWW-Authenticate'] = header
+            else:
+                response.status_code = 403
+        return response
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Only an ASGI server's event loop outlives the request
+        async with async_solr.client_scope(shared=isinstance(request, ASGIRequest)):
+            try:
+                request = await _in_thread(self.initial, request)
+                return await super().dispatch(request, *args, **kwargs)
+            except APIException as exc:
+                return self.handle_exception(request, exc)
+
+
+class AsyncFacetCountView(DashboardConditionalMixin, AsyncAPIView):
+    """
+    Async FacetCountView. Subclasses set facet_field and label.
+    """
+    facet_field = None
+    label = None
+
+    async def facet_counts(self, filters):
+        facet_data = await dashboard_query('facet_counts', filters, [self.facet_field])
+        return _facet_items(facet_data, self.facet_field, self.label)
+
+    @conditional_get
+    async def get(self, request):
+        filters = get_filters(request)
+        try:
+            result, stale = await resilience.aserve(self.facet_field, filters,
+                                                    lambda: self.facet_counts(filters))
+        except SolrError as e:
+            return _backend_unavailable(e)
+        return _result_response(result, stale)
+
+class AsyncThematicFacetView(AsyncFacetCountView):
+    facet_field = 'thematic_exact_str'
+    label = 'thematic_area'
+
+class AsyncCountriesFacetView(AsyncFacetCountView):
+    facet_field = 'country_exact_str'
+    label = 'country'
+
+class AsyncRegionsFacetView(AsyncFacetCountView):
+    facet_field = 'region_exact_str'
+    label = 'region'
+
+class AsyncDirectorateFacetView(AsyncFacetCountView):
+    facet_field = 'directorate_exact_str'
+    label = 'directorate'
+
+
+class AsyncDashboardSummaryView(DashboardConditionalMixin, AsyncAPIView):
+    """
+    Async DashboardSummaryView: one Solr request, or the per-field database
+    aggregations run concurrently.
+    """
+
+    async def summary(self, filters):
+        facet_data = await dashboard_query(
+            'facet_counts',
+            filters,
+            [field for _, field, _ in DASHBOARD_FACETS],
+            range_field='start_date',
+            gap='year',
+        )
+        return DashboardSummaryView.format_summary(facet_data)
+
+    @conditional_get
+    async def get(self, request):
+        filters = get_filters(request)
+        try:
+            result, stale = await resilience.aserve('summary', filters, lambda: self.summary(filters))
+        except SolrError as e:
+            return _backend_unavailable(e)
+        return _result_response(result, stale)
+
+
+class AsyncStackedDatasetView(DashboardConditionalMixin, AsyncAPIView):
+    """
+    Async StackedDatasetView.
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def build_chart_data(self, filters):
+        pivot = await dashboard_query('pivot_counts', filters, StackedDatasetView.PIVOT_FIELDS)
+        return StackedDatasetView.format_chart_data(pivot)
+
+    @conditional_get
+    async def get(self, request):
+        filters = get_filters(request)
+        try:
+            chart_data, stale = await resilience.aserve('stacked', filters,
+                                                        lambda: self.build_chart_data(filters))
+        except SolrError as e:
+            return _backend_unavailable(e)
+        return _result_response(chart_data, stale)
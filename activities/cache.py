@@ -0,0 +1,242 @@
+"""
+Result cache for the Solr-backed dashboard endpoints.
+
+Entries are keyed by endpoint name, the normalized request filters and the
+current index "generation". Anything that changes the indexed data (model
+saves/deletes, bulk uploads) bumps the generation, so stale entries are simply
+never read again and age out of the LRU.
+
+Configure it with ACTIVITIES_RESULT_CACHE in settings:
+
+    ACTIVITIES_RESULT_CACHE = {
+        'BACKEND': 'local',     # 'local', 'shared' or a dotted path to a backend class
+        'MAX_ENTRIES': 512,     # LRU bound for the local backend
+        'TIMEOUT': 3600,        # seconds, None to keep entries until evicted
+        'CACHE_ALIAS': 'default',  # Django cache used by the shared backend
+        'GENERATION_POLL_INTERVAL': 1.0,  # seconds the local backend trusts its generation
+    }
+
+The local backend keeps its entries per process but reads the generation from
+the database (IndexGeneration), at most once per GENERATION_POLL_INTERVAL, so
+a bump made by any process, such as `manage.py index_worker` after writing to
+Solr, reaches every worker within that interval. The shared backend keeps
+entries and generation in a Django cache, which every process must share.
+
+The generation and the time of its last bump also version the dashboard
+responses for conditional GETs (see activities/conditional.py).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import IndexGeneration
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 512,
+    'TIMEOUT': 3600,
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'activities:results',
+    'GENERATION_POLL_INTERVAL': 1.0,
+}
+
+def read_generation():
+    """
+    The shared (generation, modified unix time) from the database.
+    """
+    row, _ = IndexGeneration.objects.get_or_create(pk=1)
+    return row.generation, row.modified_at.timestamp()
+
+def incr_generation():
+    """
+    Bump the shared generation; returns the new (generation, modified).
+    """
+    bumped = IndexGeneration.objects.filter(pk=1)
+    with transaction.atomic():
+        # Write first, so the transaction never has to upgrade a read lock
+        if not bumped.update(generation=F('generation') + 1, modified_at=timezone.now()):
+            IndexGeneration.objects.get_or_create(pk=1)
+            bumped.update(generation=F('generation') + 1, modified_at=timezone.now())
+        return read_generation()
+
+class LocalMemoryBackend:
+    """
+    In-process LRU store. The generation counter is shared through the
+    database and cached for GENERATION_POLL_INTERVAL seconds; entries are
+    dropped as soon as a new generation is seen.
+    """
+
+    def __init__(self, options):
+        self.max_entries = options['MAX_ENTRIES']
+        self.timeout = options['TIMEOUT']
+        self.poll_interval = options['GENERATION_POLL_INTERVAL']
+        self._entries = OrderedDict()
+        self._generation = None
+        self._modified = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _use_generation(self, generation, modified):
+        with self._lock:
+            if generation != self._generation:
+                # Entries of older generations can never be read again
+                self._entries.clear()
+            self._generation, self._modified = generation, modified
+            self._checked_at = time.monotonic()
+
+    def _refresh_generation(self):
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at >= self.poll_interval:
+            self._use_generation(*read_generation())
+
+    def get_generation(self):
+        self._refresh_generation()
+        return self._generation
+
+    def get_modified(self):
+        self._refresh_generation()
+        return self._modified
+
+    def incr_generation(self):
+        self._use_generation(*incr_generation())
+        return self._generation
+
+class SharedCacheBackend:
+    """
+    Stores entries and the generation counter in a Django cache (Redis,
+    Memcached, ...) so every worker process sees the same generation.
+    Eviction is left to the cache server.
+    """
+
+    def __init__(self, options):
+        self.cache = caches[options['CACHE_ALIAS']]
+        self.timeout = options['TIMEOUT']
+        self.generation_key = f"{options['KEY_PREFIX']}:generation"
+        self.modified_key = f"{options['KEY_PREFIX']}:modified"
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def get_generation(self):
+        return self.cache.get(self.generation_key, 0)
+
+    def get_modified(self):
+        modified = self.cache.get(self.modified_key)
+        if modified is None:
+            # First use, or evicted: start from now so the value stays stable
+            self.cache.add(self.modified_key, time.time(), None)
+            modified = self.cache.get(self.modified_key, time.time())
+        return modified
+
+    def incr_generation(self):
+        self.cache.set(self.modified_key, time.time(), None)
+        # add() is a no-op when the counter already exists
+        self.cache.add(self.generation_key, 0, None)
+        try:
+            return self.cache.incr(self.generation_key)
+        except ValueError:
+            # The counter was evicted between add() and incr()
+            self.cache.set(self.generation_key, 1, None)
+            return 1
+
+BACKENDS = {
+    'local': LocalMemoryBackend,
+    'shared': SharedCacheBackend,
+}
+
+class ResultCache:
+    """
+    Filter-aware cache in front of the dashboard queries.
+    """
+
+    def __init__(self, backend, key_prefix):
+        self.backend = backend
+        self.key_prefix = key_prefix
+
+    def make_key(self, namespace, filters, generation):
+        normalized = json.dumps(sorted(filters.items()), separators=(',', ':'))
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        return f"{self.key_prefix}:{namespace}:{generation}:{digest}"
+
+    def get_or_compute(self, namespace, filters, compute):
+        """
+        Return the cached result for (namespace, filters), calling compute()
+        on a miss. A None result is not cached so that errors are retried.
+        """
+        key = self.make_key(namespace, filters, self.backend.get_generation())
+        result = self.backend.get(key)
+        if result is None:
+            result = compute()
+            if result is not None:
+                self.backend.set(key, result)
+        return result
+
+    def generation(self):
+        return self.backend.get_generation()
+
+    def modified(self):
+        """
+        Unix time of the last generation bump (or of the backend's creation),
+        None for custom backends that do not track it.
+        """
+        get_modified = getattr(self.backend, 'get_modified', None)
+        return get_modified() if get_modified else None
+
+    def bump_generation(self):
+        return self.backend.incr_generation()
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """
+    Return the process-wide ResultCache built from ACTIVITIES_RESULT_CACHE.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                options = {**DEFAULTS, **getattr(settings, 'ACTIVITIES_RESULT_CACHE', {})}
+                backend_cls = BACKENDS.get(options['BACKEND'])
+                if backend_cls is None:
+                    backend_cls = import_string(options['BACKEND'])
+                _result_cache = ResultCache(backend_cls(options), options['KEY_PREFIX'])
+    return _result_cache
+
+def bump_index_generation():
+    """
+    Invalidate every cached dashboard result. Call after the index changes.
+    """
+    return get_result_cache().bump_generation()
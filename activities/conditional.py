@@ -0,0 +1,116 @@
+"""
+Conditional GET support (ETag / Last-Modified) for polled endpoints.
+
+Views mix in ConditionalMixin with a get_etag() / get_last_modified() pair
+(or DashboardConditionalMixin) and decorate their get() with @conditional_get. The validators are computed without touching Solr or
+running the view's query; a matching If-None-Match (or If-Modified-Since)
+gets 304 Not Modified. The decorator runs inside the DRF handler, so
+authentication and permissions are checked first.
+"""
+import hashlib
+import inspect
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .cache import get_result_cache
+from .filters import get_filters
+
+def make_etag(*parts):
+    """
+    Strong ETag over JSON-serializable parts.
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return '"%s"' % hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def _add_validators(response, etag, last_modified):
+    if etag:
+        response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Let browsers keep the payload but revalidate on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def _is_current(response):
+    # Stale fallbacks must not be revalidated as current either
+    return response.status_code == 200 and not response.has_header('Warning')
+
+def conditional_get(method):
+    """
+    Answer GET/HEAD with 304 when the client's validators still match, and
+    send ETag / Last-Modified on successful responses. Errors and stale
+    responses carry no validators, so they are never revalidated into a 304.
+    Works on async handlers too; their validators are computed in a thread.
+    """
+    if inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            etag, last_modified = await sync_to_async(self.get_validators)(request, *args, **kwargs)
+            if etag is None and last_modified is None:
+                return await method(self, request, *args, **kwargs)
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await method(self, request, *args, **kwargs)
+                if not _is_current(response):
+                    return response
+            return _add_validators(response, etag, last_modified)
+        return async_wrapper
+
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        if etag is None and last_modified is None:
+            return method(self, request, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = method(self, request, *args, **kwargs)
+            if not _is_current(response):
+                return response
+        return _add_validators(response, etag, last_modified)
+    return wrapper
+
+
+class ConditionalMixin:
+    """
+    Base of the validator mixins: views define get_etag() and/or
+    get_last_modified().
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs):
+        return None
+
+    def get_validators(self, request, *args, **kwargs):
+        return (self.get_etag(request, *args, **kwargs),
+                self.get_last_modified(request, *args, **kwargs))
+
+
+class DashboardConditionalMixin(ConditionalMixin):
+    """
+    Validators for Solr/aggregation-backed views: the response only depends
+    on the view, the normalized filters, the query params listed in
+    etag_params and the index/data generation.
+    """
+    etag_params = ()
+
+    def get_etag(self, request, *args, **kwargs):
+        cache = get_result_cache()
+        return make_etag(
+            type(self).__name__,
+            sorted(get_filters(request).items()),
+            [(param, request.GET.get(param)) for param in self.etag_params],
+            cache.generation(),
+            cache.modified(),
+        )
+
+    def get_last_modified(self, request, *args, **kwargs):
+        modified = get_result_cache().modified()
+        return int(modified) if modified is not None else None
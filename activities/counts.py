@@ -0,0 +1,112 @@
+"""
+Pre-aggregated activity counts.
+
+ActivityCount holds one row per (country, region, thematic, directorate,
+year) combination with the number of activities in it. It is kept current
+with increment/decrement deltas: single saves and deletes through the
+receivers in activities/signals.py, bulk imports through apply_deltas() in
+the import transaction. `manage.py rebuild_activity_counts` recomputes it
+from scratch.
+"""
+import hashlib
+from collections import Counter
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Collate, ExtractYear
+
+DIMENSIONS = ('country', 'region', 'thematic', 'directorate', 'year')
+
+# Collations comparing text by its exact value, for database vendors whose
+# default collation does not (MySQL's default ones ignore case)
+BINARY_COLLATIONS = {
+    'mysql': 'utf8mb4_bin',
+}
+
+def exact(field, using='default'):
+    """
+    field as an expression that groups and compares values exactly, as
+    Solr's string fields and bucket_key() do, so values differing only in
+    case are not merged.
+    """
+    collation = BINARY_COLLATIONS.get(connections[using].vendor)
+    return Collate(field, collation) if collation else F(field)
+
+def dimensions(start_date, country, region, thematic, directorate):
+    """
+    The ActivityCount bucket of an activity, as a tuple in DIMENSIONS order.
+    """
+    year = start_date.year if start_date else None
+    return (country or '', region or '', thematic or '', directorate or '', year)
+
+def activity_dimensions(activity):
+    return dimensions(activity.start_date, activity.country, activity.region,
+                      activity.thematic, activity.directorate)
+
+def bucket_key(dims):
+    """
+    Unique key of a bucket. The dimension columns are too wide together for a
+    MySQL unique index, and year may be NULL, so the key is a hash.
+    """
+    raw = '\x1f'.join('' if value is None else str(value) for value in dims)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def apply_deltas(deltas, using=None):
+    """
+    Add a {dimensions: delta} mapping (e.g. a Counter) to ActivityCount.
+    Buckets that drop to zero are removed. Call inside the transaction that
+    made the changes so counts and rows commit together.
+    """
+    from .models import ActivityCount
+
+    manager = ActivityCount.objects.db_manager(using)
+    emptied = []
+    for dims, delta in deltas.items():
+        if not delta:
+            continue
+        key = bucket_key(dims)
+        if manager.filter(key=key).update(count=F('count') + delta):
+            if delta < 0:
+                emptied.append(key)
+            continue
+        if delta < 0:
+            # Nothing to decrement: the table was not built yet or is stale
+            continue
+        try:
+            with transaction.atomic(using=manager.db):
+                manager.create(key=key, count=delta, **dict(zip(DIMENSIONS, dims)))
+        except IntegrityError:
+            # Created concurrently
+            manager.filter(key=key).update(count=F('count') + delta)
+
+    if emptied:
+        manager.filter(key__in=emptied, count__lte=0).delete()
+
+def rebuild_counts(activity_model, count_model, batch_size=1000, using='default'):
+    """
+    Recompute every bucket from the activity table. Takes the model classes
+    so that migrations can pass their historical models.
+
+    Returns the number of buckets.
+    """
+    rows = (activity_model.objects.using(using)
+            .values(year=ExtractYear('start_date'),
+                    **{f'{field}_value': exact(field, using) for field in DIMENSIONS[:-1]})
+            .annotate(count=Count('id'))
+            .order_by())
+
+    # Rows differing only by NULL vs '' fall into the same bucket
+    totals = Counter()
+    for row in rows:
+        dims = (row['country_value'] or '', row['region_value'] or '', row['thematic_value'] or '',
+                row['directorate_value'] or '', row['year'])
+        totals[dims] += row['count']
+
+    with transaction.atomic(using=using):
+        count_model.objects.using(using).all().delete()
+        buckets = [
+            count_model(key=bucket_key(dims), count=count, **dict(zip(DIMENSIONS, dims)))
+            for dims, count in totals.items()
+        ]
+        count_model.objects.using(using).bulk_create(buckets, batch_size=batch_size)
+    return len(buckets)
@@ -0,0 +1,281 @@
+"""
+Interchangeable backends for the dashboard aggregations.
+
+Every engine answers facet, time-series and pivot requests with exactly the
+shapes activities/solr.py returns, so the views format their responses the
+same way whichever engine produced the data:
+
+- SolrEngine runs facet queries against the search index;
+- DatabaseEngine aggregates the Activity table with values().annotate(Count),
+  helped by the indexes declared on the model;
+- SummaryEngine sums the pre-aggregated ActivityCount table.
+
+Select one with ACTIVITIES_DASHBOARD_ENGINE in settings:
+
+    ACTIVITIES_DASHBOARD_ENGINE = 'auto'   # 'solr', 'database', 'summary' or 'auto'
+
+'auto' uses Solr and falls back to the database when Solr cannot be reached.
+It answers before the stale results of activities/resilience.py, which are
+only served when the database fails too.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from pysolr import SolrError
+
+from . import solr
+from .counts import BINARY_COLLATIONS, exact
+from .filters import without
+from .models import Activity, ActivityCount
+
+log = logging.getLogger(__name__)
+
+# Solr facet field -> Activity field
+MODEL_FIELDS = {
+    'country_exact_str': 'country',
+    'region_exact_str': 'region',
+    'thematic_exact_str': 'thematic',
+    'directorate_exact_str': 'directorate',
+}
+
+# Dashboard filter name -> Activity field
+FILTER_MODEL_FIELDS = {
+    name: MODEL_FIELDS[field] for name, field in solr.FILTER_FIELDS.items()
+}
+
+# Time-series gap -> Trunc kind
+TRUNC_KINDS = {
+    'year': 'year',
+    'quarter': 'quarter',
+    'month': 'month',
+}
+
+def _by_count(counts):
+    """
+    Order (value, count) pairs like Solr's facet.sort=count: highest count
+    first, ties in index (code point) order.
+    """
+    return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+
+def _filter_exact(qs, field, values):
+    """
+    qs narrowed to rows whose field is one of values, matched exactly like
+    Solr's string fields. Where that takes another collation the plain match
+    is kept as well, so the column's index still narrows the rows.
+    """
+    qs = qs.filter(**{f'{field}__in': values})
+    if connection.vendor in BINARY_COLLATIONS:
+        qs = qs.alias(**{f'{field}_value': exact(field)}).filter(**{f'{field}_value__in': values})
+    return qs
+
+
+def as_solr_error(error):
+    """
+    error as a SolrError, for the IOErrors the 'auto' engine also falls back on.
+    """
+    return error if isinstance(error, SolrError) else SolrError(str(error))
+
+
+class SolrEngine:
+    name = 'solr'
+
+    def facet_counts(self, filters, fields=(), range_field=None, gap='year'):
+        return solr.facet_counts(filters, fields, range_field=range_field, gap=gap)
+
+    def time_series(self, filters, gap='year'):
+        return solr.time_series(filters, gap)
+
+    def pivot_counts(self, filters, fields):
+        return solr.pivot_counts(filters, fields)
+
+
+class DatabaseEngine:
+    name = 'database'
+
+    def total(self):
+        """
+        Aggregate giving the number of activities per group.
+        """
+        return Count('id')
+
+    def queryset(self, filters):
+        """
+        Activities matching the normalized dashboard filters, as the Solr
+        filter queries would select them.
+        """
+        qs = Activity.objects.all()
+        for name, field in FILTER_MODEL_FIELDS.items():
+            if name in filters:
+                qs = _filter_exact(qs, field, filters[name])
+        if 'date_from' in filters:
+            qs = qs.filter(start_date__gte=filters['date_from'])
+        if 'date_to' in filters:
+            qs = qs.filter(start_date__lte=filters['date_to'])
+        return qs
+
+    def _field_counts(self, qs, field):
+        # Empty values are never indexed, so they never show up as facets
+        rows = (qs.exclude(Q(**{f'{field}__isnull': True}) | Q(**{field: ''}))
+                  .values(value=exact(field)).annotate(count=self.total()).values_list('value', 'count'))
+        return _by_count(rows)
+
+    def facet_counts(self, filters, fields=(), range_field=None, gap='year'):
+        facet_data = {
+            'fields': {
+                # Like the Solr facets, each field ignores its own filter
+                field: self._field_counts(
+                    self.queryset(without(filters, solr.FIELD_TAGS[field])), MODEL_FIELDS[field]
+                )[:solr.FACET_LIMIT]
+                for field in fields
+            },
+            'ranges': {},
+        }
+        if range_field:
+            facet_data['ranges'][range_field] = [
+                (bucket['period'], bucket['count'])
+                for bucket in self.time_series(filters, gap)
+            ]
+        return facet_data
+
+    def time_series(self, filters, gap='year'):
+        # Like the Solr range facet, an open window spans every dated row
+        qs = self.queryset(filters).filter(start_date__isnull=False)
+        rows = (qs.annotate(bucket=Trunc('start_date', TRUNC_KINDS[gap]))
+                  .values('bucket').annotate(count=Count('id')).order_by('bucket'))
+        return [
+            {'period': solr.period_label(row['bucket'].isoformat(), gap), 'count': row['count']}
+            for row in rows
+        ]
+
+    def pivot_counts(self, filters, fields):
+        qs = self.queryset(filters)
+        parent_field, child_field = (MODEL_FIELDS[field] for field in fields)
+
+        parents = {}
+        children = {}
+        rows = (qs.exclude(Q(**{f'{parent_field}__isnull': True}) | Q(**{parent_field: ''}))
+                  .values(parent=exact(parent_field), child=exact(child_field)).annotate(count=self.total())
+                  .values_list('parent', 'child', 'count'))
+        for parent, child, count in rows:
+            parents[parent] = parents.get(parent, 0) + count
+            if child:
+                children.setdefault(parent, []).append((child, count))
+
+        return [
+            {
+                'field': fields[0],
+                'value': parent,
+                'count': count,
+                'pivot': [
+                    {'field': fields[1], 'value': child, 'count': child_count}
+                    for child, child_count in _by_count(children.get(parent, []))
+                ],
+            }
+            for parent, count in _by_count(parents.items())
+        ]
+
+
+class SummaryEngine(DatabaseEngine):
+    """
+    Reads the pre-aggregated ActivityCount table, so the cost depends on the
+    number of distinct dimension combinations rather than on the number of
+    activities. Requests it cannot answer at year granularity (a date window
+    not made of whole years, quarter/month series) go to the activity table.
+    """
+    name = 'summary'
+
+    def total(self):
+        return Sum('count')
+
+    def queryset(self, filters):
+        """
+        Buckets matching the filters, or None when the date window does not
+        cover whole years.
+        """
+        date_from, date_to = filters.get('date_from'), filters.get('date_to')
+        if (date_from and date_from[5:] != '01-01') or (date_to and date_to[5:] != '12-31'):
+            return None
+
+        qs = ActivityCount.objects.filter(count__gt=0)
+        for name, field in FILTER_MODEL_FIELDS.items():
+            if name in filters:
+                qs = _filter_exact(qs, field, filters[name])
+        if date_from:
+            qs = qs.filter(year__gte=int(date_from[:4]))
+        if date_to:
+            qs = qs.filter(year__lte=int(date_to[:4]))
+        return qs
+
+    def facet_counts(self, filters, fields=(), range_field=None, gap='year'):
+        if self.queryset(filters) is None or (range_field and gap != 'year'):
+            return DatabaseEngine().facet_counts(filters, fields, range_field=range_field, gap=gap)
+        return super().facet_counts(filters, fields, range_field=range_field, gap=gap)
+
+    def time_series(self, filters, gap='year'):
+        qs = self.queryset(filters)
+        if qs is None or gap != 'year':
+            return DatabaseEngine().time_series(filters, gap)
+
+        qs = qs.filter(year__isnull=False)
+        rows = qs.values('year').annotate(count=Sum('count')).order_by('year')
+        return [{'period': str(row['year']), 'count': row['count']} for row in rows]
+
+    def pivot_counts(self, filters, fields):
+        if self.queryset(filters) is None:
+            return DatabaseEngine().pivot_counts(filters, fields)
+        return super().pivot_counts(filters, fields)
+
+
+class AutoEngine:
+    """
+    Uses Solr, falling back to the database while Solr is failing. When the
+    database fails as well the Solr error is raised, for the views to serve
+    the last good result.
+    """
+    name = 'auto'
+
+    def __init__(self):
+        self.primary = SolrEngine()
+        self.fallback = DatabaseEngine()
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return getattr(self.primary, method)(*args, **kwargs)
+        except (SolrError, IOError) as e:
+            log.warning("Solr unavailable for %s, using the database: %s", method, e)
+            solr_error = e
+        try:
+            return getattr(self.fallback, method)(*args, **kwargs)
+        except DatabaseError as e:
+            log.warning("Database fallback for %s failed: %s", method, e)
+            raise as_solr_error(solr_error) from e
+
+    def facet_counts(self, filters, fields=(), range_field=None, gap='year'):
+        return self._call('facet_counts', filters, fields, range_field=range_field, gap=gap)
+
+    def time_series(self, filters, gap='year'):
+        return self._call('time_series', filters, gap)
+
+    def pivot_counts(self, filters, fields):
+        return self._call('pivot_counts', filters, fields)
+
+
+ENGINES = {
+    'solr': SolrEngine,
+    'database': DatabaseEngine,
+    'summary': SummaryEngine,
+    'auto': AutoEngine,
+}
+
+def get_dashboard_engine():
+    name = getattr(settings, 'ACTIVITIES_DASHBOARD_ENGINE', 'auto')
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown ACTIVITIES_DASHBOARD_ENGINE '{name}', expected one of: {', '.join(ENGINES)}."
+        )
@@ -0,0 +1,153 @@
+"""
+Streaming export of filtered activities.
+
+Rows are read in fixed-size batches, from Solr with cursorMark paging or from
+the database with a chunked iterator, and each batch is encoded (and
+optionally gzip-compressed) as soon as it arrives. The server holds one batch
+at a time whatever the size of the export, and the first bytes go out after
+the first batch.
+
+Settings:
+
+    ACTIVITIES_EXPORT_BATCH_SIZE = 1000   # rows fetched per Solr/database round trip
+"""
+import csv
+import io
+import json
+from itertools import chain, islice
+
+from django.conf import settings
+from pysolr import SolrError
+
+from . import solr
+from .engines import DatabaseEngine
+
+# Exported columns, in CSV order
+COLUMNS = ('id', 'start_date', 'end_date', 'country', 'region', 'activity',
+           'objective', 'thematic', 'directorate', 'url')
+
+# Stored Solr field -> exported column
+SOLR_COLUMNS = {
+    'db_id': 'id',
+    'start_date': 'start_date',
+    'end_date': 'end_date',
+    'country_exact': 'country',
+    'region_exact': 'region',
+    'activity_exact': 'activity',
+    'objective_exact': 'objective',
+    'thematic_exact': 'thematic',
+    'directorate_exact': 'directorate',
+    'url': 'url',
+}
+SOLR_FIELDS = list(SOLR_COLUMNS) + ['url_exact']
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+}
+
+def get_batch_size():
+    return getattr(settings, 'ACTIVITIES_EXPORT_BATCH_SIZE', 1000)
+
+def solr_batches(filters, batch_size, prepare=None):
+    """
+    Yield lists of row tuples (in COLUMNS order) read from Solr page by page
+    with cursorMark, newest activities first. prepare, if given, is called
+    on each page of raw results before conversion (e.g. to fix urls).
+    """
+    cursor = '*'
+    while cursor:
+        page = solr.cursor_page(filters, cursor, batch_size, SOLR_FIELDS)
+        results = page['results']
+        if prepare:
+            prepare(results)
+        if results:
+            yield [
+                tuple(record.get(field) for field in SOLR_COLUMNS)
+                for record in results
+            ]
+        cursor = page['next_cursor']
+
+def database_batches(filters, batch_size):
+    """
+    Yield lists of row tuples (in COLUMNS order) from the activity table in
+    the same order as the Solr export. iterator() streams the rows from a
+    server-side cursor where the database supports one.
+    """
+    rows = (DatabaseEngine().queryset(filters)
+            .order_by('-start_date', 'id')
+            .values_list(*COLUMNS)
+            .iterator(chunk_size=batch_size))
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def activity_batches(filters, source, batch_size=None, prepare=None):
+    """
+    Batches of exported rows for the filters from 'solr', 'database' or
+    'auto' (Solr, or the database when Solr cannot be reached).
+
+    The first batch is fetched before returning, so a backend failure raises
+    here, while an error response can still be sent, rather than halfway
+    through the stream.
+    """
+    batch_size = batch_size or get_batch_size()
+    if source == 'database':
+        batches = database_batches(filters, batch_size)
+        return chain(list(islice(batches, 1)), batches)
+
+    batches = solr_batches(filters, batch_size, prepare=prepare)
+    try:
+        first = list(islice(batches, 1))
+    except (SolrError, IOError):
+        if source != 'auto':
+            raise
+        batches = database_batches(filters, batch_size)
+        first = list(islice(batches, 1))
+    return chain(first, batches)
+
+def get_export_source():
+    """
+    Where exports read from, following ACTIVITIES_DASHBOARD_ENGINE: the
+    database engines export from the activity table.
+    """
+    engine = getattr(settings, 'ACTIVITIES_DASHBOARD_ENGINE', 'auto')
+    return 'database' if engine in ('database', 'summary') else engine
+
+def _json_default(value):
+    # Dates and datetimes
+    return value.isoformat()
+
+def encode_csv(batches):
+    """
+    Yield the header line, then one UTF-8 encoded block of CSV lines per batch.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue().encode('utf-8')
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+
+def encode_ndjson(batches):
+    """
+    Yield one block of newline-delimited JSON objects per batch.
+    """
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, row)), default=_json_default, ensure_ascii=False) + '\n'
+            for row in batch
+        ).encode('utf-8')
+
+ENCODERS = {
+    CSV: encode_csv,
+    NDJSON: encode_ndjson,
+}
@@ -0,0 +1,69 @@
+from datetime import date
+from urllib.parse import unquote
+
+from rest_framework.exceptions import ValidationError
+
+# (filter name, query param) pairs accepted by the dashboard endpoints. Each
+# takes several values, repeated (?f.countries=Kenya&f.countries=Uganda) or
+# comma-separated (?f.countries=Kenya,Uganda), matched as alternatives.
+FILTER_PARAMS = (
+    ('countries', 'f.countries'),
+    ('regions', 'f.regions'),
+    ('thematics', 'f.thematics'),
+    ('directorates', 'f.directorates'),
+)
+
+# (filter name, query param) pairs bounding start_date, as YYYY-MM-DD
+DATE_FILTER_PARAMS = (
+    ('date_from', 'f.date_from'),
+    ('date_to', 'f.date_to'),
+)
+
+def get_list_param(request, name):
+    """
+    Return a list for a query param name, supporting repeated and comma-separated values.
+    """
+    # Django usually URL-decodes GET params, but unquote ensures it's decoded
+    values = [unquote(v).strip() for v in request.GET.getlist(name)]
+    values = [v for v in values if v]
+    if len(values) == 1 and "," in values[0]:
+        values = [v.strip() for v in values[0].split(",")]
+    return [v for v in values if v]
+
+def get_filters(request):
+    """
+    Return the normalized dashboard filters present on the request as a dict,
+    e.g. {'countries': ['Kenya', 'South Africa'], 'date_from': '2021-01-01'}.
+    Value lists are sorted and de-duplicated and empty params are dropped, so
+    that equivalent requests produce equal dicts.
+
+    Raises ValidationError (HTTP 400) for malformed dates and for a date
+    window that ends before it starts.
+    """
+    filters = {}
+    for name, param in FILTER_PARAMS:
+        values = get_list_param(request, param)
+        if values:
+            filters[name] = sorted(set(values))
+
+    for name, param in DATE_FILTER_PARAMS:
+        value = request.GET.get(param, '').strip()
+        if not value:
+            continue
+        try:
+            filters[name] = date.fromisoformat(value).isoformat()
+        except ValueError:
+            raise ValidationError({param: f"Invalid date '{value}', expected YYYY-MM-DD."})
+
+    if 'date_from' in filters and 'date_to' in filters and filters['date_from'] > filters['date_to']:
+        raise ValidationError({'f.date_from': f"f.date_from '{filters['date_from']}' is after "
+                                              f"f.date_to '{filters['date_to']}'."})
+
+    return filters
+
+def without(filters, name):
+    """
+    The filters minus one of them, as used for multi-select facets that
+    ignore their own selection.
+    """
+    return {key: value for key, value in filters.items() if key != name}
@@ -0,0 +1,211 @@
+"""
+Batched writes to the search index.
+
+Instead of pushing one document per save (each with its own hard commit),
+callers hand over the primary keys that changed and the index is brought in
+line with the database in as few Solr requests as possible, made visible with
+commitWithin rather than an explicit commit.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connection
+from haystack import connections
+from haystack.exceptions import SkipDocument
+from haystack.utils import get_model_ct
+
+from .cache import bump_index_generation
+
+log = logging.getLogger(__name__)
+
+# Primary keys loaded from the database per query / documents per add request
+SYNC_CHUNK_SIZE = 1000
+
+def get_commit_within():
+    """
+    Milliseconds within which Solr must make batched changes searchable.
+    """
+    return getattr(settings, 'ACTIVITIES_INDEX_COMMIT_WITHIN', 1000)
+
+def get_reindex_workers():
+    """
+    Threads sending batches to Solr in parallel during bulk reindexes.
+    """
+    return getattr(settings, 'ACTIVITIES_REINDEX_WORKERS', 4)
+
+# Monotonic time by which a delayed generation bump is due, None when none
+# is pending; one timer per process serves every change sent meanwhile
+_bump_due = None
+_bump_lock = threading.Lock()
+
+def _schedule_bump(delay):
+    # Not a daemon thread, so a process exiting right after the changes
+    # (e.g. `index_worker --once`) still makes the bump
+    threading.Timer(delay, _bump_later).start()
+
+def _bump_later():
+    global _bump_due
+    try:
+        bump_index_generation()
+    finally:
+        # The generation lives in the database; the timer thread owns its connection
+        connection.close()
+        with _bump_lock:
+            remaining = _bump_due - time.monotonic()
+            if remaining > 0:
+                # Changes sent while this bump was waiting
+                _schedule_bump(remaining)
+            else:
+                _bump_due = None
+
+def index_changed():
+    """
+    Invalidate cached dashboard results after index changes were sent.
+    Results computed before Solr applies the changes would be cached under
+    the new generation, so bump again once commitWithin has passed. Changes
+    sent while that second bump is pending only push it back (with one
+    timer per process), so a burst of flushes makes two bumps per
+    commitWithin at most.
+    """
+    global _bump_due
+    delay = get_commit_within() / 1000
+    with _bump_lock:
+        pending = _bump_due is not None
+        _bump_due = time.monotonic() + delay
+        if not pending:
+            _schedule_bump(delay)
+    if not pending:
+        bump_index_generation()
+
+def document_id(model, pk):
+    """
+    The Solr uniqueKey Haystack uses for a model instance ('app.model.pk').
+    """
+    return '%s.%s' % (get_model_ct(model), pk)
+
+def sync_documents(model, pks, using='default', commit_within=None):
+    """
+    Bring the index in line with the database for the given primary keys:
+    rows that still exist are (re)indexed, rows that are gone are deleted.
+    Reading the current state back from the database means a key may be
+    passed regardless of whether it was saved or deleted.
+
+    Returns an (indexed, deleted) tuple of counts.
+    """
+    if commit_within is None:
+        commit_within = get_commit_within()
+
+    backend = connections[using].get_backend()
+    index = connections[using].get_unified_index().get_index(model)
+    pks = list(pks)
+    docs = []
+    missing = []
+
+    for start in range(0, len(pks), SYNC_CHUNK_SIZE):
+        chunk = pks[start:start + SYNC_CHUNK_SIZE]
+        found = set()
+        for obj in index.index_queryset(using=using).filter(pk__in=chunk):
+            found.add(obj.pk)
+            try:
+                docs.append(index.full_prepare(obj))
+            except SkipDocument:
+                log.debug("Indexing for object `%s` skipped", obj)
+        missing.extend(document_id(model, pk) for pk in chunk if pk not in found)
+
+    if missing:
+        # Deletes ride along with the commitWithin of the following add;
+        # on their own they need a soft commit to become visible.
+        backend.conn.delete(id=missing, commit=False, softCommit=not docs)
+
+    for start in range(0, len(docs), SYNC_CHUNK_SIZE):
+        backend.conn.add(
+            docs[start:start + SYNC_CHUNK_SIZE],
+            commit=False,
+            commitWithin=commit_within,
+            boost=index.get_field_weights(),
+        )
+
+    return len(docs), len(missing)
+
+def reindex_queryset(queryset, batch_size=SYNC_CHUNK_SIZE, using='default', progress=None):
+    """
+    Stream queryset into the index with one update request per batch and a
+    single commit at the end, so memory stays bounded by batch_size however
+    many rows match. progress, if given, is called with the running total.
+
+    Returns the number of objects sent.
+    """
+    backend = connections[using].get_backend()
+    index = connections[using].get_unified_index().get_index(queryset.model)
+    batch = []
+    total = 0
+    for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            backend.update(index, batch, commit=False)
+            total += len(batch)
+            batch = []
+            if progress:
+                progress(total)
+    if batch:
+        backend.update(index, batch, commit=False)
+        total += len(batch)
+    if total:
+        backend.conn.commit()
+    return total
+
+def _update_batch(model, pks, using):
+    """
+    Load one batch of rows and send it to Solr without committing. Runs on
+    a reindex worker thread, which has its own database and Solr connection.
+    """
+    try:
+        index = connections[using].get_unified_index().get_index(model)
+        objs = list(index.index_queryset(using=using).filter(pk__in=pks))
+        if objs:
+            connections[using].get_backend().update(index, objs, commit=False)
+        return len(objs)
+    finally:
+        connection.close()
+
+def reindex_ids(model, pks, batch_size=SYNC_CHUNK_SIZE, workers=None, using='default', progress=None):
+    """
+    Index exactly the given primary keys: they are split into batches of
+    batch_size, sent by a pool of workers threads with at most two batches
+    per worker in flight, and committed once at the end. Time and memory
+    therefore stay bounded however many keys are passed.
+    progress, if given, is called with the running total.
+
+    Returns the number of objects sent.
+    """
+    workers = workers or get_reindex_workers()
+    total = 0
+    pending = set()
+
+    def collect(futures):
+        nonlocal total
+        for future in futures:
+            total += future.result()
+        if progress:
+            progress(total)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reindex') as executor:
+        try:
+            for start in range(0, len(pks), batch_size):
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(_update_batch, model, pks[start:start + batch_size], using))
+            done, pending = wait(pending)
+            collect(done)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    if total:
+        connections[using].get_backend().conn.commit()
+    return total
@@ -0,0 +1,389 @@
+"""
+Streaming CSV ingestion for bulk activity uploads.
+
+The upload is never held in memory as a whole: the encoding is detected from
+a bounded sample (and confirmed with an incremental decode), rows are parsed
+by pandas in fixed-size chunks and each chunk is bulk inserted before the
+next one is read. Peak memory therefore depends on the chunk size, not on the
+size of the file.
+"""
+import codecs
+from array import array
+from collections import Counter
+from datetime import datetime
+
+import chardet
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from haystack import connections
+
+from .cache import bump_index_generation
+from .indexing import reindex_ids
+from .counts import activity_dimensions, apply_deltas, dimensions
+from .models import Activity, ActivityCount
+
+# Bytes fed to chardet, and bytes per block when confirming the encoding
+ENCODING_SAMPLE_SIZE = 64 * 1024
+DECODE_BLOCK_SIZE = 1024 * 1024
+
+# Tried in order when the detected encoding cannot decode the whole file
+# (fallback encodings for Excel / Windows CSVs)
+FALLBACK_ENCODINGS = ('utf-8', 'cp1252')
+
+# Optional: auto-map alternate column names (if needed)
+COLUMN_MAP = {
+    'start': 'start_date',
+    'startdate': 'start_date',
+    'end': 'end_date',
+    'enddate': 'end_date',
+    'country name': 'country',
+    'activity name': 'activity',
+}
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y")
+
+# Activity fields read from the file, as-is or parsed as dates
+TEXT_FIELDS = ('country', 'region', 'activity', 'objective', 'thematic', 'directorate', 'url')
+DATE_FIELDS = ('start_date', 'end_date')
+
+UPSERT = 'upsert'
+APPEND = 'append'
+TRUNCATE = 'truncate'
+MODES = (UPSERT, APPEND, TRUNCATE)
+
+# Written on insert and on fingerprint conflict; the key fields are included
+# so case/whitespace corrections in a re-upload are applied too
+UPSERT_FIELDS = list(DATE_FIELDS + TEXT_FIELDS)
+
+
+class IngestError(ValueError):
+    """
+    The upload cannot be read as CSV.
+    """
+
+
+def get_chunk_size():
+    return getattr(settings, 'ACTIVITIES_UPLOAD_CHUNK_SIZE', 5000)
+
+
+def _decodes(file, encoding):
+    """
+    Check that the whole file decodes with encoding, one block at a time.
+    """
+    file.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        while True:
+            block = file.read(DECODE_BLOCK_SIZE)
+            if not block:
+                decoder.decode(b'', final=True)
+                return True
+            decoder.decode(block)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        file.seek(0)
+
+
+def detect_encoding(file):
+    """
+    Detect the file encoding with chardet from a bounded sample, then confirm
+    it against the whole file, falling back to FALLBACK_ENCODINGS.
+    """
+    sample = file.read(ENCODING_SAMPLE_SIZE)
+    file.seek(0)
+    detected = chardet.detect(sample).get("encoding") or "utf-8"
+    # An ASCII-only sample says nothing about the rest of the file
+    if detected.lower() == 'ascii':
+        detected = 'utf-8'
+
+    candidates = [detected] + [e for e in FALLBACK_ENCODINGS if e != detected.lower()]
+    for encoding in candidates:
+        try:
+            if _decodes(file, encoding):
+                return encoding
+        except LookupError:
+            # chardet can name codecs Python does not ship
+            continue
+    raise IngestError("Unable to detect the file encoding.")
+
+
+def read_chunks(file, encoding, chunk_size):
+    """
+    Yield normalized DataFrames of at most chunk_size rows. The index keeps
+    counting across chunks, so index + 2 is the row number in the file.
+    """
+    try:
+        reader = pd.read_csv(file, encoding=encoding, dtype=str, keep_default_na=False,
+                             chunksize=chunk_size)
+        for chunk in reader:
+            yield normalize_chunk(chunk)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        raise IngestError(f"Unable to read CSV: {str(e)}")
+
+
+def normalize_chunk(df):
+    """
+    Normalize column names and clean every cell with vectorized string
+    operations: strip whitespace and replace fancy quotes.
+    """
+    df.columns = [c.strip().lower() for c in df.columns]
+    df.rename(columns=COLUMN_MAP, inplace=True)
+    for column in df.columns:
+        df[column] = (df[column].astype(str).str.strip()
+                      .str.replace('\u2019', "'", regex=False)
+                      .str.replace('\u201c', '"', regex=False)
+                      .str.replace('\u201d', '"', regex=False))
+    return df
+
+
+def _column(df, name):
+    """
+    Return column name, or a column of empty strings when the file lacks it.
+    """
+    if name in df.columns:
+        return df[name]
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def _strptime(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_dates(values):
+    """
+    Parse a column of date strings against DATE_FORMATS, first match wins.
+    Returns datetime.date objects; empty and unparseable entries are None.
+
+    pandas parses the column as datetime64[ns], which cannot hold dates
+    outside 1677-2262; the values it leaves unparsed are retried one by one
+    with datetime.strptime, so those dates are accepted like any other.
+    """
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for fmt in DATE_FORMATS:
+        pending = parsed.isna() & (values != '')
+        if not pending.any():
+            break
+        parsed = parsed.combine_first(pd.to_datetime(values[pending], format=fmt, errors='coerce'))
+
+    dates = parsed.dt.date.astype(object).where(parsed.notna(), None)
+    leftover = parsed.isna() & (values != '')
+    if leftover.any():
+        dates[leftover] = values[leftover].map(_strptime)
+    return dates
+
+
+def parse_chunk(df):
+    """
+    Turn a normalized chunk into unsaved Activity objects.
+    Returns (activities, skipped_count, invalid_row_messages).
+    """
+    row_nums = df.index + 2  # header is row 1
+
+    dates = {}
+    errors = []
+    for position, field in enumerate(DATE_FIELDS):
+        values = _column(df, field)
+        dates[field] = parse_dates(values)
+        invalid = dates[field].isna() & (values != '')
+        errors.append(pd.DataFrame({
+            'row': row_nums[invalid.to_numpy()],
+            'field': position,
+            'message': ("Row " + row_nums[invalid.to_numpy()].astype(str)
+                        + ": invalid " + field + " '" + values[invalid].to_numpy() + "'"),
+        }))
+    # Same order as before: by row, start_date before end_date
+    errors = pd.concat(errors).sort_values(['row', 'field'], kind='stable')
+    invalid_rows = errors['message'].tolist()
+
+    records = pd.DataFrame({field: _column(df, field) for field in TEXT_FIELDS})
+    keep = (records['activity'] != '') & (records['country'] != '')
+    for field in DATE_FIELDS:
+        records[field] = dates[field]
+
+    activities = [Activity(**record) for record in records[keep].to_dict('records')]
+    return activities, int((~keep).sum()), invalid_rows
+
+
+def truncate_activities():
+    """
+    Delete every activity with one statement, bypassing per-row delete
+    signals, and empty ActivityCount to match.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % connection.ops.quote_name(Activity._meta.db_table))
+    ActivityCount.objects.all().delete()
+
+
+def upsert_chunk(activities, update=True):
+    """
+    Insert or update a chunk of parsed activities keyed on their content
+    fingerprint, in one bulk upsert. Rows repeated within the chunk collapse
+    to their last occurrence. With update=False existing rows are left
+    untouched and count as unchanged.
+
+    An identical repeat counts as unchanged. A repeat with other values
+    counts as updated when the row is written and mode is upsert, as if the
+    rows had been written one after the other. It counts as unchanged when
+    the stored row already matches the last occurrence, since nothing is
+    written then.
+
+    Returns (inserted, updated, unchanged, changed_ids) where changed_ids are
+    the primary keys of the inserted and updated rows.
+    """
+    by_fingerprint = {}
+    # Repeats of a fingerprint whose values differ from the occurrence before
+    rewrites = Counter()
+    updated = unchanged = 0
+    for activity in activities:
+        activity.fingerprint = activity.compute_fingerprint()
+        previous = by_fingerprint.get(activity.fingerprint)
+        if previous is not None:
+            if _values(previous) == _values(activity):
+                unchanged += 1
+                continue
+            rewrites[activity.fingerprint] += 1
+        by_fingerprint[activity.fingerprint] = activity
+
+    existing = {
+        row['fingerprint']: row
+        for row in Activity.objects.filter(fingerprint__in=list(by_fingerprint))
+                                   .values('fingerprint', *UPSERT_FIELDS)
+    }
+
+    to_write = []
+    inserted = 0
+    # ActivityCount changes, applied in the same transaction
+    deltas = Counter()
+    for fingerprint, activity in by_fingerprint.items():
+        row = existing.get(fingerprint)
+        if row is None:
+            inserted += 1
+        elif update and tuple(row[field] for field in UPSERT_FIELDS) != _values(activity):
+            updated += 1
+            deltas[dimensions(row['start_date'], row['country'], row['region'],
+                              row['thematic'], row['directorate'])] -= 1
+        else:
+            unchanged += 1 + rewrites[fingerprint]
+            continue
+        if update:
+            updated += rewrites[fingerprint]
+        else:
+            unchanged += rewrites[fingerprint]
+        deltas[activity_dimensions(activity)] += 1
+        to_write.append(activity)
+
+    if not to_write:
+        return inserted, updated, unchanged, []
+
+    if update:
+        options = {'update_conflicts': True, 'update_fields': UPSERT_FIELDS + ['updated_at']}
+        # MySQL's ON DUPLICATE KEY UPDATE cannot name the conflicting column
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['fingerprint']
+    else:
+        options = {'ignore_conflicts': True}
+    Activity.objects.bulk_create(to_write, **options)
+    apply_deltas(deltas)
+
+    # Read the keys back by fingerprint: exact on every backend, including
+    # those that do not return keys from bulk inserts.
+    changed_ids = list(Activity.objects.filter(fingerprint__in=[a.fingerprint for a in to_write])
+                       .order_by('id').values_list('id', flat=True))
+    return inserted, updated, unchanged, changed_ids
+
+
+def _values(activity):
+    return tuple(getattr(activity, field) for field in UPSERT_FIELDS)
+
+
+def import_csv(file, chunk_size=None, progress=None, mode=UPSERT):
+    """
+    Stream a CSV upload into the Activity table and schedule the reindex of
+    the rows it changed. Rows are upserted on their content fingerprint, so
+    uploading the same file twice changes nothing. All chunks are written in
+    one transaction, so a file that turns out to be malformed halfway leaves
+    nothing behind.
+
+    mode is one of MODES: UPSERT inserts new rows and updates changed ones,
+    APPEND only inserts new rows, TRUNCATE first deletes every activity (and
+    its documents once the import commits).
+
+    progress, if given, is called with the running summary after every
+    chunk and every index batch.
+
+    Returns the upload summary; raises IngestError for unreadable files.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+
+    # ------------------------------------------------------------------
+    # 🔍 Step 1: Detect file encoding from a bounded sample
+    # ------------------------------------------------------------------
+    encoding = detect_encoding(file)
+
+    summary = {
+        "message": "Upload complete.",
+        "imported": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "skipped": 0,
+        "invalid_rows": [],
+        "encoding_used": encoding,
+        "total_rows": 0,
+        "indexed": 0,
+    }
+
+    # Primary keys of the inserted and updated rows, kept compactly for the reindex
+    changed_ids = array('q')
+
+    # ------------------------------------------------------------------
+    # 💾 Step 2: Parse and upsert chunk by chunk inside one transaction
+    # ------------------------------------------------------------------
+    with transaction.atomic():
+        if mode == TRUNCATE:
+            truncate_activities()
+
+        for chunk in read_chunks(file, encoding, chunk_size):
+            activities, skipped, invalid_rows = parse_chunk(chunk)
+            inserted, updated, unchanged, ids = upsert_chunk(activities, update=mode == UPSERT)
+            changed_ids.extend(ids)
+
+            summary["imported"] += inserted
+            summary["updated"] += updated
+            summary["unchanged"] += unchanged
+            summary["skipped"] += skipped
+            summary["invalid_rows"].extend(invalid_rows)
+            summary["total_rows"] += len(chunk)
+            if progress:
+                progress(summary)
+
+        if changed_ids or mode == TRUNCATE:
+            def indexed(count):
+                if count != summary["indexed"]:
+                    summary["indexed"] = count
+                    if progress:
+                        progress(summary)
+
+            def reindex_on_commit():
+                if progress:
+                    # Reported from outside the transaction: the rows are committed
+                    progress(summary)
+                try:
+                    if mode == TRUNCATE:
+                        # Committed together with the reindex below, if there is one
+                        connections['default'].get_backend().clear(models=[Activity],
+                                                                   commit=not changed_ids)
+                    indexed(reindex_ids(Activity, changed_ids, progress=indexed))
+                finally:
+                    # The database changed even if Solr did not follow
+                    bump_index_generation()
+
+            transaction.on_commit(reindex_on_commit)
+
+    return summary
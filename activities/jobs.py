@@ -0,0 +1,239 @@
+"""
+Background processing of CSV bulk uploads.
+
+The upload view only stores the file and records an UploadJob; parsing,
+inserting and reindexing run on a small per-process thread pool so request
+workers stay free. Final counters are saved on the job row. Live counters
+cannot be, because the import runs in one transaction, so they are published
+through the Django cache while the job runs; use a shared CACHES backend
+(Redis/Memcached) when status requests may reach another process.
+
+Jobs live only in the executor of the process that accepted them. Each job
+records that process (worker_id()) and its stored file, so that a job left
+pending or running by a process that stopped can be failed and its file
+removed: when its status is polled, when a process starts its executor,
+and by `manage.py fail_orphaned_upload_jobs`. Whether a process is alive
+can only be told on its own host; jobs of other hosts are failed once they
+are older than ACTIVITIES_UPLOAD_JOB_TIMEOUT.
+
+Settings:
+
+    ACTIVITIES_UPLOAD_WORKERS = 2            # concurrent upload jobs per process
+    ACTIVITIES_UPLOAD_DIR = None             # where uploads wait (default: temp dir)
+    ACTIVITIES_UPLOAD_JOB_TIMEOUT = 21600    # seconds before another host's job counts as lost
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .ingest import IngestError, import_csv
+from .models import UploadJob
+
+log = logging.getLogger(__name__)
+
+PROGRESS_KEY = 'activities:upload-job:%s'
+PROGRESS_TIMEOUT = 24 * 3600
+
+# UploadJob field -> import_csv summary key
+COUNTERS = {
+    'rows_parsed': 'total_rows',
+    'rows_inserted': 'imported',
+    'rows_updated': 'updated',
+    'rows_unchanged': 'unchanged',
+    'rows_skipped': 'skipped',
+    'rows_indexed': 'indexed',
+}
+
+# Error recorded on jobs whose process stopped before finishing them
+ORPHANED_ERROR = "The upload was interrupted: the process importing it stopped."
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker = None
+
+def get_job_timeout():
+    return getattr(settings, 'ACTIVITIES_UPLOAD_JOB_TIMEOUT', 6 * 3600)
+
+def worker_id():
+    """
+    Identify this process on its jobs: 'host:pid:token'. The token tells a
+    process apart from an earlier one that had the same pid (e.g. before a
+    container restart). Computed per pid, so forked workers get their own.
+    """
+    global _worker
+    pid = os.getpid()
+    if _worker is None or _worker[0] != pid:
+        _worker = (pid, '%s:%d:%s' % (socket.gethostname(), pid, uuid.uuid4().hex[:12]))
+    return _worker[1]
+
+def worker_alive(worker):
+    """
+    Whether the process identified by worker is still running: True, False,
+    or None when it cannot be told from here (another host, unknown id).
+    """
+    try:
+        host, pid, _ = worker.rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        return None
+    if host != socket.gethostname():
+        return None
+    if pid == os.getpid():
+        return worker == worker_id()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, under another user
+        return True
+    return True
+
+def is_orphaned(job):
+    """
+    Whether a pending or running job will never finish because the process
+    that owns it is gone.
+    """
+    if job.status not in (UploadJob.PENDING, UploadJob.RUNNING):
+        return False
+    alive = worker_alive(job.worker)
+    if alive is None:
+        return timezone.now() - job.created_at > timedelta(seconds=get_job_timeout())
+    return not alive
+
+def _remove(path):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _fail_orphaned(job):
+    # Conditional update, in case the job finished meanwhile
+    failed = UploadJob.objects.filter(pk=job.pk, status=job.status).update(
+        status=UploadJob.FAILED, error=ORPHANED_ERROR, finished_at=timezone.now())
+    if failed:
+        log.warning("Upload job %s was orphaned by %s; marked as failed", job.pk, job.worker or 'its process')
+        _remove(job.file_path)
+        cache.delete(PROGRESS_KEY % job.pk)
+    return failed
+
+def fail_orphaned_jobs():
+    """
+    Fail every orphaned job and delete its stored file.
+    Returns the number of jobs failed.
+    """
+    failed = 0
+    for job in UploadJob.objects.filter(status__in=[UploadJob.PENDING, UploadJob.RUNNING]):
+        if is_orphaned(job):
+            failed += _fail_orphaned(job)
+    return failed
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'ACTIVITIES_UPLOAD_WORKERS', 2),
+                thread_name_prefix='upload-job',
+            )
+            # A (re)started process: clean up after the ones that stopped
+            try:
+                fail_orphaned_jobs()
+            except Exception:
+                log.exception("Could not fail orphaned upload jobs")
+        return _executor
+
+def _counters(summary):
+    counters = {field: summary[key] for field, key in COUNTERS.items()}
+    counters['rows_invalid'] = len(summary['invalid_rows'])
+    return counters
+
+def submit_upload(file):
+    """
+    Store an uploaded file and queue it for import.
+    Returns the pending UploadJob.
+    """
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=getattr(settings, 'ACTIVITIES_UPLOAD_DIR', None))
+    with os.fdopen(fd, 'wb') as out:
+        for chunk in file.chunks():
+            out.write(chunk)
+
+    job = UploadJob.objects.create(file_name=file.name, worker=worker_id(), file_path=path)
+    # Only start once the job row is visible to the worker thread
+    transaction.on_commit(lambda: get_executor().submit(run_upload, job.pk, path))
+    return job
+
+def run_upload(job_id, path):
+    """
+    Import a stored upload and record the outcome on its job. Runs on the
+    executor; never raises.
+    """
+    try:
+        job = UploadJob.objects.get(pk=job_id)
+        job.status = UploadJob.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+
+        state = {'committed': False}
+
+        def progress(summary):
+            # Reindex progress is reported from on_commit, outside the import transaction
+            state['committed'] = not connection.in_atomic_block
+            cache.set(PROGRESS_KEY % job_id, _counters(summary), PROGRESS_TIMEOUT)
+
+        try:
+            with open(path, 'rb') as file:
+                summary = import_csv(file, progress=progress)
+        except Exception as e:
+            if isinstance(e, IngestError):
+                log.warning("Upload job %s rejected: %s", job_id, e)
+            else:
+                log.exception("Upload job %s failed", job_id)
+            # Keep the counts that made it through, e.g. rows committed before
+            # indexing failed; a rolled back import inserted nothing.
+            for field, value in (cache.get(PROGRESS_KEY % job_id) or {}).items():
+                setattr(job, field, value)
+            if not state['committed']:
+                job.rows_inserted = job.rows_updated = job.rows_unchanged = 0
+            job.status = UploadJob.FAILED
+            job.error = str(e)
+        else:
+            for field, value in _counters(summary).items():
+                setattr(job, field, value)
+            job.encoding = summary['encoding_used']
+            job.invalid_rows = summary['invalid_rows']
+            job.status = UploadJob.SUCCEEDED
+
+        job.finished_at = timezone.now()
+        job.save()
+        cache.delete(PROGRESS_KEY % job_id)
+    except Exception:
+        log.exception("Could not record upload job %s", job_id)
+    finally:
+        _remove(path)
+        connection.close()
+
+def get_job(job_id):
+    """
+    Return the UploadJob with live counters applied while it is running,
+    or None if there is no such job. An orphaned job is failed first.
+    """
+    job = UploadJob.objects.filter(pk=job_id).first()
+    if job is not None and is_orphaned(job) and _fail_orphaned(job):
+        job.refresh_from_db()
+    if job is not None and job.status == UploadJob.RUNNING:
+        for field, value in (cache.get(PROGRESS_KEY % job_id) or {}).items():
+            setattr(job, field, value)
+    return job
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from activities.jobs import fail_orphaned_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Mark upload jobs left pending or running by a process that stopped (restart, crash) "
+        "as failed and delete their stored files. Jobs of processes on other hosts are failed "
+        "once older than ACTIVITIES_UPLOAD_JOB_TIMEOUT. Safe to run from cron or at deploy time."
+    )
+
+    def handle(self, *args, **options):
+        failed = fail_orphaned_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Failed {failed} orphaned upload jobs."))
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from activities.cache import bump_index_generation
+from activities.ingest import get_chunk_size, truncate_activities
+from activities.synthetic import DATE_JITTER, DEFAULT_SAMPLE, ActivityDistribution, insert_activities, write_csv
+
+# Largest corpus generated in one run
+MAX_COUNT = 10_000_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic corpus of activities following the distributions of a sample CSV "
+        "(countries, regions, thematic areas, directorates, dates and URLs), streamed to a CSV "
+        "file or bulk inserted into the Activity table. The same --seed gives the same corpus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int,
+                            help=f'Number of activities to generate (at most {MAX_COUNT:,}).')
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--output',
+                            help="CSV file to write, in the bulk upload format ('-' for stdout).")
+        target.add_argument('--insert', action='store_true',
+                            help='Bulk insert into the Activity table.')
+        parser.add_argument('--sample', default=DEFAULT_SAMPLE,
+                            help='CSV to learn the distributions from (default: resources/au-data-test.csv).')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random generator.')
+        parser.add_argument('--first', type=int, default=0,
+                            help='Number of the first generated activity. Use it to add to a corpus '
+                                 'generated earlier without repeating its rows.')
+        parser.add_argument('--date-jitter', type=int, default=DATE_JITTER,
+                            help='Days a generated start date may differ from the sampled one.')
+        parser.add_argument('--batch-size', type=int, default=get_chunk_size(),
+                            help='Rows inserted per transaction with --insert.')
+        parser.add_argument('--truncate', action='store_true',
+                            help='With --insert, delete every activity first.')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        if not 0 < count <= MAX_COUNT:
+            raise CommandError(f"count must be between 1 and {MAX_COUNT:,}.")
+        if options['truncate'] and not options['insert']:
+            raise CommandError("--truncate only applies with --insert.")
+        if not os.path.exists(options['sample']):
+            raise CommandError(f"Sample CSV not found at {options['sample']}")
+
+        try:
+            distribution = ActivityDistribution.from_csv(options['sample'],
+                                                         date_jitter=options['date_jitter'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        # Keep stdout clean when the CSV goes there
+        log = self.stderr if options['output'] == '-' else self.stdout
+        learned = distribution.describe()
+        log.write("Learned from {sample_rows} rows: {countries} countries, {regions} regions, "
+                  "{thematic_directorate_pairs} thematic/directorate pairs, start dates {start_dates}, "
+                  "{with_url:.0%} with a URL.".format(**learned))
+
+        started = time.monotonic()
+        if options['output']:
+            rows = distribution.rows(count, options['seed'], options['first'])
+            if options['output'] == '-':
+                try:
+                    written = write_csv(sys.stdout, rows)
+                    sys.stdout.flush()
+                except BrokenPipeError:
+                    # The reader (e.g. head) went away: stop quietly
+                    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                    return
+            else:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                    written = write_csv(out, rows)
+            log.write(self.style.SUCCESS(
+                f"Wrote {written} activities to {options['output']} in {time.monotonic() - started:.1f}s."))
+            return
+
+        progress_end = '\r' if self.stdout.isatty() else '\n'
+
+        def progress(total):
+            self.stdout.write(f"  {total} activities inserted...", ending=progress_end)
+
+        if options['truncate']:
+            truncate_activities()
+        try:
+            inserted = insert_activities(
+                distribution.activities(count, options['seed'], options['first']),
+                batch_size=options['batch_size'],
+                progress=progress,
+            )
+        except IntegrityError as e:
+            raise CommandError(f"Generated activities already exist ({e}); "
+                               f"use another --seed or --first, or --truncate.")
+        finally:
+            bump_index_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {inserted} activities in {time.monotonic() - started:.1f}s."))
+        if options['truncate']:
+            self.stdout.write("Run `manage.py clear_index` and `manage.py reindex_activities` to index them.")
+        else:
+            self.stdout.write("Run `manage.py reindex_activities` to index them.")
@@ -0,0 +1,77 @@
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pysolr import SolrError
+
+from activities.ingest import MODES, UPSERT, IngestError, get_chunk_size, import_csv
+
+DEFAULT_CSV = os.path.join(settings.BASE_DIR, 'resources', 'au-data-test.csv')
+
+
+class Command(BaseCommand):
+    help = (
+        "Import activities from a CSV file in batches, with search index signals "
+        "switched off during the load and one batched reindex at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', nargs='?', default=DEFAULT_CSV,
+                            help='CSV file to import (default: resources/au-data-test.csv).')
+        parser.add_argument('--batch-size', type=int, default=get_chunk_size(),
+                            help='Rows parsed and written per batch.')
+        parser.add_argument('--mode', choices=MODES, default=UPSERT,
+                            help='upsert: insert new rows and update changed ones; '
+                                 'append: only insert new rows; '
+                                 'truncate: delete every activity first.')
+
+    def handle(self, *args, **options):
+        csv_path = options['csv_path']
+        if not os.path.exists(csv_path):
+            raise CommandError(f"CSV file not found at {csv_path}")
+
+        self.stdout.write(f"Importing {csv_path} ({options['mode']})...")
+        started = time.monotonic()
+        progress_end = '\r' if self.stdout.isatty() else '\n'
+
+        def progress(summary):
+            self.stdout.write(
+                f"  {summary['total_rows']} rows parsed: {summary['imported']} inserted, "
+                f"{summary['updated']} updated, {summary['unchanged']} unchanged, "
+                f"{len(summary['invalid_rows'])} invalid, {summary['indexed']} indexed",
+                ending=progress_end,
+            )
+
+        # Bulk writes send no model signals, but keep the Haystack processor
+        # out of the way for the whole load; the import reindexes everything
+        # it wrote in one pass instead.
+        signal_processor = apps.get_app_config('haystack').signal_processor
+        signal_processor.teardown()
+        try:
+            with open(csv_path, 'rb') as file:
+                summary = import_csv(file, chunk_size=options['batch_size'],
+                                     progress=progress, mode=options['mode'])
+        except IngestError as e:
+            raise CommandError(str(e))
+        except SolrError as e:
+            raise CommandError(f"Rows were imported but reindexing failed: {e}. "
+                               f"Run `manage.py reindex_activities` to retry.")
+        finally:
+            signal_processor.setup()
+
+        if progress_end == '\r':
+            self.stdout.write('')
+        for message in summary['invalid_rows'][:20]:
+            self.stdout.write(self.style.WARNING(f"  {message}"))
+        if len(summary['invalid_rows']) > 20:
+            self.stdout.write(self.style.WARNING(
+                f"  ... and {len(summary['invalid_rows']) - 20} more invalid values"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['total_rows']} rows in {time.monotonic() - started:.1f}s: "
+            f"{summary['imported']} inserted, {summary['updated']} updated, "
+            f"{summary['unchanged']} unchanged, {summary['skipped']} skipped, "
+            f"{summary['indexed']} indexed."
+        ))
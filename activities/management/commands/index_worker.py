@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections as db_connections
+
+from activities.models import IndexOutboxEntry
+from activities.outbox import drain_batch
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain the search index outbox into Solr. Runs until interrupted "
+        "(or until the outbox is empty with --once)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Number of worker threads draining in parallel.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Outbox entries claimed per batch.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the outbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no entries are due instead of polling.')
+        parser.add_argument('--stats', action='store_true',
+                            help='Print queue depth and lag, then exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = IndexOutboxEntry.objects.stats()
+            self.stdout.write(
+                f"depth={stats['depth']} failing={stats['failing']} "
+                f"lag={stats['lag_seconds']:.1f}s oldest={stats['oldest_created_at']}"
+            )
+            return
+
+        stop = threading.Event()
+        processed = []
+
+        def work():
+            total = 0
+            try:
+                while not stop.is_set():
+                    try:
+                        count = drain_batch(options['batch_size'])
+                    except Exception:
+                        # Database hiccups must not kill the worker; retry after a pause
+                        log.exception("Index outbox batch failed")
+                        db_connections.close_all()
+                        stop.wait(options['poll_interval'])
+                        continue
+                    total += count
+                    if count == 0:
+                        if options['once']:
+                            break
+                        stop.wait(options['poll_interval'])
+            finally:
+                processed.append(total)
+                # Each thread owns its database connection
+                db_connections.close_all()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = [executor.submit(work) for _ in range(options['workers'])]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                stop.set()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {sum(processed)} outbox entries in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from activities.counts import rebuild_counts
+from activities.models import Activity, ActivityCount
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the pre-aggregated ActivityCount table from the Activity table. "
+        "Counts are normally kept current incrementally; run this after raw SQL changes "
+        "or to repair drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Buckets inserted per query.')
+
+    def handle(self, *args, **options):
+        buckets = rebuild_counts(Activity, ActivityCount, batch_size=options['batch_size'])
+        total = Activity.objects.count()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} count buckets for {total} activities."))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from haystack import connections
+from pysolr import SolrError
+
+from activities.cache import bump_index_generation
+from activities.indexing import reindex_queryset
+from activities.models import Activity
+
+# Fields added to the Solr schema after the core was first created.
+# Mirrors schema.xml for cores that use a managed schema.
+SCHEMA_FIELDS = [
+    {'name': 'url_exact', 'type': 'string', 'indexed': True, 'stored': True, 'multiValued': False},
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Reindex every Activity into Solr in batches. "
+        "Use --ensure-schema first to add fields introduced since the core was created "
+        "(e.g. url_exact) through the Solr Schema API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of activities sent to Solr per update request.')
+        parser.add_argument('--ensure-schema', action='store_true',
+                            help='Add missing fields to a managed Solr schema before reindexing.')
+        parser.add_argument('--using', default='default',
+                            help='Haystack connection alias.')
+
+    def handle(self, *args, **options):
+        backend = connections[options['using']].get_backend()
+
+        if options['ensure_schema']:
+            self.ensure_schema(backend.conn)
+
+        total = 0
+
+        def progress(count):
+            nonlocal total
+            total = count
+            self.stdout.write(f"Indexed {total} activities...")
+
+        try:
+            total = reindex_queryset(Activity.objects.all(), batch_size=options['batch_size'],
+                                     using=options['using'], progress=progress)
+        except SolrError as e:
+            raise CommandError(f"Reindex failed after {total} activities: {e}")
+
+        bump_index_generation()
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {total} activities."))
+
+    def ensure_schema(self, conn):
+        session = conn.get_session()
+        for field in SCHEMA_FIELDS:
+            url = f"{conn.url.rstrip('/')}/schema/fields/{field['name']}"
+            resp = session.get(url, timeout=conn.timeout)
+            if resp.status_code == 200:
+                self.stdout.write(f"Schema field '{field['name']}' already exists.")
+                continue
+
+            resp = session.post(f"{conn.url.rstrip('/')}/schema", json={'add-field': field},
+                                timeout=conn.timeout)
+            if resp.status_code != 200:
+                raise CommandError(f"Could not add schema field '{field['name']}': {resp.text}")
+            self.stdout.write(self.style.SUCCESS(f"Added schema field '{field['name']}'."))
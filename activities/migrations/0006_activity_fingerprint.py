@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:00
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def _normalize(value):
+    return ' '.join((value or '').split()).casefold()
+
+
+def activity_fingerprint(start_date, country, activity, objective):
+    """
+    activities.models.activity_fingerprint as of this migration; a copy, so
+    later changes to the app code do not change what this migration writes.
+    """
+    parts = [start_date.isoformat() if start_date else '']
+    parts += [_normalize(value) for value in (country, activity, objective)]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    """
+    Fingerprint existing activities. Rows duplicating an earlier one keep a
+    NULL fingerprint so the unique index can be built; they can be reviewed
+    and removed afterwards.
+    """
+    Activity = apps.get_model('activities', 'Activity')
+    seen = set()
+    batch = []
+    for activity in Activity.objects.order_by('id').iterator(chunk_size=1000):
+        fingerprint = activity_fingerprint(activity.start_date, activity.country,
+                                           activity.activity, activity.objective)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        activity.fingerprint = fingerprint
+        batch.append(activity)
+        if len(batch) >= 1000:
+            Activity.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    if batch:
+        Activity.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='rows_unchanged',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='rows_updated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:04
+
+from django.db import migrations, models
+
+from activities.counts import rebuild_counts
+
+
+def build_counts(apps, schema_editor):
+    rebuild_counts(apps.get_model('activities', 'Activity'),
+                   apps.get_model('activities', 'ActivityCount'),
+                   using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0007_activity_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('country', models.CharField(max_length=100)),
+                ('region', models.CharField(max_length=50)),
+                ('thematic', models.CharField(max_length=500)),
+                ('directorate', models.CharField(max_length=500)),
+                ('year', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['year'], name='activitycount_year_idx')],
+            },
+        ),
+        migrations.RunPython(build_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 21:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0010_indexgeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='file_path',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
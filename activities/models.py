@@ -1,4 +1,24 @@
+import hashlib
+import uuid
+
 from django.db import models
+from django.utils import timezone
+
+from .counts import activity_dimensions
+
+def _normalize(value):
+    return ' '.join((value or '').split()).casefold()
+
+def activity_fingerprint(start_date, country, activity, objective):
+    """
+    Content key identifying an activity across uploads: sha256 of the
+    normalized (whitespace-collapsed, case-folded) start date, country,
+    activity and objective.
+    """
+    parts = [start_date.isoformat() if start_date else '']
+    parts += [_normalize(value) for value in (country, activity, objective)]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
 
 class Activity(models.Model):
     start_date = models.DateField(null=True, blank=True)
@@ -10,6 +30,165 @@ class Activity(models.Model):
     thematic = models.CharField(max_length=500)
     directorate = models.CharField(max_length=500)
     url = models.CharField(max_length=500, null=True, blank=True)
+    # NULL only for rows that duplicated an earlier one when fingerprints were introduced
+    fingerprint = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # Row version for conditional GETs; also set by bulk upserts
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Serve the database dashboard engine; each key stays within InnoDB's
+        # 3072-byte limit under utf8mb4 (4 bytes per character)
+        indexes = [
+            models.Index(fields=['country', 'thematic'], name='activity_country_thematic_idx'),
+            models.Index(fields=['region', 'country'], name='activity_region_country_idx'),
+            models.Index(fields=['thematic'], name='activity_thematic_idx'),
+            models.Index(fields=['directorate'], name='activity_directorate_idx'),
+            models.Index(fields=['start_date'], name='activity_start_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the ActivityCount bucket as loaded, so a save that moves
+        # the row to another bucket can decrement the old one
+        if not instance.get_deferred_fields() & {'start_date', 'country', 'region', 'thematic', 'directorate'}:
+            instance._loaded_dimensions = activity_dimensions(instance)
+        return instance
+
+    def compute_fingerprint(self):
+        return activity_fingerprint(self.start_date, self.country, self.activity, self.objective)
+
+    def save(self, *args, **kwargs):
+        fingerprint = self.compute_fingerprint()
+        if self.fingerprint is None and self.pk is not None:
+            # A row that duplicated an earlier one when fingerprints were
+            # introduced stays without one while that row has it
+            if Activity.objects.filter(fingerprint=fingerprint).exclude(pk=self.pk).exists():
+                fingerprint = None
+        self.fingerprint = fingerprint
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'fingerprint' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['fingerprint']
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.country} - {self.activity}"
+
+
+class ActivityCount(models.Model):
+    """
+    Number of activities per country, region, thematic, directorate and
+    start year, maintained incrementally (see activities/counts.py).
+    """
+    key = models.CharField(max_length=40, unique=True)  # counts.bucket_key() of the dimensions
+    country = models.CharField(max_length=100)
+    region = models.CharField(max_length=50)
+    thematic = models.CharField(max_length=500)
+    directorate = models.CharField(max_length=500)
+    year = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Signed so that a decrement against a drifted bucket cannot fail the write
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['year'], name='activitycount_year_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.country} / {self.thematic} / {self.year}: {self.count}"
+
+
+class IndexOutboxQuerySet(models.QuerySet):
+    def due(self):
+        return self.filter(available_at__lte=timezone.now())
+
+    def stats(self):
+        """
+        Queue depth and lag (age of the oldest pending entry) for monitoring.
+        """
+        summary = self.aggregate(depth=models.Count('id'), oldest=models.Min('created_at'))
+        oldest = summary['oldest']
+        return {
+            'depth': summary['depth'],
+            'failing': self.filter(attempts__gt=0).count(),
+            'oldest_created_at': oldest,
+            'lag_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+        }
+
+
+class IndexOutboxEntry(models.Model):
+    """
+    A pending search index change, written in the same transaction as the
+    model change and drained by `manage.py index_worker`.
+    """
+    model = models.CharField(max_length=100)  # Model._meta.label_lower
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    available_at = models.DateTimeField(default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    objects = IndexOutboxQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id}"
+
+
+class IndexGeneration(models.Model):
+    """
+    Single row counting changes to the indexed data. Shared through the
+    database so that a bump made by any process (e.g. `manage.py
+    index_worker`) invalidates the result caches of every web process
+    (see activities/cache.py).
+    """
+    generation = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"generation {self.generation}"
+
+
+class UploadJob(models.Model):
+    """
+    A CSV bulk upload processed in the background (see activities/jobs.py).
+    Counters are final once the job has succeeded or failed; while it runs,
+    live counters are published through the Django cache.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    encoding = models.CharField(max_length=50, blank=True)
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_inserted = models.PositiveIntegerField(default=0)
+    rows_updated = models.PositiveIntegerField(default=0)
+    rows_unchanged = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    rows_invalid = models.PositiveIntegerField(default=0)
+    rows_indexed = models.PositiveIntegerField(default=0)
+    invalid_rows = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    # Process importing the job (jobs.worker_id()) and the stored upload it reads
+    worker = models.CharField(max_length=255, blank=True)
+    file_path = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def elapsed_seconds(self):
+        if not self.started_at:
+            return 0.0
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
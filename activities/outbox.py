@@ -0,0 +1,69 @@
+"""
+Durable, asynchronous indexing through a database outbox.
+
+OutboxSignalProcessor writes an IndexOutboxEntry in the same transaction as
+every save/delete of an indexed model, so the write path never waits on Solr
+and a crash cannot lose an index update. `manage.py index_worker` drains the
+outbox in batches, coalescing entries for the same row, and retries failed
+batches with exponential backoff.
+"""
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+
+from .indexing import index_changed, sync_documents
+from .models import IndexOutboxEntry
+
+log = logging.getLogger(__name__)
+
+# Retry delays grow as BACKOFF_BASE * 2 ** (attempts - 1), capped at BACKOFF_MAX
+BACKOFF_BASE = timedelta(seconds=5)
+BACKOFF_MAX = timedelta(minutes=10)
+
+def enqueue(model, pk):
+    IndexOutboxEntry.objects.create(model=model._meta.label_lower, object_id=pk)
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+def drain_batch(batch_size=500, using='default'):
+    """
+    Claim up to batch_size due entries, sync them to the index and delete
+    them. Entries locked by another worker are skipped. On failure the
+    entries stay queued with their retry pushed back.
+
+    Returns the number of entries processed successfully.
+    """
+    with transaction.atomic():
+        entries = list(
+            IndexOutboxEntry.objects.due()
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        if not entries:
+            return 0
+
+        pks_by_model = {}
+        for entry in entries:
+            pks_by_model.setdefault(entry.model, set()).add(entry.object_id)
+
+        try:
+            for label, pks in pks_by_model.items():
+                sync_documents(apps.get_model(label), pks, using=using)
+        except Exception as e:
+            log.exception("Failed to sync %d outbox entries", len(entries))
+            now = timezone.now()
+            for entry in entries:
+                entry.attempts += 1
+                entry.available_at = now + backoff(entry.attempts)
+                entry.last_error = str(e)[:2000]
+            IndexOutboxEntry.objects.bulk_update(entries, ['attempts', 'available_at', 'last_error'])
+            return 0
+
+        IndexOutboxEntry.objects.filter(id__in=[entry.id for entry in entries]).delete()
+
+    index_changed()
+    return len(entries)
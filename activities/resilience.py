@@ -0,0 +1,309 @@
+"""
+Fail-fast and stale fallbacks for the Solr-backed views.
+
+A CircuitBreaker per Haystack connection sits in front of every Solr request
+(see activities/solr_backend.py). After FAILURE_THRESHOLD consecutive
+failures it opens and requests fail immediately with CircuitOpenError
+instead of waiting out the HTTP timeout; RESET_TIMEOUT seconds later a
+single probe request is let through, and its outcome closes or reopens the
+circuit. Solr answering with a 4xx (a bad query, see SolrResponseError)
+counts as Solr being up.
+
+serve() keeps the last good result of each (endpoint, filters) pair in a
+store that outlives index generation bumps. When Solr fails it returns that
+result, marked stale, and schedules one background refresh of it, which
+doubles as the recovery probe. serve_page() does the same for list pages,
+which are not cached, with a small store of their own so that they never
+evict the dashboard results.
+
+With ACTIVITIES_DASHBOARD_ENGINE = 'auto' the database answers first: the
+engine falls back to it when Solr fails (at once while the circuit is
+open), so its results are current and the stale store is only used when
+the database fails too. With 'solr' the stale store answers every Solr
+failure. List pages have no database fallback.
+
+Configure both with ACTIVITIES_SOLR_RESILIENCE in settings:
+
+    ACTIVITIES_SOLR_RESILIENCE = {
+        'FAILURE_THRESHOLD': 5,   # consecutive failures that open the circuit
+        'RESET_TIMEOUT': 30,      # seconds before a probe is let through
+        'STALE_TIMEOUT': 86400,   # seconds a last good result is kept
+        'PAGE_STALE_MAX_ENTRIES': 256,  # last good list pages kept per process
+    }
+
+The stale store uses the same backend as ACTIVITIES_RESULT_CACHE ('local' or
+'shared'); the page store and the circuit state are per process.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+from pysolr import SolrError
+
+from . import cache
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 30,
+    'STALE_TIMEOUT': 24 * 3600,
+    'PAGE_STALE_MAX_ENTRIES': 256,
+}
+
+# Warning header of responses served from the stale store (RFC 7234)
+STALE_WARNING = '110 - "Response is Stale"'
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'ACTIVITIES_SOLR_RESILIENCE', {})}
+
+
+class CircuitOpenError(SolrError):
+    """
+    Raised instead of sending a request while the circuit is open. A
+    SolrError, so existing handlers (503 responses, the 'auto' engine's
+    database fallback) treat it like an unreachable Solr.
+    """
+
+
+class SolrResponseError(SolrError):
+    """
+    Solr answered with an HTTP error status, available as status_code.
+    Raised by the managed pysolr connection and the async client instead
+    of a bare SolrError, so callers can tell a rejected request (4xx) from
+    a failing Solr without reading the message.
+    """
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_client_error(error):
+    """
+    Whether Solr rejected the request (HTTP 4xx) rather than failed.
+    """
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and 400 <= status_code < 500
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError unless a request may be sent now.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let this request through as the only probe
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError("Solr circuit is open after %d failures; not sending the request."
+                                   % self.failures)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                log.info("Solr is answering again, closing the circuit")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    log.warning("Opening the Solr circuit after %d failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_error(self, error):
+        """
+        Record a failed request: client errors mean Solr is up.
+        """
+        if is_client_error(error):
+            self.record_success()
+        else:
+            self.record_failure()
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(alias='default'):
+    with _breakers_lock:
+        breaker = _breakers.get(alias)
+        if breaker is None:
+            options = get_options()
+            breaker = _breakers[alias] = CircuitBreaker(options['FAILURE_THRESHOLD'],
+                                                        options['RESET_TIMEOUT'])
+        return breaker
+
+
+class StaleStore(cache.ResultCache):
+    """
+    Last good result per (namespace, filters), kept across generation bumps.
+    """
+
+    def get(self, namespace, filters):
+        return self.backend.get(self.make_key(namespace, filters, 'last-good'))
+
+    def set(self, namespace, filters, result):
+        self.backend.set(self.make_key(namespace, filters, 'last-good'), result)
+
+_stale_store = None
+_stale_store_lock = threading.Lock()
+
+def get_stale_store():
+    global _stale_store
+    with _stale_store_lock:
+        if _stale_store is None:
+            options = {**cache.DEFAULTS, **getattr(settings, 'ACTIVITIES_RESULT_CACHE', {})}
+            options['TIMEOUT'] = get_options()['STALE_TIMEOUT']
+            backend_cls = cache.BACKENDS.get(options['BACKEND']) or import_string(options['BACKEND'])
+            _stale_store = StaleStore(backend_cls(options), options['KEY_PREFIX'])
+        return _stale_store
+
+_page_stale_store = None
+
+def get_page_stale_store():
+    """
+    The last good list pages, in a process-local LRU of their own: page and
+    cursor keys rarely repeat, so they would evict the dashboard results.
+    """
+    global _page_stale_store
+    with _stale_store_lock:
+        if _page_stale_store is None:
+            options = get_options()
+            backend = cache.LocalMemoryBackend({
+                **cache.DEFAULTS,
+                'MAX_ENTRIES': options['PAGE_STALE_MAX_ENTRIES'],
+                'TIMEOUT': options['STALE_TIMEOUT'],
+            })
+            _page_stale_store = StaleStore(backend, 'activities:pages')
+        return _page_stale_store
+
+_refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stale-refresh')
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def _refresh(namespace, filters, compute):
+    try:
+        cache.get_result_cache().get_or_compute(namespace, filters, compute)
+    except SolrError as e:
+        log.info("Background refresh of %s failed: %s", namespace, e)
+    except Exception:
+        log.exception("Background refresh of %s failed", namespace)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(get_stale_store().make_key(namespace, filters, 'refresh'))
+        connection.close()
+
+def refresh_in_background(namespace, filters, compute):
+    """
+    Recompute a result off the request thread, at most once at a time per
+    (namespace, filters).
+    """
+    key = get_stale_store().make_key(namespace, filters, 'refresh')
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresher.submit(_refresh, namespace, filters, compute)
+
+def serve(namespace, filters, compute):
+    """
+    Return (result, stale): the result of compute() through the result
+    cache, or, when Solr fails, the last good result with stale=True while
+    a background refresh runs. Raises the SolrError when there is no last
+    good result.
+    """
+    store = get_stale_store()
+
+    def compute_and_keep():
+        result = compute()
+        if result is not None:
+            store.set(namespace, filters, result)
+        return result
+
+    try:
+        return cache.get_result_cache().get_or_compute(namespace, filters, compute_and_keep), False
+    except SolrError:
+        result = store.get(namespace, filters)
+        if result is None:
+            raise
+        refresh_in_background(namespace, filters, compute_and_keep)
+        return result, True
+
+async def aserve(namespace, filters, compute):
+    """
+    serve() for a coroutine function compute. Cache reads and writes run in
+    a thread, since the shared backend does network I/O.
+    """
+    result_cache = cache.get_result_cache()
+    store = get_stale_store()
+
+    def lookup():
+        key = result_cache.make_key(namespace, filters, result_cache.generation())
+        return key, result_cache.backend.get(key)
+
+    def keep(key, result):
+        result_cache.backend.set(key, result)
+        store.set(namespace, filters, result)
+
+    key, result = await sync_to_async(lookup, thread_sensitive=False)()
+    if result is not None:
+        return result, False
+    try:
+        result = await compute()
+    except SolrError:
+        result = await sync_to_async(store.get, thread_sensitive=False)(namespace, filters)
+        if result is None:
+            raise
+
+        def refresh():
+            fresh = async_to_sync(compute)()
+            if fresh is not None:
+                store.set(namespace, filters, fresh)
+            return fresh
+
+        refresh_in_background(namespace, filters, refresh)
+        return result, True
+    if result is not None:
+        await sync_to_async(keep, thread_sensitive=False)(key, result)
+    return result, False
+
+def serve_page(namespace, filters, compute):
+    """
+    Return (result, stale) for a list page: the result of compute(), never
+    cached, or, when Solr fails, the last good result of the same page with
+    stale=True. There is no background refresh, the next request for the
+    page asks Solr again. Requests Solr rejects (4xx) are not answered.
+    """
+    store = get_page_stale_store()
+    try:
+        result = compute()
+    except SolrError as e:
+        result = None if is_client_error(e) else store.get(namespace, filters)
+        if result is None:
+            raise
+        return result, True
+    store.set(namespace, filters, result)
+    return result, False
@@ -11,7 +11,8 @@ class ActivityIndex(indexes.SearchIndex, indexes.Indexable):
     objective = indexes.CharField(model_attr='objective', faceted=True)
     thematic = indexes.CharField(model_attr='thematic', faceted=True)
     directorate = indexes.CharField(model_attr='directorate', faceted=True)
-    url = indexes.CharField(model_attr='url', null=True)
+    # faceted=True adds the stored, non-tokenized url_exact field served by the list views
+    url = indexes.CharField(model_attr='url', null=True, faceted=True)
     db_id = indexes.IntegerField(model_attr='id', null=True)
     
     def get_model(self):
@@ -1,8 +1,43 @@
 from rest_framework import serializers
-from .models import Activity
+from .models import Activity, UploadJob, activity_fingerprint
 
 class ActivitySerializer(serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = '__all__'
         read_only_fields = ('id',)
+
+    def validate(self, attrs):
+        # Reject edits that would make the row identical to another activity
+        def value(field):
+            if field in attrs:
+                return attrs[field]
+            return getattr(self.instance, field, None)
+
+        fingerprint = activity_fingerprint(value('start_date'), value('country'),
+                                           value('activity'), value('objective'))
+        if self.instance is not None and fingerprint == self.instance.compute_fingerprint():
+            # Same content key as before, including rows that duplicated
+            # another when fingerprints were introduced
+            return attrs
+        duplicates = Activity.objects.filter(fingerprint=fingerprint)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("An activity with the same start date, country, "
+                                              "activity and objective already exists.")
+        return attrs
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    elapsed_seconds = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = (
+            'id', 'file_name', 'status', 'encoding',
+            'rows_parsed', 'rows_inserted', 'rows_updated', 'rows_unchanged',
+            'rows_skipped', 'rows_invalid', 'rows_indexed',
+            'invalid_rows', 'error', 'created_at', 'started_at', 'finished_at', 'elapsed_seconds',
+        )
+        read_only_fields = fields
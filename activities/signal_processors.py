@@ -0,0 +1,121 @@
+import logging
+import threading
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+from pysolr import SolrError
+
+from .indexing import index_changed, sync_documents
+from .models import IndexOutboxEntry
+from .outbox import enqueue
+
+log = logging.getLogger(__name__)
+
+
+class BatchedSignalProcessor(BaseSignalProcessor):
+    """
+    Haystack signal processor that coalesces index updates per transaction.
+
+    Saves and deletes of indexed models only record the primary key. When the
+    surrounding transaction commits (immediately in autocommit mode) every
+    recorded key is synced in one batched add/delete per model, made visible
+    through commitWithin. Repeated saves of the same row cost one document.
+
+    Keys are buffered per thread and database alias. A rolled-back
+    transaction drops its flush hook but may leave keys behind; they are
+    flushed with the next commit, which is harmless because sync_documents
+    reads the committed state back from the database.
+    """
+
+    def __init__(self, connections, connection_router):
+        self._local = threading.local()
+        super().__init__(connections, connection_router)
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def handle_save(self, sender, instance, **kwargs):
+        self.record(sender, instance, kwargs.get('using') or DEFAULT_DB_ALIAS)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        self.record(sender, instance, kwargs.get('using') or DEFAULT_DB_ALIAS)
+
+    def record(self, sender, instance, db):
+        """
+        Remember instance's primary key and make sure the batch for db is
+        flushed when the current transaction commits.
+        """
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+            except NotHandled:
+                continue
+
+            pending = self._pending(db)
+            pending.setdefault((using, sender), set()).add(instance.pk)
+            # Every write registers the hook so that it survives savepoint
+            # rollbacks; the first one to run flushes the whole batch and the
+            # others find nothing left to do.
+            transaction.on_commit(partial(self.flush, db), using=db)
+
+    def _pending(self, db):
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = {}
+        return self._local.pending.setdefault(db, {})
+
+    def flush(self, db=DEFAULT_DB_ALIAS):
+        pending = getattr(self._local, 'pending', {}).pop(db, None)
+        if not pending:
+            return
+
+        for (using, model), pks in pending.items():
+            try:
+                sync_documents(model, pks, using=using)
+            except (IOError, SolrError):
+                if not self.connections[using].get_backend().silently_fail:
+                    raise
+                log.exception("Failed to sync %d %s documents to the search index",
+                              len(pks), model._meta.label)
+
+        index_changed()
+
+
+class OutboxSignalProcessor(BaseSignalProcessor):
+    """
+    Haystack signal processor that only records index changes in the
+    IndexOutboxEntry table, inside the writing transaction. Solr is updated
+    asynchronously by `manage.py index_worker`.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def handle_save(self, sender, instance, **kwargs):
+        self.record(sender, instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        self.record(sender, instance)
+
+    def record(self, sender, instance):
+        if sender is IndexOutboxEntry:
+            return
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+            except NotHandled:
+                continue
+            enqueue(sender, instance.pk)
+            # One entry per row is enough whatever the number of connections
+            return
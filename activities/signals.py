@@ -1,16 +1,49 @@
-from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from haystack import connections
+
+from .cache import bump_index_generation
+from .counts import activity_dimensions, apply_deltas, dimensions
 from .models import Activity
 
+# Search index updates are handled by the Haystack signal processor
+# (HAYSTACK_SIGNAL_PROCESSOR), which also invalidates cached results and
+# ETags once Solr has the change. These receivers keep ActivityCount current
+# and, when the dashboard reads the database, invalidate on commit: bumping
+# then for a Solr-backed dashboard would only cache the old Solr results
+# under the new generation.
+DATABASE_ENGINES = ('database', 'summary')
+
+def invalidate_on_commit(using):
+    if getattr(settings, 'ACTIVITIES_DASHBOARD_ENGINE', 'auto') in DATABASE_ENGINES:
+        transaction.on_commit(bump_index_generation, using=using)
+
+@receiver(pre_save, sender=Activity)
+def load_activity_dimensions(sender, instance, using=None, **kwargs):
+    # Instances not loaded from the database (e.g. built with an existing pk)
+    # need their stored bucket looked up before it is overwritten
+    if instance.pk is None or hasattr(instance, '_loaded_dimensions'):
+        return
+    stored = (sender.objects.using(using).filter(pk=instance.pk)
+              .values_list('start_date', 'country', 'region', 'thematic', 'directorate').first())
+    if stored is not None:
+        instance._loaded_dimensions = dimensions(*stored)
+
 @receiver(post_save, sender=Activity)
-def update_activity_index(sender, instance, **kwargs):
-    # Update or create document in Solr
-    backend = connections['default'].get_backend()
-    backend.update(sender, [instance])
+def count_saved_activity(sender, instance, created, using=None, **kwargs):
+    dims = activity_dimensions(instance)
+    if created:
+        apply_deltas({dims: 1}, using=using)
+    else:
+        old = getattr(instance, '_loaded_dimensions', None)
+        if old is not None and old != dims:
+            apply_deltas({old: -1, dims: 1}, using=using)
+    instance._loaded_dimensions = dims
+    invalidate_on_commit(using)
 
 @receiver(post_delete, sender=Activity)
-def delete_activity_index(sender, instance, **kwargs):
-    # Remove document from Solr
-    backend = connections['default'].get_backend()
-    backend.remove("activities.activity.%s" % instance.pk)
+def count_deleted_activity(sender, instance, using=None, **kwargs):
+    dims = getattr(instance, '_loaded_dimensions', None) or activity_dimensions(instance)
+    apply_deltas({dims: -1}, using=using)
+    invalidate_on_commit(using)
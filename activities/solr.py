@@ -0,0 +1,336 @@
+"""
+Direct Solr queries for the dashboard features Haystack's SearchQuerySet
+cannot express (pivot and range facets, cursorMark paging). They reuse the pysolr connection
+of the Haystack backend, so the URL and timeouts stay configured in
+HAYSTACK_CONNECTIONS.
+"""
+import re
+from datetime import date
+
+from haystack import connections
+from haystack.constants import DJANGO_CT
+from haystack.utils import get_model_ct
+
+from .models import Activity
+
+# Dashboard filter name -> exact (non-tokenized) Solr field. The filter name
+# is also the tag of its fq, which facets on the field exclude.
+FILTER_FIELDS = {
+    'countries': 'country_exact_str',
+    'regions': 'region_exact_str',
+    'thematics': 'thematic_exact_str',
+    'directorates': 'directorate_exact_str',
+}
+FIELD_TAGS = {field: name for name, field in FILTER_FIELDS.items()}
+
+# Tag of the start_date window fq
+DATE_TAG = 'dates'
+
+# Supported time-series bucket sizes -> Solr date math gap
+RANGE_GAPS = {
+    'year': '+1YEAR',
+    'quarter': '+3MONTHS',
+    'month': '+1MONTH',
+}
+
+# Stable sort for cursorMark paging; Solr requires the uniqueKey as tie-breaker
+CURSOR_SORT = 'start_date desc,id asc'
+
+# cursorMark values: '*' to start, then the base64 strings Solr hands out
+CURSOR_RE = re.compile(r'^(\*|[A-Za-z0-9+/_-]+={0,2})$')
+
+# Open sides of a range facet's window start at DEFAULT_RANGE_FROM and end
+# with the current year; only when matching documents fall outside it
+# (facet.range.other) is the window read from the data
+DEFAULT_RANGE_FROM = '1960-01-01'
+
+# Values returned per facet.field (Solr's default, made explicit so the
+# database engine can match it)
+FACET_LIMIT = 100
+
+def quote(value):
+    """
+    Quote a value as a Solr phrase so multi-word values match exactly.
+    """
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+def date_range_query(field, date_from=None, date_to=None):
+    """
+    Build an inclusive day-granularity range query on a date field.
+    """
+    lower = '%sT00:00:00Z' % date_from if date_from else '*'
+    if date_to:
+        return '%s:[%s TO %sT00:00:00Z+1DAY}' % (field, lower, date_to)
+    return '%s:[%s TO *]' % (field, lower)
+
+def terms_query(tag, field, values):
+    """
+    Match any of values exactly, as a tagged fq. The terms parser skips
+    scoring and gets its own filterCache entry; values containing its ','
+    separator fall back to an OR of phrases.
+    """
+    if any(',' in value for value in values):
+        return '{!tag=%s}%s:(%s)' % (tag, field, ' OR '.join(quote(value) for value in values))
+    return '{!terms tag=%s f=%s}%s' % (tag, field, ','.join(values))
+
+def filter_queries(filters, restrict_to_model=True):
+    """
+    Build the fq list for the normalized dashboard filters: one tagged fq
+    per dimension plus one for the date window. Keeping them separate lets
+    Solr cache and reuse each one across filter combinations. By default
+    the list also restricts results to Activity documents like Haystack's
+    own queries; pass restrict_to_model=False when Haystack adds that itself.
+    """
+    fq = []
+    if restrict_to_model:
+        fq.append('%s:(%s)' % (DJANGO_CT, get_model_ct(Activity)))
+    for name, field in FILTER_FIELDS.items():
+        if name in filters:
+            fq.append(terms_query(name, field, filters[name]))
+    if 'date_from' in filters or 'date_to' in filters:
+        fq.append('{!tag=%s}%s' % (DATE_TAG, date_range_query(
+            'start_date', filters.get('date_from'), filters.get('date_to'))))
+    return fq
+
+def exclude_own_filter(field):
+    """
+    facet.field value that counts field ignoring its own filter, so a
+    multi-select facet keeps listing the values not currently selected.
+    """
+    tag = FIELD_TAGS.get(field)
+    return '{!ex=%s}%s' % (tag, field) if tag else field
+
+def get_connection(using='default'):
+    return connections[using].get_backend().conn
+
+def search(filters, q='*:*', using='default', **params):
+    """
+    Run a select request with the dashboard filters applied and return the
+    pysolr Results.
+    """
+    return get_connection(using).search(q, fq=filter_queries(filters), **params)
+
+def pivot_params(fields):
+    return {
+        'rows': 0,
+        'facet': 'true',
+        'facet.pivot': ','.join(fields),
+        'facet.limit': -1,
+        'facet.mincount': 1,
+    }
+
+def parse_pivot(facets, fields):
+    return facets.get('facet_pivot', {}).get(','.join(fields), [])
+
+def pivot_counts(filters, fields, using='default'):
+    """
+    Return the facet.pivot tree over fields (e.g. country then thematic) as
+    Solr computes it: [{'value': ..., 'count': ..., 'pivot': [...]}, ...].
+    No documents are fetched.
+    """
+    results = search(filters, using=using, **pivot_params(fields))
+    return parse_pivot(results.facets, fields)
+
+def _range_start(date_from, gap):
+    """
+    Align a YYYY-MM-DD window start to the first day of its bucket so that
+    quarter/month buckets line up with calendar boundaries.
+    """
+    day = date.fromisoformat(date_from)
+    if gap == 'year':
+        day = day.replace(month=1, day=1)
+    elif gap == 'quarter':
+        day = day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    else:
+        day = day.replace(day=1)
+    return '%sT00:00:00Z' % day.isoformat()
+
+def stats_params(field):
+    return {'rows': 0, 'stats': 'true', 'stats.field': '{!min=true max=true}%s' % field}
+
+def parse_date_bounds(stats, field):
+    """
+    The (min, max) of a date field from a stats response as YYYY-MM-DD
+    strings, (None, None) when no document has a value.
+    """
+    field_stats = stats.get('stats_fields', {}).get(field) or {}
+    low, high = field_stats.get('min'), field_stats.get('max')
+    return (low[:10], high[:10]) if low and high else (None, None)
+
+def date_bounds(filters, field='start_date', using='default'):
+    """
+    The first and last value of a date field among the documents matching
+    the filters, see parse_date_bounds().
+    """
+    results = search(filters, using=using, **stats_params(field))
+    return parse_date_bounds(results.stats, field)
+
+def range_window(filters, bounds=None):
+    """
+    The (date_from, date_to) a range facet covers: the request's date
+    window, its open sides taken from bounds (the first and last dates of
+    the matching documents, see date_bounds()) or, without bounds, from the
+    default window.
+    """
+    if bounds is None:
+        bounds = (DEFAULT_RANGE_FROM, date(date.today().year, 12, 31).isoformat())
+    date_from = filters.get('date_from') or bounds[0]
+    date_to = filters.get('date_to') or bounds[1]
+    if not (date_from and date_to):
+        # No matching document has a date, so any window gives no buckets
+        date_from = date_to = date_from or date_to or date.today().isoformat()
+    if date_from > date_to:
+        # A default side falls beyond the request's own: keep the latter
+        if 'date_from' in filters:
+            date_to = date_from
+        else:
+            date_from = date_to
+    return date_from, date_to
+
+def range_params(field, gap, date_from, date_to, other=False):
+    """
+    Solr params for a facet.range over a date field with one of RANGE_GAPS,
+    from date_from to date_to inclusive. Only non-empty buckets are returned.
+    With other, the counts before and after the window are returned too.
+    """
+    params = {
+        'facet.range': field,
+        'f.%s.facet.range.start' % field: _range_start(date_from, gap),
+        'f.%s.facet.range.end' % field: '%sT00:00:00Z+1DAY' % date_to,
+        'f.%s.facet.range.gap' % field: RANGE_GAPS[gap],
+        'f.%s.facet.mincount' % field: 1,
+    }
+    if other:
+        params['f.%s.facet.range.other' % field] = ['before', 'after']
+    return params
+
+def outside_window(facets, range_field):
+    """
+    Whether matching documents fell before or after the window of the range
+    facet, as counted by facet.range.other.
+    """
+    ranges = facets.get('facet_ranges', {}).get(range_field, {})
+    return bool(ranges.get('before') or ranges.get('after'))
+
+def period_label(bucket, gap):
+    """
+    Turn a range bucket start ('2021-04-01T00:00:00Z') into '2021', '2021-Q2'
+    or '2021-04' depending on the gap.
+    """
+    year, month = bucket[:4], int(bucket[5:7])
+    if gap == 'year':
+        return year
+    if gap == 'quarter':
+        return '%s-Q%d' % (year, (month - 1) // 3 + 1)
+    return '%s-%02d' % (year, month)
+
+def facet_params(filters, fields=(), range_field=None, gap='year', bounds=None):
+    """
+    Params of a facet request. Without bounds, a range facet covers the
+    default window and counts the documents outside it.
+    """
+    params = {'rows': 0, 'facet': 'true', 'facet.mincount': 1, 'facet.limit': FACET_LIMIT}
+    if fields:
+        params['facet.field'] = [exclude_own_filter(field) for field in fields]
+    if range_field:
+        open_window = bounds is None and not ('date_from' in filters and 'date_to' in filters)
+        params.update(range_params(range_field, gap, *range_window(filters, bounds), other=open_window))
+    return params
+
+def parse_facet_counts(facets, range_field=None, gap='year'):
+    facet_fields = facets.get('facet_fields', {})
+    facet_data = {
+        'fields': {
+            # Solr's JSON facet format is a flat [value, count, value, count, ...] list
+            field: list(zip(counts[::2], counts[1::2]))
+            for field, counts in facet_fields.items()
+        },
+        'ranges': {},
+    }
+    if range_field:
+        counts = facets.get('facet_ranges', {}).get(range_field, {}).get('counts', [])
+        facet_data['ranges'][range_field] = [
+            (period_label(bucket, gap), count)
+            for bucket, count in zip(counts[::2], counts[1::2])
+            if count
+        ]
+    return facet_data
+
+def facet_counts(filters, fields=(), range_field=None, gap='year', using='default'):
+    """
+    Run one rows=0 request carrying every facet.field and, optionally, a
+    date range facet. Each field facet ignores the filter on that field
+    (multi-select faceting); the range facet applies every filter. When the
+    request leaves its date window open and matching documents fall outside
+    the default window, the range facet is run again over their dates (a
+    stats request and a range request), so none is left out.
+    Returns a dict shaped like Haystack's facet_counts():
+    {'fields': {field: [(value, count), ...]}, 'ranges': {field: [(period, count), ...]}}.
+    """
+    results = search(filters, using=using, **facet_params(filters, fields, range_field, gap))
+    facet_data = parse_facet_counts(results.facets, range_field, gap)
+    if range_field and outside_window(results.facets, range_field):
+        bounds = date_bounds(filters, range_field, using=using)
+        results = search(filters, using=using, **facet_params(filters, (), range_field, gap, bounds))
+        facet_data['ranges'] = parse_facet_counts(results.facets, range_field, gap)['ranges']
+    return facet_data
+
+def time_series(filters, gap='year', using='default'):
+    """
+    Return [{'period': ..., 'count': ...}] buckets of activities by start_date.
+    """
+    facet_data = facet_counts(filters, range_field='start_date', gap=gap, using=using)
+    return [
+        {'period': period, 'count': count}
+        for period, count in facet_data['ranges']['start_date']
+    ]
+
+def to_python(doc, fields, using='default'):
+    """
+    Convert a raw Solr document into the same Python values Haystack's
+    .values() returns, keeping only the requested fields.
+    """
+    backend = connections[using].get_backend()
+    index_fields = connections[using].get_unified_index().get_index(Activity).fields
+    converted = {}
+    for field in fields:
+        value = doc.get(field)
+        if value is not None:
+            if field in index_fields:
+                value = index_fields[field].convert(value)
+            else:
+                value = backend.conn._to_python(value)
+        converted[field] = value
+    return converted
+
+def valid_cursor(cursor):
+    """
+    Whether cursor looks like a cursorMark, so that garbage is rejected
+    without a request. Solr still rejects well-formed but unknown values.
+    """
+    return bool(CURSOR_RE.match(cursor))
+
+def cursor_params(cursor, rows, fields):
+    return {
+        'rows': rows,
+        'sort': CURSOR_SORT,
+        'cursorMark': cursor,
+        'fl': ','.join(fields),
+    }
+
+def parse_cursor_page(docs, hits, next_cursor, cursor, fields, using='default'):
+    return {
+        'results': [to_python(doc, fields, using=using) for doc in docs],
+        'next_cursor': next_cursor if next_cursor and next_cursor != cursor else None,
+        'count': hits,
+    }
+
+def cursor_page(filters, cursor, rows, fields, using='default'):
+    """
+    Fetch one page of documents with Solr's cursorMark deep paging.
+    Returns {'results': [...], 'next_cursor': str or None, 'count': int};
+    next_cursor is None once the last page has been reached.
+    """
+    results = search(filters, using=using, **cursor_params(cursor, rows, fields))
+    return parse_cursor_page(results.docs, results.hits, results.nextCursorMark, cursor,
+                             fields, using=using)
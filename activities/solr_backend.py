@@ -0,0 +1,145 @@
+"""
+Haystack Solr engine with a managed HTTP connection.
+
+Haystack connections are per thread and pysolr opens a new requests.Session
+(and TCP connections) for each of them, with a single timeout and no
+retries. This engine gives every backend of a connection alias one shared,
+pooled keep-alive session per process instead, with separate connect and
+read timeouts and bounded retries for idempotent (GET) requests, behind
+the circuit breaker of activities/resilience.py. Every Solr call sends
+solr_request_finished with its wall time and QTime.
+
+Use it in HAYSTACK_CONNECTIONS:
+
+    HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'activities.solr_backend.ManagedSolrEngine',
+            'URL': 'http://localhost:8983/solr/eyeview_activities',
+            'TIMEOUT': 10,             # read timeout, seconds
+            'CONNECT_TIMEOUT': 2,      # seconds
+            'MAX_RETRIES': 2,          # retries of failed GET requests
+            'RETRY_BACKOFF': 0.2,      # seconds, doubled on each retry
+            'POOL_MAXSIZE': 10,        # keep-alive connections kept per process
+        },
+    }
+"""
+import logging
+import re
+import threading
+import time
+
+import django.dispatch
+import requests
+from haystack.backends.solr_backend import SolrEngine, SolrSearchBackend
+from pysolr import Solr, SolrError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .resilience import SolrResponseError, get_circuit_breaker
+
+log = logging.getLogger(__name__)
+
+# Sent after every Solr HTTP request, including failed ones, with
+# method, path, elapsed (seconds), qtime (ms, None if unknown) and error.
+solr_request_finished = django.dispatch.Signal()
+
+# Solr puts responseHeader first, so QTime is found without decoding the body
+QTIME_RE = re.compile(r'"QTime"\s*:\s*(\d+)')
+
+# pysolr only reports the status of an error response in its SolrError message
+HTTP_ERROR_RE = re.compile(r'^Solr responded with an error \(HTTP (\d{3})\)')
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(alias, options):
+    """
+    The pooled session shared by every backend of a connection alias in
+    this process.
+    """
+    with _sessions_lock:
+        session = _sessions.get(alias)
+        if session is None:
+            retries = Retry(
+                total=options.get('MAX_RETRIES', 2),
+                backoff_factor=options.get('RETRY_BACKOFF', 0.2),
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                # Let pysolr turn the final error response into a SolrError
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=options.get('POOL_MAXSIZE', 10),
+                max_retries=retries,
+            )
+            session = requests.Session()
+            session.stream = False
+            session.verify = options.get('KWARGS', {}).get('verify', True)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[alias] = session
+        return session
+
+
+class ManagedSolr(Solr):
+    """
+    pysolr client that reports the timing of each request, raises
+    SolrResponseError for error responses and, when given a circuit
+    breaker, fails fast while Solr is down.
+    """
+    breaker = None
+
+    def _send_request(self, method, path='', body=None, headers=None, files=None):
+        if self.breaker:
+            self.breaker.before_call()
+        started = time.monotonic()
+        response = error = None
+        try:
+            response = super()._send_request(method, path, body=body, headers=headers, files=files)
+            if self.breaker:
+                self.breaker.record_success()
+            return response
+        except Exception as e:
+            error = e
+            match = HTTP_ERROR_RE.match(str(e)) if isinstance(e, SolrError) else None
+            if match:
+                error = SolrResponseError(str(e), int(match.group(1)))
+            if self.breaker:
+                self.breaker.record_error(error)
+            if error is not e:
+                raise error from e
+            raise
+        finally:
+            match = QTIME_RE.search(response[:200]) if isinstance(response, str) else None
+            solr_request_finished.send(
+                sender=self.__class__,
+                method=method,
+                path=path,
+                elapsed=time.monotonic() - started,
+                qtime=int(match.group(1)) if match else None,
+                error=error,
+            )
+
+
+class ManagedSolrSearchBackend(SolrSearchBackend):
+
+    def __init__(self, connection_alias, **connection_options):
+        super().__init__(connection_alias, **connection_options)
+        self.conn = ManagedSolr(
+            connection_options['URL'],
+            timeout=(connection_options.get('CONNECT_TIMEOUT', 2), self.timeout),
+            session=get_session(connection_alias, connection_options),
+            **connection_options.get('KWARGS', {})
+        )
+        self.conn.breaker = get_circuit_breaker(connection_alias)
+
+
+class ManagedSolrEngine(SolrEngine):
+    backend = ManagedSolrSearchBackend
+
+
+@django.dispatch.receiver(solr_request_finished)
+def log_solr_request(sender, method, path, elapsed, qtime, error, **kwargs):
+    log.debug("Solr %s %s took %.1fms (QTime %sms)%s", method.upper(), path.split('?', 1)[0],
+              elapsed * 1000, qtime, ' and failed' if error else '')
@@ -0,0 +1,247 @@
+"""
+Synthetic activity corpora for load and scale testing.
+
+ActivityDistribution learns from a sample CSV (by default
+resources/au-data-test.csv, parsed like an upload) how often each country,
+region, thematic area and directorate occurs, how start dates spread over
+time, how long activities last and how many have a URL; it then generates
+any number of activities that follow those distributions:
+
+- country from its frequency, region from the regions seen for that
+  country;
+- (thematic, directorate) pair from its frequency, independently of the
+  country, and activity name and objective from the rows of that pair;
+- start date from an observed one moved by up to date_jitter days, end
+  date from an observed duration (or none, as often as in the sample);
+- a URL as often as the pair has one, following the shape of an observed
+  URL (same site and path, fresh identifier).
+
+Activity names get a ' #<number>' suffix so every generated row has its own
+fingerprint. Generation is streamed and reproducible: the same sample, seed
+and first number always give the same rows, and a shorter run gives a
+prefix of a longer one.
+"""
+import csv
+import random
+import re
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from itertools import accumulate, islice
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import transaction
+
+from .counts import activity_dimensions, apply_deltas
+from .ingest import detect_encoding, get_chunk_size, parse_chunk, read_chunks
+from .models import Activity
+
+DEFAULT_SAMPLE = settings.BASE_DIR / 'resources' / 'au-data-test.csv'
+
+# Column order of generated CSVs, readable by the bulk upload
+CSV_COLUMNS = ('start_date', 'end_date', 'country', 'region', 'activity', 'objective',
+               'thematic', 'directorate', 'url')
+
+# Days a generated start date may move away from the observed one
+DATE_JITTER = 30
+
+ACTIVITY_MAX_LENGTH = Activity._meta.get_field('activity').max_length
+UUID_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.I)
+
+def read_activities(path=DEFAULT_SAMPLE):
+    """
+    The activities of a CSV file, parsed and cleaned like an upload.
+    """
+    activities = []
+    with open(path, 'rb') as file:
+        encoding = detect_encoding(file)
+        for chunk in read_chunks(file, encoding, get_chunk_size()):
+            parsed, _, _ = parse_chunk(chunk)
+            activities.extend(parsed)
+    return activities
+
+
+class Choice:
+    """
+    Weighted choice among values, by their counts.
+    """
+
+    def __init__(self, counts):
+        self.values = list(counts)
+        self.cum_weights = list(accumulate(counts.values()))
+
+    def pick(self, rng):
+        return rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+    def sample(self, rng, k):
+        return rng.choices(self.values, cum_weights=self.cum_weights, k=k)
+
+
+def _url_template(url):
+    """
+    Split a URL into the part kept as is and the kind of identifier that
+    ends it: ('digits', length), ('uuid',) or None when it ends otherwise.
+    """
+    parts = urlsplit(url)
+    head, _, last = parts.path.rpartition('/')
+    base = urlunsplit((parts.scheme, parts.netloc, head + '/', '', ''))
+    if last.isdigit():
+        return base, ('digits', len(last))
+    if UUID_RE.match(last):
+        return base, ('uuid',)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', '')), None
+
+
+class ActivityDistribution:
+    """
+    Value distributions of a sample of activities, and a generator of
+    activities following them.
+    """
+
+    def __init__(self, activities, date_jitter=DATE_JITTER):
+        if not activities:
+            raise ValueError("The sample has no activities.")
+        self.date_jitter = date_jitter
+        self.size = len(activities)
+
+        self.countries = Choice(Counter(a.country for a in activities))
+        regions = defaultdict(Counter)
+        for a in activities:
+            regions[a.country][a.region] += 1
+        self.regions = {country: Choice(counts) for country, counts in regions.items()}
+
+        self.categories = Choice(Counter((a.thematic, a.directorate) for a in activities))
+        texts = defaultdict(list)
+        urls = defaultdict(list)
+        with_url = Counter()
+        for a in activities:
+            category = (a.thematic, a.directorate)
+            texts[category].append((a.activity, a.objective))
+            if a.url:
+                with_url[category] += 1
+                urls[category].append(_url_template(a.url))
+        self.texts = dict(texts)
+        self.url_rates = {category: with_url[category] / len(texts[category]) for category in texts}
+        # Pairs without URLs borrow the shapes seen for the others
+        all_urls = [template for templates in urls.values() for template in templates]
+        self.urls = {category: urls.get(category) or all_urls for category in texts}
+
+        starts = [a.start_date for a in activities if a.start_date]
+        self.start_ordinals = [day.toordinal() for day in starts]
+        self.start_rate = len(starts) / self.size
+        self.durations = [(a.end_date - a.start_date).days
+                          for a in activities if a.start_date and a.end_date]
+        self.end_rate = len(self.durations) / len(starts) if starts else 0.0
+
+    @classmethod
+    def from_csv(cls, path=DEFAULT_SAMPLE, **kwargs):
+        return cls(read_activities(path), **kwargs)
+
+    def describe(self):
+        """
+        A summary of what was learned, for command output.
+        """
+        first = min(self.start_ordinals, default=None)
+        last = max(self.start_ordinals, default=None)
+        return {
+            'sample_rows': self.size,
+            'countries': len(self.countries.values),
+            'regions': len({region for choice in self.regions.values() for region in choice.values}),
+            'thematic_directorate_pairs': len(self.categories.values),
+            'start_dates': (date.fromordinal(first).isoformat(), date.fromordinal(last).isoformat())
+                           if first else None,
+            'with_start_date': round(self.start_rate, 3),
+            'with_end_date': round(self.end_rate, 3),
+            'with_url': round(sum(rate * len(self.texts[category])
+                                  for category, rate in self.url_rates.items()) / self.size, 3),
+        }
+
+    def _url(self, rng, category):
+        base, identifier = rng.choice(self.urls[category])
+        if identifier is None:
+            return base
+        if identifier[0] == 'digits':
+            return base + str(rng.randrange(10 ** (identifier[1] - 1), 10 ** identifier[1]))
+        return base + str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    def rows(self, count, seed=0, first=0):
+        """
+        Yield count activities as tuples of CSV_COLUMNS values (dates as
+        date objects, missing values as None), numbered from first.
+        """
+        rng = random.Random('%s:%s' % (seed, first))
+        batch_size = 10000
+        for batch_start in range(first, first + count, batch_size):
+            # Full batches are drawn even for the last one so that a shorter
+            # run yields a prefix of a longer one with the same seed
+            countries = self.countries.sample(rng, batch_size)
+            categories = self.categories.sample(rng, batch_size)
+            for number, country, category in zip(range(batch_start, first + count),
+                                                 countries, categories):
+                start_date = end_date = None
+                if self.start_ordinals and rng.random() < self.start_rate:
+                    start_date = date.fromordinal(rng.choice(self.start_ordinals)
+                                                  + rng.randint(-self.date_jitter, self.date_jitter))
+                    if self.durations and rng.random() < self.end_rate:
+                        end_date = start_date + timedelta(days=rng.choice(self.durations))
+
+                activity, objective = rng.choice(self.texts[category])
+                suffix = ' #%d' % number
+                activity = activity[:ACTIVITY_MAX_LENGTH - len(suffix)] + suffix
+                url = self._url(rng, category) if rng.random() < self.url_rates[category] else None
+
+                yield (start_date, end_date, country, self.regions[country].pick(rng), activity,
+                       objective, category[0], category[1], url)
+
+    def activities(self, count, seed=0, first=0):
+        """
+        Yield count unsaved activities; see rows().
+        """
+        for row in self.rows(count, seed, first):
+            yield Activity(**dict(zip(CSV_COLUMNS, row)))
+
+
+def write_csv(file, rows):
+    """
+    Write generated rows to a text file in the bulk upload format.
+    Returns the number of rows written.
+    """
+    writer = csv.writer(file)
+    writer.writerow(CSV_COLUMNS)
+    written = 0
+    while True:
+        batch = list(islice(rows, 10000))
+        if not batch:
+            return written
+        writer.writerows(
+            [value.isoformat() if isinstance(value, date) else value for value in row]
+            for row in batch
+        )
+        written += len(batch)
+
+def insert_activities(activities, batch_size=None, progress=None):
+    """
+    Bulk insert activities batch by batch, each batch in its own transaction
+    together with its ActivityCount deltas. Like any bulk write, this sends
+    no model signals, so the rows still have to be indexed.
+    progress, if given, is called with the running total.
+
+    Returns the number of rows inserted.
+    """
+    batch_size = batch_size or get_chunk_size()
+    total = 0
+    while True:
+        batch = list(islice(activities, batch_size))
+        if not batch:
+            return total
+        deltas = Counter()
+        for activity in batch:
+            activity.fingerprint = activity.compute_fingerprint()
+            deltas[activity_dimensions(activity)] += 1
+        with transaction.atomic():
+            Activity.objects.bulk_create(batch)
+            apply_deltas(deltas)
+        total += len(batch)
+        if progress:
+            progress(total)
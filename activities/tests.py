@@ -1,3 +1,1227 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import pandas as pd
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.core.cache import caches
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from haystack import connection_router, connections
+from pysolr import SolrError
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from benchmarks.fake_solr import FakeSolr
+
+from . import async_solr, cache, export, indexing, resilience, signal_processors, solr, solr_backend
+from .counts import rebuild_counts
+from .filters import get_filters
+from .engines import ENGINES, DatabaseEngine
+from .indexing import reindex_queryset
+from .ingest import APPEND, DATE_FORMATS, TRUNCATE, import_csv, normalize_chunk, parse_chunk
+from .models import Activity, ActivityCount
+from .solr_backend import solr_request_finished
+from .views import StackedDatasetView
+
+
+def legacy_parse_chunk(df):
+    """
+    The row-by-row parsing parse_chunk() replaced, kept as the reference
+    for its dates, skipped rows and error messages.
+    """
+    dates = []
+    invalid_rows = []
+    skipped_rows = 0
+
+    def parse_date(value, row_num, field):
+        if not value:
+            return None
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value.strip(), fmt).date()
+            except ValueError:
+                continue
+        invalid_rows.append(f"Row {row_num}: invalid {field} '{value}'")
+        return None
+
+    for i, row in df.iterrows():
+        row_num = i + 2
+        start_date = parse_date(row.get('start_date'), row_num, 'start_date')
+        end_date = parse_date(row.get('end_date'), row_num, 'end_date')
+        if not row.get('activity', '').strip() or not row.get('country', '').strip():
+            skipped_rows += 1
+            continue
+        dates.append((start_date, end_date))
+    return dates, skipped_rows, invalid_rows
+
+
+class ParseChunkTests(SimpleTestCase):
+    DATES = [
+        '2023-05-17', '17/05/2023', '05/17/2023', '01/02/2023', '2023-5-7', '7/5/2023',
+        # Outside datetime64[ns]'s 1677-2262 range
+        '1/1/3000', '01/02/1600', '1066-10-14', '9999-12-31', '0001-01-01', '12/31/2500',
+        # Invalid
+        '2023-02-30', '31/31/2023', 'not a date', '2023/05/17', '17-05-2023', '23-05-17',
+        '',
+    ]
+
+    def chunk(self, rows, start=0):
+        df = pd.DataFrame(rows, dtype=str)
+        df.index = range(start, start + len(df))
+        return normalize_chunk(df)
+
+    def assertMatchesLegacy(self, rows, start=0):
+        activities, skipped, invalid = parse_chunk(self.chunk(rows, start))
+        expected_dates, expected_skipped, expected_invalid = legacy_parse_chunk(self.chunk(rows, start))
+        self.assertEqual([(a.start_date, a.end_date) for a in activities], expected_dates)
+        self.assertEqual(skipped, expected_skipped)
+        self.assertEqual(invalid, expected_invalid)
+
+    def test_dates_match_legacy_parsing(self):
+        rows = [
+            {'start_date': start, 'end_date': end, 'country': 'Kenya', 'activity': 'Workshop'}
+            for start in self.DATES for end in ('', '2024-01-01', '1/1/3000', 'bad')
+        ]
+        self.assertMatchesLegacy(rows)
+
+    def test_dates_outside_datetime64_range_are_kept(self):
+        activities, _, invalid = parse_chunk(self.chunk([
+            {'start_date': '01/02/1600', 'end_date': '1/1/3000', 'country': 'Kenya', 'activity': 'Workshop'},
+        ]))
+        self.assertEqual(invalid, [])
+        self.assertEqual(str(activities[0].start_date), '1600-02-01')
+        self.assertEqual(str(activities[0].end_date), '3000-01-01')
+
+    def test_skipped_rows_and_row_numbers_match_legacy_parsing(self):
+        rows = [
+            {'start_date': 'bad', 'end_date': '1/1/3000', 'country': '', 'activity': 'Workshop'},
+            {'start_date': '2023-01-01', 'end_date': 'worse', 'country': 'Kenya', 'activity': ''},
+            {'start_date': '01/02/1600', 'end_date': 'bad', 'country': 'Kenya', 'activity': 'Workshop'},
+        ]
+        # Later chunks keep counting rows from where the previous one stopped
+        self.assertMatchesLegacy(rows, start=5000)
+
+    def test_missing_date_columns(self):
+        self.assertMatchesLegacy([{'country': 'Kenya', 'activity': 'Workshop'}])
+
+
+def csv_file(*rows):
+    header = 'start_date,end_date,country,region,activity,objective,thematic,directorate,url'
+    return io.BytesIO('\n'.join((header,) + rows).encode('utf-8'))
+
+
+class UpsertTests(TestCase):
+    ROWS = (
+        '2023-05-17,,Kenya,Eastern,Election observation,Observe the elections,DEU,GCPD,https://a.example/1',
+        '2022-01-10,2022-01-12,Ghana,Western,PSC Induction,Induct new members,PSC,CMD,',
+        '01/02/1600,,Mali,Western,Archive review,Review the archive,DEU,GCPD,',
+    )
+
+    def upload(self, *rows, mode=None):
+        """
+        Import rows and return (summary, number of on_commit callbacks, i.e.
+        scheduled reindexes). The callbacks are not run: there is no Solr.
+        """
+        kwargs = {'mode': mode} if mode else {}
+        with self.captureOnCommitCallbacks() as callbacks:
+            summary = import_csv(csv_file(*rows), **kwargs)
+        return summary, len(callbacks)
+
+    def counts(self):
+        return sorted(ActivityCount.objects.values_list(
+            'country', 'region', 'thematic', 'directorate', 'year', 'count'))
+
+    def assertCountsConsistent(self):
+        counts = self.counts()
+        rebuild_counts(Activity, ActivityCount)
+        self.assertEqual(counts, self.counts())
+
+    def test_first_upload_inserts(self):
+        summary, reindexes = self.upload(*self.ROWS)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (3, 0, 0))
+        self.assertEqual(reindexes, 1)
+        self.assertEqual(Activity.objects.count(), 3)
+        for activity in Activity.objects.all():
+            self.assertEqual(activity.fingerprint, activity.compute_fingerprint())
+        self.assertCountsConsistent()
+
+    def test_reupload_writes_and_reindexes_nothing(self):
+        self.upload(*self.ROWS)
+        versions = dict(Activity.objects.values_list('id', 'updated_at'))
+        counts = self.counts()
+
+        with CaptureQueriesContext(connection) as queries:
+            summary, reindexes = self.upload(*self.ROWS)
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+        self.assertEqual(reindexes, 0)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 0, 3))
+        self.assertEqual(dict(Activity.objects.values_list('id', 'updated_at')), versions)
+        self.assertEqual(self.counts(), counts)
+
+    def test_fingerprint_ignores_case_and_whitespace(self):
+        self.upload(*self.ROWS)
+        summary, _ = self.upload(
+            '2023-05-17,,KENYA,Eastern,Election   observation,observe the elections,DEU,GCPD,https://a.example/1')
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 1, 0))
+        self.assertEqual(Activity.objects.get(country='KENYA').activity, 'Election   observation')
+        self.assertEqual(Activity.objects.count(), 3)
+
+    def test_in_file_duplicates(self):
+        changed = self.ROWS[0].replace('https://a.example/1', 'https://a.example/2')
+        rows = self.ROWS + (self.ROWS[0], changed)
+        summary, _ = self.upload(*rows)
+        # The exact repeat is unchanged, the changed one rewrites the new row
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (3, 1, 1))
+        self.assertEqual(Activity.objects.count(), 3)
+        self.assertEqual(Activity.objects.get(country='Kenya').url, 'https://a.example/2')
+
+        # Uploading the same file again leaves the stored rows as they are
+        summary, reindexes = self.upload(*rows)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 0, 5))
+        self.assertEqual(reindexes, 0)
+        self.assertCountsConsistent()
+
+    def test_in_file_duplicate_updating_a_stored_row(self):
+        self.upload(*self.ROWS)
+        changed = self.ROWS[0].replace('https://a.example/1', 'https://a.example/2')
+        summary, reindexes = self.upload(changed, self.ROWS[0])
+        # The last occurrence matches the stored row: nothing is written
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 0, 2))
+        self.assertEqual(reindexes, 0)
+
+        # Otherwise each differing occurrence counts as one update
+        summary, reindexes = self.upload(self.ROWS[0], changed)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 2, 0))
+        self.assertEqual(reindexes, 1)
+        self.assertEqual(Activity.objects.get(country='Kenya').url, 'https://a.example/2')
+
+    def test_update_moves_counts(self):
+        self.upload(*self.ROWS)
+        original = Activity.objects.get(country='Ghana')
+        moved = self.ROWS[1].replace('Western,', 'Northern,').replace(',PSC,CMD,', ',DEU,CMD,')
+        summary, reindexes = self.upload(moved)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 1, 0))
+        self.assertEqual(reindexes, 1)
+
+        activity = Activity.objects.get(country='Ghana')
+        self.assertEqual(activity.pk, original.pk)
+        self.assertEqual((activity.region, activity.thematic), ('Northern', 'DEU'))
+        self.assertGreater(activity.updated_at, original.updated_at)
+        self.assertFalse(ActivityCount.objects.filter(country='Ghana', region='Western').exists())
+        self.assertEqual(ActivityCount.objects.get(country='Ghana').count, 1)
+        self.assertCountsConsistent()
+
+    def test_append_leaves_existing_rows(self):
+        self.upload(*self.ROWS)
+        moved = self.ROWS[1].replace('Western,', 'Northern,')
+        summary, reindexes = self.upload(moved, mode=APPEND)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 0, 1))
+        self.assertEqual(reindexes, 0)
+        self.assertEqual(Activity.objects.get(country='Ghana').region, 'Western')
+        self.assertCountsConsistent()
+
+    def test_truncate_replaces_everything(self):
+        self.upload(*self.ROWS)
+        summary, reindexes = self.upload(self.ROWS[0], mode=TRUNCATE)
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (1, 0, 0))
+        self.assertEqual(reindexes, 1)
+        self.assertEqual(list(Activity.objects.values_list('country', flat=True)), ['Kenya'])
+        self.assertCountsConsistent()
+
+    def test_counts_follow_model_saves_and_deletes(self):
+        self.upload(*self.ROWS)
+        activity = Activity.objects.get(country='Kenya')
+        activity.start_date = date(2021, 3, 1)
+        activity.save()
+        self.assertEqual(activity.fingerprint, activity.compute_fingerprint())
+        self.assertCountsConsistent()
+
+        # Saved through an instance not loaded from the database
+        Activity(pk=activity.pk, start_date=date(2020, 1, 1), country='Kenya', region='Eastern',
+                 activity='Election observation', objective='Observe the elections',
+                 thematic='PSC', directorate='CMD', url='').save()
+        self.assertCountsConsistent()
+
+        Activity.objects.get(country='Ghana').delete()
+        self.assertCountsConsistent()
+
+        # A row saved through the model is recognised by the next upload
+        summary, _ = self.upload('2020-01-01,,Kenya,Eastern,Election observation,Observe the elections,PSC,CMD,')
+        self.assertEqual((summary['imported'], summary['updated'], summary['unchanged']), (0, 0, 1))
+
+
+class LegacyDuplicateTests(TestCase):
+    """
+    Rows that duplicated an earlier one when fingerprints were introduced
+    have a NULL fingerprint (migration 0006) and must stay editable.
+    """
+
+    def setUp(self):
+        fields = {'start_date': date(2021, 6, 1), 'country': 'Kenya', 'region': 'Eastern',
+                  'activity': 'Workshop', 'objective': 'Train observers', 'thematic': 'DEU',
+                  'directorate': 'GCPD', 'url': ''}
+        self.original = Activity.objects.create(**fields)
+        self.duplicate = Activity.objects.create(**{**fields, 'country': 'Ghana'})
+        Activity.objects.filter(pk=self.duplicate.pk).update(country='kenya ', fingerprint=None)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user('editor@example.com', 'pw'))
+
+    def test_editing_a_legacy_duplicate_keeps_it_without_a_fingerprint(self):
+        response = self.client.patch(f'/api/activities/{self.duplicate.pk}/update',
+                                     {'url': 'https://a.example/1'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.duplicate.refresh_from_db()
+        self.assertEqual(self.duplicate.url, 'https://a.example/1')
+        self.assertIsNone(self.duplicate.fingerprint)
+
+    def test_legacy_duplicate_takes_its_fingerprint_once_unique(self):
+        response = self.client.patch(f'/api/activities/{self.duplicate.pk}/update',
+                                     {'objective': 'Observe the elections'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.duplicate.refresh_from_db()
+        self.assertEqual(self.duplicate.fingerprint, self.duplicate.compute_fingerprint())
+
+        # Edits into another row's content key are still rejected
+        response = self.client.patch(f'/api/activities/{self.duplicate.pk}/update',
+                                     {'objective': 'Train observers'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_legacy_duplicate_saved_after_the_original_is_deleted(self):
+        self.original.delete()
+        self.duplicate.save()
+        self.duplicate.refresh_from_db()
+        self.assertEqual(self.duplicate.fingerprint, self.duplicate.compute_fingerprint())
+
+
+class ActivityCountTests(TestCase):
+    def counts(self):
+        return sorted(ActivityCount.objects.values_list(
+            'country', 'region', 'thematic', 'directorate', 'year', 'count'))
+
+    def assertMatchesRebuild(self):
+        counts = self.counts()
+        rebuild_counts(Activity, ActivityCount)
+        self.assertEqual(counts, self.counts())
+
+    def test_counts_follow_creates_updates_and_deletes(self):
+        kenya = make_activity(start_date=date(2021, 5, 1))
+        make_activity(start_date=date(2021, 8, 1), activity='Second workshop')
+        ghana = make_activity(country='Ghana', region='Western', start_date=None)
+        self.assertMatchesRebuild()
+        self.assertIn(('Kenya', 'Eastern', 'DEU', 'GCPD', 2021, 2), self.counts())
+
+        # Moved to another bucket, then within the same one
+        kenya.start_date = date(2023, 1, 1)
+        kenya.thematic = 'PSC'
+        kenya.save()
+        self.assertMatchesRebuild()
+        kenya.objective = 'Observe the elections'
+        kenya.save()
+        self.assertMatchesRebuild()
+        ghana.start_date = date(2020, 1, 1)
+        ghana.save()
+        self.assertMatchesRebuild()
+
+        kenya.delete()
+        ghana.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.counts(), [('Kenya', 'Eastern', 'DEU', 'GCPD', 2021, 1)])
+
+
+class AsyncClientScopeTests(SimpleTestCase):
+    def run_in_new_loop(self, func):
+        # A new event loop per call, as async views get under WSGI
+        return async_to_sync(func)()
+
+    def test_clients_are_closed_with_their_scope(self):
+        async def use():
+            async with async_solr.client_scope():
+                client = async_solr.get_client()
+                self.assertIs(async_solr.get_client(), client)
+                self.assertFalse(client.is_closed)
+            return client
+        self.assertTrue(self.run_in_new_loop(use).is_closed)
+
+    def test_shared_clients_stay_open_with_the_loop(self):
+        async def use():
+            async with async_solr.client_scope(shared=True):
+                first = async_solr.get_client()
+            async with async_solr.client_scope(shared=True):
+                second = async_solr.get_client()
+            self.assertIs(first, second)
+            self.assertFalse(first.is_closed)
+            await first.aclose()
+        self.run_in_new_loop(use)
+
+    def test_no_client_outside_a_scope(self):
+        async def use():
+            return async_solr.get_client()
+        self.assertIsNone(self.run_in_new_loop(use))
+
+    def test_search_outside_a_scope_closes_its_client(self):
+        created = []
+
+        def create_client(using='default'):
+            response = {'responseHeader': {'QTime': 1}, 'response': {'numFound': 0, 'docs': []}}
+            transport = httpx.MockTransport(lambda request: httpx.Response(200, json=response))
+            client = httpx.AsyncClient(base_url='http://solr.test/solr/activities/', transport=transport)
+            created.append(client)
+            return client
+
+        async def search():
+            return await async_solr.search({}, rows=0)
+        with mock.patch.object(async_solr, 'create_client', create_client):
+            data = self.run_in_new_loop(search)
+        self.assertEqual(data['response']['numFound'], 0)
+        self.assertEqual(len(created), 1)
+        self.assertTrue(created[0].is_closed)
+
+
+class IndexChangedTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 100.0
+        for patcher in (mock.patch.object(indexing, '_bump_due', None),
+                        mock.patch.object(indexing.time, 'monotonic', lambda: self.now),
+                        mock.patch.object(indexing.threading, 'Timer'),
+                        mock.patch.object(indexing, 'bump_index_generation'),
+                        mock.patch.object(indexing, 'connection')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(ACTIVITIES_INDEX_COMMIT_WITHIN=1000)
+    def test_changes_share_one_pending_bump(self):
+        for _ in range(5):
+            indexing.index_changed()
+            self.now += 0.1
+        indexing.threading.Timer.assert_called_once_with(1.0, indexing._bump_later)
+        self.assertEqual(indexing.bump_index_generation.call_count, 1)
+
+        # The timer fires while the last change may not be searchable yet
+        self.now = 101.0
+        indexing._bump_later()
+        self.assertEqual(indexing.bump_index_generation.call_count, 2)
+        self.assertEqual(indexing.threading.Timer.call_count, 2)
+        self.assertAlmostEqual(indexing.threading.Timer.call_args.args[0], 0.4)
+
+        self.now = 101.4
+        indexing._bump_later()
+        self.assertEqual(indexing.bump_index_generation.call_count, 3)
+        self.assertEqual(indexing.threading.Timer.call_count, 2)
+        self.assertIsNone(indexing._bump_due)
+
+        # Nothing pending any more: the next change bumps at once again
+        indexing.index_changed()
+        self.assertEqual(indexing.bump_index_generation.call_count, 4)
+        self.assertEqual(indexing.threading.Timer.call_count, 3)
+
+
+class ResultCacheTests(TestCase):
+    def make_cache(self, **options):
+        options = {**cache.DEFAULTS, **options}
+        return cache.ResultCache(cache.BACKENDS[options['BACKEND']](options), options['KEY_PREFIX'])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        result_cache = self.make_cache(MAX_ENTRIES=2)
+        for name in ('a', 'b'):
+            result_cache.get_or_compute(name, {}, lambda: name)
+        # Reading 'a' makes 'b' the least recently used
+        self.assertEqual(result_cache.get_or_compute('a', {}, lambda: 'recomputed'), 'a')
+        result_cache.get_or_compute('c', {}, lambda: 'c')
+        self.assertEqual(len(result_cache.backend._entries), 2)
+        self.assertEqual(result_cache.get_or_compute('a', {}, lambda: 'recomputed'), 'a')
+        self.assertEqual(result_cache.get_or_compute('b', {}, lambda: 'recomputed'), 'recomputed')
+
+    def test_equivalent_requests_share_a_key(self):
+        factory = RequestFactory()
+        requests = (
+            '?f.countries=Kenya,Ghana&f.thematics=DEU&f.date_from=2021-01-01',
+            '?f.date_from=2021-01-01&f.thematics=DEU&f.countries=Ghana&f.countries=Kenya',
+            '?f.thematics=DEU&f.countries=Ghana,%20Kenya,Kenya&f.regions=&f.date_from=2021-01-01',
+        )
+        result_cache = self.make_cache()
+        keys = {result_cache.make_key('summary', get_filters(factory.get('/' + query)), 1) for query in requests}
+        self.assertEqual(len(keys), 1)
+        other = get_filters(factory.get('/?f.countries=Kenya&f.thematics=DEU&f.date_from=2021-01-01'))
+        self.assertNotIn(result_cache.make_key('summary', other, 1), keys)
+
+    def test_generation_bump_invalidates_entries(self):
+        caches['default'].clear()
+        for backend in ('local', 'shared'):
+            with self.subTest(backend=backend):
+                # A second process sharing the database or the cache
+                result_cache, other = self.make_cache(BACKEND=backend), self.make_cache(BACKEND=backend)
+                result_cache.backend.poll_interval = other.backend.poll_interval = 0
+                self.assertEqual(result_cache.get_or_compute('summary', {}, lambda: 'old'), 'old')
+                self.assertEqual(result_cache.get_or_compute('summary', {}, lambda: 'new'), 'old')
+                other.bump_generation()
+                self.assertEqual(result_cache.get_or_compute('summary', {}, lambda: 'new'), 'new')
+
+    def test_local_backend_reads_the_generation_once_per_interval(self):
+        now = 1000.0
+        result_cache = self.make_cache(GENERATION_POLL_INTERVAL=1.0)
+        with mock.patch.object(cache.time, 'monotonic', lambda: now), \
+                mock.patch.object(cache, 'read_generation', wraps=cache.read_generation) as read:
+            for _ in range(5):
+                result_cache.get_or_compute('summary', {}, lambda: 'old')
+            self.assertEqual(read.call_count, 1)
+
+            # A bump made by another process shows once the interval is over
+            cache.incr_generation()
+            read.reset_mock()
+            now += 0.5
+            self.assertEqual(result_cache.get_or_compute('summary', {}, lambda: 'new'), 'old')
+            now += 0.5
+            self.assertEqual(result_cache.get_or_compute('summary', {}, lambda: 'new'), 'new')
+            self.assertEqual(read.call_count, 1)
+
+
+def make_activity(**fields):
+    values = {
+        'start_date': date(2022, 3, 1), 'country': 'Kenya', 'region': 'Eastern',
+        'activity': 'Workshop', 'objective': 'Train observers', 'thematic': 'DEU',
+        'directorate': 'GCPD', 'url': '',
+    }
+    values.update(fields)
+    return Activity.objects.create(**values)
+
+
+class FakeSolrMixin:
+    """
+    Runs the Solr-backed code against benchmarks/fake_solr.py. Every test
+    starts with an empty index, result cache, stale stores and circuit.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.solr_server = FakeSolr().start()
+        cls.addClassCleanup(cls.solr_server.stop)
+        solr_url = mock.patch.dict(settings.HAYSTACK_CONNECTIONS['default'], {'URL': cls.solr_server.url})
+        solr_url.start()
+        cls.addClassCleanup(solr_url.stop)
+        cls.addClassCleanup(connections.reload, 'default')
+
+    def setUp(self):
+        connections.reload('default')
+        self.solr_server.index.clear()
+        for patcher in (mock.patch.object(cache, '_result_cache', None),
+                        mock.patch.object(resilience, '_stale_store', None),
+                        mock.patch.object(resilience, '_page_stale_store', None),
+                        mock.patch.dict(resilience._breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def index(self):
+        reindex_queryset(Activity.objects.all())
+
+    @contextmanager
+    def capture_solr_requests(self):
+        """
+        Collect the path of every Solr request sent inside the block.
+        """
+        paths = []
+
+        def record(sender, path, **kwargs):
+            paths.append(path)
+        solr_request_finished.connect(record)
+        try:
+            yield paths
+        finally:
+            solr_request_finished.disconnect(record)
+
+    def open_circuit(self):
+        breaker = resilience.get_circuit_breaker()
+        with self.assertLogs('activities.resilience', 'WARNING'):
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+
+
+class FakeSolrTestCase(FakeSolrMixin, TestCase):
+    pass
+
+
+class FakeSolrTransactionTestCase(FakeSolrMixin, TransactionTestCase):
+    """
+    For code whose database work runs in other threads (async views, reindex
+    workers), which do not see the rows of a TestCase transaction.
+    """
+
+
+class StaleFallbackMixin:
+    PATHS = ('/api/dashboard/summary/',)
+
+    def setUp(self):
+        super().setUp()
+        for country, thematic in (('Kenya', 'DEU'), ('Ghana', 'PSC'), ('Mali', 'DEU')):
+            make_activity(country=country, thematic=thematic)
+        self.index()
+
+    def test_auto_engine_answers_from_the_database_before_the_stale_store(self):
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                fresh = self.client.get(path, {'f.thematics': 'DEU'}).json()
+                self.open_circuit()
+                # A new generation, so the result is computed again
+                cache.bump_index_generation()
+                response = self.client.get(path, {'f.thematics': 'DEU'})
+                self.assertFalse(response.has_header('Warning'))
+                self.assertEqual(response.json(), fresh)
+                resilience.get_circuit_breaker().record_success()
+
+    def test_auto_engine_serves_the_last_good_result_when_the_database_fails(self):
+        failing = mock.patch.object(DatabaseEngine, 'facet_counts', side_effect=OperationalError('gone'))
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                fresh = self.client.get(path).json()
+                self.open_circuit()
+                cache.bump_index_generation()
+                with failing, mock.patch.object(resilience, 'refresh_in_background'):
+                    response = self.client.get(path)
+                    self.assertEqual(response['Warning'], resilience.STALE_WARNING)
+                    self.assertEqual(response.json(), fresh)
+                    # Without a last good result the outage shows
+                    self.assertEqual(self.client.get(path, {'f.countries': 'Chad'}).status_code, 503)
+                resilience.get_circuit_breaker().record_success()
+
+
+class AsyncStaleFallbackTests(StaleFallbackMixin, FakeSolrTransactionTestCase):
+    PATHS = ('/api/async/dashboard/summary/',)
+
+
+class StaleFallbackTests(StaleFallbackMixin, FakeSolrTestCase):
+    def test_pages_fall_back_to_their_last_good_result(self):
+        path = '/api/dashboard/activities/'
+        for params in ({'page': 1, 'per_page': 2}, {'cursor': '*', 'per_page': 2}):
+            with self.subTest(params=params):
+                resilience.get_circuit_breaker().record_success()
+                fresh = self.client.get(path, params)
+                self.assertEqual(fresh.status_code, 200)
+                self.assertFalse(fresh.has_header('Warning'))
+
+                self.open_circuit()
+                stale = self.client.get(path, params)
+                self.assertEqual(stale.status_code, 200)
+                self.assertEqual(stale['Warning'], resilience.STALE_WARNING)
+                self.assertEqual(stale.json(), fresh.json())
+                # A page never fetched has nothing to fall back to
+                self.assertEqual(self.client.get(path, {**params, 'per_page': 3}).status_code, 503)
+
+    @override_settings(ACTIVITIES_SOLR_RESILIENCE={'PAGE_STALE_MAX_ENTRIES': 2},
+                       ACTIVITIES_DASHBOARD_ENGINE='solr')
+    def test_pages_do_not_evict_dashboard_results(self):
+        summary = self.client.get('/api/dashboard/summary/').json()
+        for page in (1, 2, 3):
+            self.client.get('/api/dashboard/activities/', {'page': page, 'per_page': 1})
+        self.assertEqual(len(cache.get_result_cache().backend._entries), 1)
+
+        self.open_circuit()
+        cache.bump_index_generation()
+        with mock.patch.object(resilience, 'refresh_in_background') as refresh:
+            stale = self.client.get('/api/dashboard/summary/')
+        self.assertEqual(stale['Warning'], resilience.STALE_WARNING)
+        self.assertEqual(stale.json(), summary)
+        refresh.assert_called_once()
+        # The page store keeps its last two pages
+        pages = [self.client.get('/api/dashboard/activities/', {'page': page, 'per_page': 1}).status_code
+                 for page in (1, 2, 3)]
+        self.assertEqual(pages, [503, 200, 200])
+
+    def test_rejected_requests_are_not_served_stale(self):
+        resilience.serve_page('cursor:Zm9v', {}, lambda: {'results': []})
+
+        def rejected():
+            raise resilience.SolrResponseError('Solr responded with an error (HTTP 400)', 400)
+        with self.assertRaises(resilience.SolrResponseError):
+            resilience.serve_page('cursor:Zm9v', {}, rejected)
+
+
+class TimeSeriesWindowTests(FakeSolrTestCase):
+    def setUp(self):
+        super().setUp()
+        for year in (1990, 2021, 2022):
+            make_activity(start_date=date(year, 3, 1), activity=f'Workshop {year}')
+        self.index()
+
+    def years(self, response):
+        return [(bucket['year'], bucket['count']) for bucket in response.json()['years']]
+
+    def test_summary_takes_one_solr_request(self):
+        with self.capture_solr_requests() as requests:
+            response = self.client.get('/api/dashboard/summary/')
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(self.years(response), [('1990', 1), ('2021', 1), ('2022', 1)])
+
+    def test_dates_outside_the_default_window_are_counted(self):
+        make_activity(start_date=date(1955, 1, 1), activity='Early')
+        make_activity(start_date=date(date.today().year + 3, 12, 31), activity='Planned')
+        self.index()
+        for path in ('/api/dashboard/summary/', '/api/async/dashboard/summary/'):
+            with self.subTest(path=path):
+                cache.bump_index_generation()
+                with self.capture_solr_requests() as requests:
+                    response = self.client.get(path)
+                # The facets, then the stats and the range facet over them
+                self.assertEqual(len(requests), 3)
+                self.assertEqual(self.years(response), [
+                    ('1955', 1), ('1990', 1), ('2021', 1), ('2022', 1), (str(date.today().year + 3), 1),
+                ])
+
+    def test_open_window_beyond_the_default_one(self):
+        series = self.client.get('/api/dashboard/time-series/', {'f.date_from': '2100-01-01'}).json()
+        self.assertEqual(series, [])
+        series = self.client.get('/api/dashboard/time-series/', {'f.date_to': '1950-12-31'}).json()
+        self.assertEqual(series, [])
+        series = self.client.get('/api/dashboard/time-series/', {'f.date_to': '1990-12-31', 'gap': 'quarter'})
+        self.assertEqual(series.json(), [{'period': '1990-Q1', 'count': 1}])
+
+    def test_window_ending_before_it_starts_is_rejected(self):
+        params = {'f.date_from': '2022-01-01', 'f.date_to': '2021-12-31'}
+        for path in ('/api/dashboard/summary/', '/api/dashboard/time-series/',
+                     '/api/async/dashboard/summary/', '/api/dashboard/activities/'):
+            with self.subTest(path=path):
+                response = self.client.get(path, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('f.date_from', response.json())
+
+
+class EngineParityTests(FakeSolrTestCase):
+    """
+    Every engine answers like Solr, the reference the others imitate.
+    """
+    FIELDS = ('country_exact_str', 'region_exact_str', 'thematic_exact_str', 'directorate_exact_str')
+    FILTERS = (
+        {},
+        {'countries': ['Kenya', 'Ghana']},
+        {'countries': ['kenya']},
+        {'thematics': ['DEU'], 'regions': ['Western', 'Eastern']},
+        {'date_from': '2021-01-01', 'date_to': '2022-12-31'},
+        # Not whole years: the summary engine goes to the activity table
+        {'date_from': '2021-04-01', 'date_to': '2022-08-31', 'directorates': ['GCPD']},
+        {'date_from': '2022-01-01'},
+        {'countries': ['Nowhere']},
+    )
+
+    def setUp(self):
+        super().setUp()
+        rows = (
+            (date(2020, 2, 1), 'Kenya', 'Eastern', 'DEU', 'GCPD'),
+            (date(2021, 5, 9), 'Kenya', 'Eastern', 'PSC', 'CMD'),
+            # Differs only in case: Solr's string fields keep it apart
+            (date(2021, 5, 20), 'kenya', 'Eastern', 'DEU', 'GCPD'),
+            (date(2021, 11, 2), 'Ghana', 'Western', 'DEU', 'GCPD'),
+            (date(2022, 1, 15), 'Ghana', 'Western', 'PSC', 'GCPD'),
+            (date(2022, 7, 30), 'Mali', 'Western', 'DEU', 'CMD'),
+            (date(2023, 3, 3), 'Mali', 'Western', 'deu', 'GCPD'),
+            (None, 'Chad', 'Central', 'DEU', 'GCPD'),
+        )
+        for number, (start_date, country, region, thematic, directorate) in enumerate(rows):
+            make_activity(start_date=start_date, country=country, region=region, thematic=thematic,
+                          directorate=directorate, activity=f'Activity {number}')
+        self.index()
+
+    def assertParity(self, call):
+        expected = call(ENGINES['solr']())
+        for name in ('database', 'summary', 'auto'):
+            with self.subTest(engine=name):
+                self.assertEqual(call(ENGINES[name]()), expected)
+        return expected
+
+    def test_facets_and_yearly_breakdown(self):
+        for filters in self.FILTERS:
+            with self.subTest(filters=filters):
+                self.assertParity(lambda engine: engine.facet_counts(
+                    filters, self.FIELDS, range_field='start_date', gap='year'))
+
+    def test_time_series(self):
+        for filters in self.FILTERS:
+            for gap in ('year', 'quarter', 'month'):
+                with self.subTest(filters=filters, gap=gap):
+                    self.assertParity(lambda engine: engine.time_series(filters, gap))
+
+    def test_stacked_dataset(self):
+        for filters in self.FILTERS:
+            with self.subTest(filters=filters):
+                self.assertParity(lambda engine: StackedDatasetView.format_chart_data(
+                    engine.pivot_counts(filters, StackedDatasetView.PIVOT_FIELDS)))
+
+    def test_values_differing_in_case_stay_apart(self):
+        countries = self.assertParity(lambda engine: engine.facet_counts({}, ['country_exact_str']))
+        self.assertIn(('kenya', 1), countries['fields']['country_exact_str'])
+        self.assertIn(('Kenya', 2), countries['fields']['country_exact_str'])
+
+    def test_auto_engine_falls_back_to_the_same_answer(self):
+        expected = ENGINES['solr']().facet_counts({'countries': ['Kenya']}, self.FIELDS, range_field='start_date')
+        self.open_circuit()
+        with self.assertLogs('activities.engines', 'WARNING'):
+            result = ENGINES['auto']().facet_counts({'countries': ['Kenya']}, self.FIELDS, range_field='start_date')
+        self.assertEqual(result, expected)
+
+
+class ConditionalGetTests(FakeSolrTestCase):
+    def setUp(self):
+        super().setUp()
+        self.activity = make_activity()
+        self.index()
+
+    def assertRevalidates(self, client, path, params=None):
+        """
+        Fetch path, check that its ETag gets a 304 and return the ETag.
+        """
+        response = client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(client.get(path, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_dashboard_etag_changes_with_the_generation(self):
+        for path in ('/api/dashboard/summary/', '/api/async/dashboard/summary/'):
+            with self.subTest(path=path):
+                etag = self.assertRevalidates(self.client, path, {'f.countries': 'Kenya'})
+                # Other filters are another resource
+                self.assertEqual(self.client.get(path, {'f.countries': 'Ghana'}, HTTP_IF_NONE_MATCH=etag)
+                                 .status_code, 200)
+                cache.bump_index_generation()
+                response = self.client.get(path, {'f.countries': 'Kenya'}, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_activity_etag_changes_when_the_row_is_saved(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user('viewer@example.com', 'pw'))
+        path = f'/api/activities/{self.activity.pk}/'
+        etag = self.assertRevalidates(client, path)
+        # The row version alone decides, not the index generation
+        cache.bump_index_generation()
+        self.assertEqual(client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.activity.url = 'https://a.example/1'
+        self.activity.save()
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['url'], 'https://a.example/1')
+
+    def test_stale_responses_carry_no_validators(self):
+        path = '/api/async/dashboard/summary/'
+        etag = self.assertRevalidates(self.client, path)
+        self.open_circuit()
+        cache.bump_index_generation()
+        failing = mock.patch.object(DatabaseEngine, 'facet_counts', side_effect=OperationalError('gone'))
+        with failing, mock.patch.object(resilience, 'refresh_in_background'), \
+                self.assertLogs('activities', 'WARNING'):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Warning'], resilience.STALE_WARNING)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class FilterQueryTests(FakeSolrTestCase):
+    def setUp(self):
+        super().setUp()
+        rows = (
+            ('Kenya', 'DEU'), ('Kenya', 'PSC'), ('Ghana', 'DEU'), ('South Africa', 'DEU'),
+            ('Congo, Democratic Republic of the', 'PSC'),
+        )
+        for country, thematic in rows:
+            make_activity(country=country, thematic=thematic, activity=f'{country} {thematic}')
+        self.index()
+
+    def counts(self, path, params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return {tuple(item.values())[0]: item['count'] for item in response.json()}
+
+    def test_each_facet_ignores_its_own_filter(self):
+        params = {'f.countries': 'Kenya', 'f.thematics': 'DEU'}
+        fq = solr.filter_queries(get_filters(RequestFactory().get('/', params)), restrict_to_model=False)
+        self.assertEqual(fq[0], '{!terms tag=countries f=country_exact_str}Kenya')
+        self.assertEqual(solr.exclude_own_filter('country_exact_str'), '{!ex=countries}country_exact_str')
+
+        # Every country stays selectable, narrowed by the thematic filter only
+        self.assertEqual(self.counts('/api/dashboard/country-facets/', params),
+                         {'Kenya': 1, 'Ghana': 1, 'South Africa': 1})
+        self.assertEqual(self.counts('/api/dashboard/thematic-facets/', params), {'DEU': 1, 'PSC': 1})
+
+    def test_repeated_and_comma_separated_values(self):
+        path = '/api/dashboard/thematic-facets/'
+        repeated = self.counts(path, {'f.countries': ['Kenya', 'Ghana']})
+        self.assertEqual(repeated, {'DEU': 2, 'PSC': 1})
+        self.assertEqual(self.counts(path, {'f.countries': 'Ghana, Kenya'}), repeated)
+
+    def test_values_with_spaces_and_commas_match_exactly(self):
+        self.assertEqual(solr.terms_query('countries', 'country_exact_str', ['Kenya', 'South Africa']),
+                         '{!terms tag=countries f=country_exact_str}Kenya,South Africa')
+        congo = 'Congo, Democratic Republic of the'
+        # The terms parser would split on the comma: phrases instead
+        self.assertEqual(solr.terms_query('countries', 'country_exact_str', [congo, 'Kenya']),
+                         '{!tag=countries}country_exact_str:("Congo, Democratic Republic of the" OR "Kenya")')
+
+        path = '/api/dashboard/thematic-facets/'
+        self.assertEqual(self.counts(path, {'f.countries': 'South Africa'}), {'DEU': 1})
+        # Repeated, since a single value is split on its commas
+        self.assertEqual(self.counts(path, {'f.countries': [congo, 'Ghana']}), {'PSC': 1, 'DEU': 1})
+
+    def test_invalid_dates_are_rejected(self):
+        for value in ('2022-13-01', '01/02/2022', 'yesterday'):
+            with self.subTest(value=value):
+                response = self.client.get('/api/dashboard/summary/', {'f.date_from': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('f.date_from', response.json())
+
+
+class CircuitBreakerTests(FakeSolrTestCase):
+    def setUp(self):
+        super().setUp()
+        make_activity()
+        self.index()
+        self.breaker = resilience.get_circuit_breaker()
+
+    @contextmanager
+    def solr_down(self):
+        """
+        Point the connection at a closed port, without retries.
+        """
+        options = {'URL': 'http://127.0.0.1:9/solr/eyeview_activities', 'MAX_RETRIES': 0}
+        with mock.patch.dict(settings.HAYSTACK_CONNECTIONS['default'], options), \
+                mock.patch.dict(solr_backend._sessions, clear=True):
+            connections.reload('default')
+            try:
+                yield
+            finally:
+                connections.reload('default')
+
+    def search(self):
+        return solr.search({}, rows=0).hits
+
+    def wait_for_reset(self):
+        self.breaker.opened_at -= self.breaker.reset_timeout
+
+    def test_opens_after_the_threshold_and_probes_once_half_open(self):
+        with self.solr_down():
+            for _ in range(self.breaker.failure_threshold - 1):
+                with self.assertRaises(SolrError):
+                    self.search()
+            self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+            with self.assertRaises(SolrError), self.assertLogs('activities.resilience', 'WARNING'):
+                self.search()
+            self.assertEqual(self.breaker.state, self.breaker.OPEN)
+
+            # Failing fast: no request is sent
+            with self.capture_solr_requests() as requests, self.assertRaises(resilience.CircuitOpenError):
+                self.search()
+            self.assertEqual(requests, [])
+
+            # A failed probe opens the circuit again at once
+            self.wait_for_reset()
+            with self.capture_solr_requests() as requests, self.assertRaises(SolrError), \
+                    self.assertLogs('activities.resilience', 'WARNING'):
+                self.search()
+            self.assertEqual(len(requests), 1)
+            self.assertEqual(self.breaker.state, self.breaker.OPEN)
+            with self.assertRaises(resilience.CircuitOpenError):
+                self.search()
+
+        self.wait_for_reset()
+        with self.assertLogs('activities.resilience', 'INFO'):
+            self.assertEqual(self.search(), 1)
+        self.assertEqual((self.breaker.state, self.breaker.failures), (self.breaker.CLOSED, 0))
+
+    def test_rejected_requests_count_as_success(self):
+        with self.solr_down():
+            for _ in range(self.breaker.failure_threshold - 1):
+                with self.assertRaises(SolrError):
+                    self.search()
+        # Solr answers, even if with a 400: it is up
+        params = solr.range_params('start_date', 'year', '2022-01-01', '2021-01-01')
+        with self.assertRaises(resilience.SolrResponseError) as raised:
+            solr.search({}, rows=0, facet='true', **params)
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual((self.breaker.state, self.breaker.failures), (self.breaker.CLOSED, 0))
+
+    def test_serve_falls_back_to_the_last_good_result(self):
+        self.assertEqual(resilience.serve('hits', {}, self.search), (1, False))
+        cache.bump_index_generation()
+        self.open_circuit()
+        with mock.patch.object(resilience, 'refresh_in_background') as refresh:
+            self.assertEqual(resilience.serve('hits', {}, self.search), (1, True))
+        refresh.assert_called_once()
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.serve('hits', {'countries': ['Ghana']}, self.search)
+
+        # The background refresh brings the result cache up to date
+        self.breaker.record_success()
+        make_activity(country='Ghana')
+        self.index()
+        resilience._refresh('hits', {}, self.search)
+        self.assertEqual(resilience.serve('hits', {}, lambda: None), (2, False))
+
+
+@override_settings(ACTIVITIES_EXPORT_BATCH_SIZE=3)
+class ExportTests(FakeSolrTestCase):
+    PATH = '/api/dashboard/export/'
+
+    def setUp(self):
+        super().setUp()
+        for day in range(1, 8):
+            make_activity(start_date=date(2022, 3, day), activity=f'Workshop {day}',
+                          country='Ghana' if day % 2 else 'Kenya', url=f'https://a.example/{day}')
+        self.index()
+
+    def export(self, params=None, **headers):
+        response = self.client.get(self.PATH, params, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        return response, content.decode('utf-8')
+
+    def test_csv_streams_every_row_in_cursor_batches(self):
+        with self.capture_solr_requests() as requests:
+            response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="activities-', response['Content-Disposition'])
+        lines = content.splitlines()
+        self.assertEqual(lines[0], ','.join(export.COLUMNS))
+        self.assertEqual(len(lines), 8)
+        # Newest first
+        self.assertEqual([line.split(',')[5] for line in lines[1:]], [f'Workshop {day}' for day in range(7, 0, -1)])
+        # Batches of three, then the request returning the same cursorMark that ends the export
+        self.assertEqual(len(requests), 4)
+        self.assertTrue(all('rows=3' in path and 'cursorMark=' in path for path in requests))
+
+    def test_ndjson_matches_the_filters(self):
+        response, content = self.export({'output': 'ndjson', 'f.countries': 'Kenya'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['activity'] for row in rows], ['Workshop 6', 'Workshop 4', 'Workshop 2'])
+        self.assertEqual(set(rows[0]), set(export.COLUMNS))
+        self.assertEqual(rows[0]['url'], 'https://a.example/6')
+
+    def test_gzip_is_negotiated(self):
+        plain, plain_content = self.export()
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        gzipped, content = self.export(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(content, plain_content)
+
+    def test_database_export_matches_the_solr_one(self):
+        for output in export.ENCODERS:
+            with self.subTest(output=output):
+                _, from_solr = self.export({'output': output})
+                with override_settings(ACTIVITIES_DASHBOARD_ENGINE='database'), \
+                        self.capture_solr_requests() as requests:
+                    _, from_database = self.export({'output': output})
+                self.assertEqual(requests, [])
+                self.assertEqual(from_database, from_solr)
+
+    def test_solr_failure_falls_back_or_fails_before_streaming(self):
+        _, expected = self.export()
+        self.open_circuit()
+        # 'auto' reads the activity table instead
+        self.assertEqual(self.export()[1], expected)
+        with override_settings(ACTIVITIES_DASHBOARD_ENGINE='solr'):
+            self.assertEqual(self.client.get(self.PATH).status_code, 503)
+
+    def test_invalid_output_is_rejected(self):
+        self.assertEqual(self.client.get(self.PATH, {'output': 'xml'}).status_code, 400)
+
+
+class StackedDatasetTests(FakeSolrTestCase):
+    def test_one_pivot_request_builds_the_stacked_dataset(self):
+        rows = (('Kenya', 'DEU'), ('Kenya', 'DEU'), ('Kenya', 'PSC'), ('Ghana', 'PSC'))
+        for number, (country, thematic) in enumerate(rows):
+            make_activity(country=country, thematic=thematic, activity=f'Activity {number}')
+        self.index()
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user('viewer@example.com', 'pw'))
+        with self.capture_solr_requests() as requests:
+            response = client.get('/api/dashboard/stacked-dataset/')
+        self.assertEqual(len(requests), 1)
+        self.assertIn('facet.pivot=country_exact_str%2Cthematic_exact_str', requests[0])
+        self.assertEqual(response.json(), {
+            'labels': ['Ghana', 'Kenya'],
+            'datasets': [{'label': 'DEU', 'data': [0, 2]}, {'label': 'PSC', 'data': [1, 1]}],
+        })
+
+
+class CursorPaginationTests(FakeSolrTestCase):
+    def setUp(self):
+        super().setUp()
+        for day in range(1, 6):
+            make_activity(start_date=date(2022, 3, day), activity=f'Workshop {day}')
+        self.index()
+
+    def test_cursor_round_trip(self):
+        path = '/api/dashboard/activities/'
+        seen, pages, cursor = [], 0, '*'
+        while cursor:
+            page = self.client.get(path, {'cursor': cursor, 'per_page': 2, 'include_count': 'true'}).json()
+            self.assertEqual(page['count'], 5)
+            seen += [record['activity_exact'] for record in page['results']]
+            cursor, pages = page['next_cursor'], pages + 1
+        self.assertEqual(seen, [f'Workshop {day}' for day in range(5, 0, -1)])
+        # Like Solr, the end shows as an empty page without a next cursor
+        self.assertEqual((pages, page['results']), (4, []))
+
+    def test_invalid_cursors_are_rejected(self):
+        path = '/api/dashboard/activities/'
+        # Malformed: rejected without asking Solr
+        with self.capture_solr_requests() as requests:
+            response = self.client.get(path, {'cursor': 'not a cursor!'})
+        self.assertEqual((response.status_code, requests), (400, []))
+        # Well-formed, but not handed out by Solr
+        response = self.client.get(path, {'cursor': 'Zm9vYmFy'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid cursor', response.json()['error'])
+        self.assertEqual(resilience.get_circuit_breaker().state, resilience.CircuitBreaker.CLOSED)
+
+
+class ExactUrlTests(FakeSolrTestCase):
+    URL = 'https://a.example/reports/annual report 2022.pdf'
+
+    def activity_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/dashboard/activities/', params)
+        urls = [record['url'] for record in response.json()['results']]
+        return urls, [query['sql'] for query in queries if 'activities_activity' in query['sql']]
+
+    def test_urls_come_from_url_exact_without_a_database_lookup(self):
+        make_activity(url=self.URL)
+        self.index()
+        for params in ({'page': 1}, {'cursor': '*'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.activity_queries(params), ([self.URL], []))
+
+        # A document indexed before url_exact existed is completed from the database
+        for doc in self.solr_server.index.snapshot():
+            doc.pop('url_exact', None)
+        urls, queries = self.activity_queries({'cursor': '*', 'per_page': 5})
+        self.assertEqual((urls, len(queries)), ([self.URL], 1))
+
+
+class BatchedSignalProcessorTests(FakeSolrTestCase):
+    def setUp(self):
+        super().setUp()
+        processor = signal_processors.BatchedSignalProcessor(connections, connection_router)
+        self.addCleanup(processor.teardown)
+        patcher = mock.patch.object(signal_processors, 'index_changed')
+        self.index_changed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_update_request_per_transaction(self):
+        with self.capture_solr_requests() as requests, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                activities = [make_activity(activity=f'Workshop {number}') for number in range(3)]
+                for activity in activities:
+                    activity.url = 'https://a.example/1'
+                    activity.save()
+            self.assertEqual(requests, [])
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(requests[0].startswith('update/') and 'commitWithin=' in requests[0])
+        self.assertEqual(len(self.solr_server.index), 3)
+        self.index_changed.assert_called_once_with()
+
+        with self.capture_solr_requests() as requests, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                activities[0].delete()
+                activities[1].delete()
+        # The deletes of the transaction in a single request too
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(len(self.solr_server.index), 1)
+
+
+class ReindexIdsTests(FakeSolrTransactionTestCase):
+    def test_exact_ids_are_indexed_with_one_commit(self):
+        activities = [make_activity(activity=f'Workshop {number}') for number in range(7)]
+        wanted = [activity.pk for activity in activities[1:6]]
+        with self.capture_solr_requests() as requests:
+            total = indexing.reindex_ids(Activity, wanted, batch_size=2, workers=2)
+        self.assertEqual(total, 5)
+        self.assertEqual(sorted(int(doc['django_id']) for doc in self.solr_server.index.snapshot()), wanted)
+        # Three batches sent without committing, then a single commit
+        commits = [path for path in requests if 'commit=true' in path]
+        self.assertEqual(len(commits), 1)
+        self.assertEqual(len(requests), 4)
+        self.assertEqual(requests[-1], commits[0])
+
+
+class UnavailableSolrHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request with 503 and records its method.
+    """
+
+    def do_GET(self):
+        self.fail()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.fail()
+
+    def fail(self):
+        self.server.methods.append(self.command)
+        body = b'{"error": {"msg": "unavailable", "code": 503}}'
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ManagedSolrTests(SimpleTestCase):
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), UnavailableSolrHandler)
+        server.methods = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+
+        options = {'URL': f'http://127.0.0.1:{server.server_port}/solr/eyeview_activities',
+                   'MAX_RETRIES': 2, 'RETRY_BACKOFF': 0}
+        for patcher in (mock.patch.dict(settings.HAYSTACK_CONNECTIONS['default'], options),
+                        mock.patch.dict(solr_backend._sessions, clear=True),
+                        mock.patch.dict(resilience._breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        connections.reload('default')
+        self.addCleanup(connections.reload, 'default')
+        self.conn = connections['default'].get_backend().conn
+
+    def test_only_get_requests_are_retried(self):
+        finished = []
+
+        def record(sender, method, error, **kwargs):
+            finished.append((method, type(error)))
+        solr_request_finished.connect(record)
+        self.addCleanup(solr_request_finished.disconnect, record)
+
+        with self.assertRaises(resilience.SolrResponseError) as raised:
+            self.conn.search('*:*')
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(self.server.methods, ['GET'] * 3)
+
+        self.server.methods.clear()
+        with self.assertRaises(resilience.SolrResponseError):
+            self.conn.add([{'id': 'activities.activity.1'}], commit=False)
+        self.assertEqual(self.server.methods, ['POST'])
+
+        # One signal per call, however many attempts it took
+        self.assertEqual(finished, [('get', resilience.SolrResponseError),
+                                    ('post', resilience.SolrResponseError)])
+        self.assertEqual(resilience.get_circuit_breaker().failures, 2)
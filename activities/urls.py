@@ -4,14 +4,27 @@ from .views import (
     ActivityById,
     BulkUploadActivitiesView,
     DeleteActivity,
+    IndexOutboxStatsView,
     ThematicFacetView, 
     CountriesFacetView, 
     RegionsFacetView, 
     DirectorateFacetView, 
     StackedDatasetView,
     DateYearFacetView, 
+    TimeSeriesView,
+    DashboardSummaryView,
+    ExportActivitiesView,
     ActivitiesPaginatedView,
-    UpdateActivity
+    UpdateActivity,
+    UploadJobStatusView
+)
+from .async_views import (
+    AsyncCountriesFacetView,
+    AsyncDashboardSummaryView,
+    AsyncDirectorateFacetView,
+    AsyncRegionsFacetView,
+    AsyncStackedDatasetView,
+    AsyncThematicFacetView,
 )
 from django.urls import path, include
 
@@ -24,12 +37,26 @@ urlpatterns = [
     path('dashboard/region-facets/', RegionsFacetView.as_view(), name='region_facets'),
     path('dashboard/directorate-facets/', DirectorateFacetView.as_view(), name='directorate_facets'),
     path('dashboard/yearly-facets/', DateYearFacetView.as_view(), name='yearly_facets'),
+    path('dashboard/time-series/', TimeSeriesView.as_view(), name='time_series'),
+    path('dashboard/summary/', DashboardSummaryView.as_view(), name='dashboard_summary'),
     path('dashboard/activities/', ActivitiesPaginatedView.as_view(), name='activities'),
     path('dashboard/stacked-dataset/', StackedDatasetView.as_view(), name='stacked_dataset'),
+    path('dashboard/export/', ExportActivitiesView.as_view(), name='export_activities'),
+
+    # Async (ASGI) versions of the hot dashboard endpoints, see activities/async_views.py
+    path('async/dashboard/thematic-facets/', AsyncThematicFacetView.as_view(), name='async_thematic_facets'),
+    path('async/dashboard/country-facets/', AsyncCountriesFacetView.as_view(), name='async_country_facets'),
+    path('async/dashboard/region-facets/', AsyncRegionsFacetView.as_view(), name='async_region_facets'),
+    path('async/dashboard/directorate-facets/', AsyncDirectorateFacetView.as_view(), name='async_directorate_facets'),
+    path('async/dashboard/summary/', AsyncDashboardSummaryView.as_view(), name='async_dashboard_summary'),
+    path('async/dashboard/stacked-dataset/', AsyncStackedDatasetView.as_view(), name='async_stacked_dataset'),
 
     path('activities/<int:db_id>/', ActivityById.as_view(), name='activity_by_id'),
     path('activities/<int:db_id>/update', UpdateActivity.as_view(), name='update_activity'),
     path('activities/<int:db_id>/delete', DeleteActivity.as_view(), name='delete_activity'),
 
     path('activities/bulk-upload', BulkUploadActivitiesView.as_view(), name='upload_activity'),
+    path('activities/bulk-upload/<uuid:job_id>', UploadJobStatusView.as_view(), name='upload_job'),
+
+    path('indexing/outbox/', IndexOutboxStatsView.as_view(), name='index_outbox_stats'),
 ]
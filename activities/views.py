@@ -1,316 +1,470 @@
-from datetime import datetime
+from datetime import date
 from http.client import BAD_REQUEST, NOT_FOUND, OK
 from rest_framework.parsers import MultiPartParser, FormParser
-import pandas as pd
-import chardet
-from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.generics import DestroyAPIView, RetrieveAPIView, UpdateAPIView, get_object_or_404
-from .models import Activity
-from .serializers import ActivitySerializer
-from rest_framework.permissions import IsAuthenticated
+from .models import Activity, IndexOutboxEntry
+from .serializers import ActivitySerializer, UploadJobSerializer
+from .conditional import ConditionalMixin, DashboardConditionalMixin, conditional_get, make_etag
+from .filters import get_filters
+from .jobs import get_job, submit_upload
+from . import export, resilience, solr
+from .engines import get_dashboard_engine
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from haystack.query import SearchQuerySet
-from haystack.inputs import Exact
-from haystack import connections
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.core.paginator import Paginator, EmptyPage
-from urllib.parse import unquote
 from django.db import transaction
-from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
 from rest_framework import status
+from pysolr import SolrError
 
-def _get_list_param(request, name):
+def _apply_common_filters(sqs, filters):
     """
-    Return a list for a query param name, supporting repeated and comma-separated values.
+    Apply the normalized dashboard filters (countries, regions, thematics,
+    directorates and start_date window, when present) to the SQS as the
+    tagged Solr filter queries built by solr.filter_queries().
     """
-    values = request.GET.getlist(name)
-    if len(values) == 1 and "," in values[0]:
-        values = [v.strip() for v in values[0].split(",") if v.strip()]
-    return [v for v in values if v]
+    for fq in solr.filter_queries(filters, restrict_to_model=False):
+        sqs = sqs.narrow(fq)
+    return sqs
 
-def _apply_common_filters(sqs, request):
+def _cached(namespace, filters, compute):
     """
-    Apply country, region, and thematic filters (when present) to the SQS.
-    Uses *_exact fields for precise filtering in Solr.
-    
-    Handles URL-encoded values (e.g., 'South%20Africa') and ensures exact matching
-    for values containing spaces by using the Exact input type.
-    """
-    thematics = request.GET.get('f.thematics')
-    countries = request.GET.get('f.countries')
-    regions = request.GET.get('f.regions')
-
-    # URL-decode values and use Exact input type for proper quoting of multi-word values
-    if countries:
-        # Django usually URL-decodes GET params, but unquote ensures it's decoded
-        countries_decoded = unquote(countries)
-        # Pass Exact input type directly to ensure proper quoting for Solr queries with spaces
-        sqs = sqs.filter(country_exact_str=Exact(countries_decoded))
-    if regions:
-        regions_decoded = unquote(regions)
-        sqs = sqs.filter(region_exact_str=Exact(regions_decoded))
-    if thematics:
-        thematics_decoded = unquote(thematics)
-        sqs = sqs.filter(thematic_exact_str=Exact(thematics_decoded))
-
-    return sqs
+    Serve compute() through the result cache, keyed by the request filters.
+    Returns (result, stale); see activities/resilience.py.
+    """
+    return resilience.serve(namespace, filters, compute)
+
+def _result_response(result, stale):
+    response = Response(result)
+    if stale:
+        # Last good result served while Solr is failing
+        response['Warning'] = resilience.STALE_WARNING
+    return response
+
+def _backend_unavailable(e):
+    return Response({"detail": f"Search backend unavailable: {e}"}, status=503)
+
+# (response key, Solr facet field, item label) for every dashboard facet
+DASHBOARD_FACETS = (
+    ('thematic_areas', 'thematic_exact_str', 'thematic_area'),
+    ('countries', 'country_exact_str', 'country'),
+    ('regions', 'region_exact_str', 'region'),
+    ('directorates', 'directorate_exact_str', 'directorate'),
+)
+
+def _facet_items(facet_data, field, label):
+    """
+    Turn Solr (value, count) facet pairs into a list of {label: value, "count": count}.
+    """
+    return [
+        {label: value, "count": count}
+        for value, count in facet_data['fields'].get(field, [])
+    ]
 
-class ThematicFacetView(APIView):
+class FacetCountView(DashboardConditionalMixin, APIView):
     """
-    Returns facet counts of thematic areas using Haystack SearchQuerySet.
+    Base view returning facet counts of a single field.
+    Subclasses set facet_field (the Solr field) and label (the item key).
     """
-    
     http_method_names = ['get']
+    facet_field = None
+    label = None
 
-    def get(self, request):
-        sqs = _apply_common_filters(SearchQuerySet(), request).facet('thematic_exact_str')
-        facet_data = sqs.facet_counts()
-
-        if not facet_data or 'fields' not in facet_data:
-            return Response({"detail": "No facet data found"}, status=404)
-
-        thematic_facets = facet_data['fields'].get('thematic_exact_str', [])
-        result = [
-            {"thematic_area": theme, "count": count} for theme, count in thematic_facets
-        ]
+    def facet_counts(self, filters):
+        facet_data = get_dashboard_engine().facet_counts(filters, [self.facet_field])
+        return _facet_items(facet_data, self.facet_field, self.label)
 
-        return Response(result)
+    @conditional_get
+    def get(self, request):
+        filters = get_filters(request)
+        try:
+            result, stale = _cached(self.facet_field, filters, lambda: self.facet_counts(filters))
+        except SolrError as e:
+            return _backend_unavailable(e)
+        return _result_response(result, stale)
 
-class CountriesFacetView(APIView):
+class ThematicFacetView(FacetCountView):
     """
-    Returns facet counts of countries using Haystack SearchQuerySet.
+    Returns facet counts of thematic areas.
     """
+    facet_field = 'thematic_exact_str'
+    label = 'thematic_area'
 
-    def get(self, request):
-        sqs = _apply_common_filters(SearchQuerySet(), request).facet('country_exact_str')
-        
-        facet_data = sqs.facet_counts()
-
-        if not facet_data or 'fields' not in facet_data:
-            return Response({"detail": "No facet data found"}, status=404)
-
-        country_facets = facet_data['fields'].get('country_exact_str', [])
-        result = [
-            {"country": country, "count": count} for country, count in country_facets
-        ]
-
-        return Response(result)
+class CountriesFacetView(FacetCountView):
+    """
+    Returns facet counts of countries.
+    """
+    facet_field = 'country_exact_str'
+    label = 'country'
     
-class RegionsFacetView(APIView):
+class RegionsFacetView(FacetCountView):
     """
-    Returns facet counts of regions using Haystack SearchQuerySet.
+    Returns facet counts of regions.
     """
-
-    def get(self, request):
-        sqs = _apply_common_filters(SearchQuerySet(), request).facet('region_exact_str')
-        
-        facet_data = sqs.facet_counts()
-
-        if not facet_data or 'fields' not in facet_data:
-            return Response({"detail": "No facet data found"}, status=404)
-        region_facets = facet_data['fields'].get('region_exact_str', [])
-        
-        result = [
-            {"region": theme, "count": count}
-            for theme, count in region_facets
-        ]
-        return Response(result)
+    facet_field = 'region_exact_str'
+    label = 'region'
     
-class DirectorateFacetView(APIView):
+class DirectorateFacetView(FacetCountView):
     """
-    Returns facet counts of directorates using Haystack SearchQuerySet.
+    Returns facet counts of directorates.
     """
+    facet_field = 'directorate_exact_str'
+    label = 'directorate'
 
+class DateYearFacetView(DashboardConditionalMixin, APIView):
+    """
+    Returns yearly facet counts of 'start_date', bucketed by Solr range faceting.
+    """
+    @conditional_get
     def get(self, request):
+        filters = get_filters(request)
         try:
-            sqs = _apply_common_filters(SearchQuerySet(), request).facet('directorate_exact_str')
-        except Exception as e:
-            return Response({"detail": f"Search backend unavailable: {e}"}, status=503)
-        
-        facet_data = sqs.facet_counts()
+            series, stale = _cached('time-series:year', filters, lambda: get_dashboard_engine().time_series(filters, 'year'))
+        except SolrError as e:
+            return _backend_unavailable(e)
 
-        if not facet_data or 'fields' not in facet_data:
-            return Response({"detail": "No facet data found"}, status=404)
-        directorate_facets = facet_data['fields'].get('directorate_exact_str', [])
-        
-        result = [
-            {"directorate": directorate, "count": count} for directorate, count in directorate_facets
-        ]
-        return Response(result)
+        result = [{"year": bucket['period'], "count": bucket['count']} for bucket in series]
+        return _result_response(result, stale)
 
-class DateYearFacetView(APIView):
+class TimeSeriesView(DashboardConditionalMixin, APIView):
     """
-    Returns yearly cumulative facet counts of 'start_date' using Haystack SearchQuerySet.
+    Returns activity counts by start_date bucketed per year, quarter or month
+    (?gap=year|quarter|month, default year). Honours f.date_from / f.date_to
+    and the other dashboard filters; only non-empty buckets are returned.
     """
+    etag_params = ('gap',)
+
+    @conditional_get
     def get(self, request):
-        sqs = _apply_common_filters(SearchQuerySet(), request).facet('start_date')
-        facet_data = sqs.facet_counts()
+        gap = request.GET.get('gap', 'year')
+        if gap not in solr.RANGE_GAPS:
+            return Response(
+                {"error": f"Invalid gap '{gap}', expected one of: {', '.join(solr.RANGE_GAPS)}."},
+                status=400
+            )
 
-        if not facet_data or 'fields' not in facet_data:
-            return Response({"detail": "No facet data found"}, status=404)
+        filters = get_filters(request)
+        try:
+            result, stale = _cached(f'time-series:{gap}', filters, lambda: get_dashboard_engine().time_series(filters, gap))
+        except SolrError as e:
+            return _backend_unavailable(e)
+        return _result_response(result, stale)
 
-        # Date facet - usually returns: [('2022-01-01T00:00:00Z', 4), ('2022-02-01T00:00:00Z', 2), ...]
-        date_facets = facet_data['fields'].get('start_date', [])
+class DashboardSummaryView(DashboardConditionalMixin, APIView):
+    """
+    Returns every dashboard facet (thematic areas, countries, regions,
+    directorates) plus the yearly breakdown from a single Solr request
+    (or the equivalent database aggregations).
+    """
 
-        # Build cumulative sum per year
-        yearly_counts = {}
+    def summary(self, filters):
+        facet_data = get_dashboard_engine().facet_counts(
+            filters,
+            [field for _, field, _ in DASHBOARD_FACETS],
+            range_field='start_date',
+            gap='year',
+        )
+        return self.format_summary(facet_data)
+
+    @staticmethod
+    def format_summary(facet_data):
+        result = {
+            key: _facet_items(facet_data, field, label)
+            for key, field, label in DASHBOARD_FACETS
+        }
+        result['years'] = [
+            {"year": year, "count": count}
+            for year, count in facet_data['ranges']['start_date']
+        ]
+        return result
 
-        for date_str, count in date_facets:
-            # Extract year only (assumes date_str like 'YYYY-MM-DD...' )
-            year = date_str[:4]
-            yearly_counts[year] = yearly_counts.get(year, 0) + count
+    @conditional_get
+    def get(self, request):
+        filters = get_filters(request)
+        try:
+            result, stale = _cached('summary', filters, lambda: self.summary(filters))
+        except SolrError as e:
+            return _backend_unavailable(e)
+        return _result_response(result, stale)
 
-        # Transform for API output
-        result = [
-            {"year": year, "count": yearly_counts[year]} for year in sorted(yearly_counts)
-        ]
-        return Response(result)
+def _fix_urls(results):
+    """
+    Replace the tokenized 'url' value with the stored, non-tokenized url_exact.
 
-class ActivitiesPaginatedView(APIView):
+    Documents indexed before url_exact existed only carry the analyzed text_en
+    'url', whose stored value .values() truncates to the first token; for those
+    (and only those) fall back to the database by db_id until they are
+    reindexed with `manage.py reindex_activities`.
+    """
+    legacy_ids = []
+    for record in results:
+        url_exact = record.pop('url_exact', None)
+        if url_exact:
+            record['url'] = url_exact
+        elif record.get('url') and record.get('db_id'):
+            legacy_ids.append(record['db_id'])
+
+    if legacy_ids:
+        url_map = dict(
+            Activity.objects.filter(id__in=legacy_ids, url__isnull=False).values_list('id', 'url')
+        )
+        for record in results:
+            db_id = record.get('db_id')
+            if db_id in url_map:
+                record['url'] = url_map[db_id]
+
+class ActivitiesPaginatedView(DashboardConditionalMixin, APIView):
     """
     Returns paginated Solr records with only *_exact fields, 10 per page.
+
+    Two modes are supported:
+    - page numbers (?page=N&per_page=M), with total count and page metadata;
+    - cursors (?cursor=*, then ?cursor=<next_cursor>), which use Solr's
+      cursorMark with a stable '-start_date, id' sort so every page costs the
+      same however deep it is. The total count is only included with
+      ?include_count=true.
     """
+    etag_params = ('page', 'per_page', 'cursor', 'include_count')
     SOLR_FIELDS_TO_RETRIEVE = [
-        'id', 'db_id', 'url', 'start_date', 'end_date', 'country_exact', 'region_exact', 
+        'id', 'db_id', 'url', 'url_exact', 'start_date', 'end_date', 'country_exact', 'region_exact', 
         'activity_exact', 'objective_exact', 'thematic_exact', 'directorate_exact'
     ]
 
+    @conditional_get
     def get(self, request):
-        try:
-            # 1. Start with a SearchQuerySet to get all documents.
-            #    Using .values() is the key to selecting specific fields.
-            base_sqs = _apply_common_filters(SearchQuerySet().all(), request)
-            all_records_sqs = base_sqs.order_by('-start_date').values(*self.SOLR_FIELDS_TO_RETRIEVE)
+        filters = get_filters(request)
+        if 'cursor' in request.GET:
+            return self.get_cursor_page(request, filters)
 
-            # 2. Get the page number from the request's query parameters.
-            #    Default to page 1 if 'page' is not provided.
-            page_number = request.GET.get('page', 1)
+        # Get the page number and size from the request's query parameters.
+        # Default to page 1 if 'page' is not provided.
+        page_number = request.GET.get('page', 1)
+        page_size = request.GET.get('per_page', 10)
 
-            page_size = request.GET.get('per_page', 10)
-            
-            # 3. Use Django's built-in Paginator.
-            #    It efficiently handles slicing the queryset for the correct page.
-            paginator = Paginator(all_records_sqs, page_size)
-            page_obj = paginator.get_page(page_number)
-
-            # 4. Prepare the data for the JSON response.
-            #    The page_obj.object_list contains a list of dictionaries 
-            #    with the fields we requested.
-            results = list(page_obj.object_list)
-
-            # 5. Fix truncated url values for text_en fields (like 'url')
-            #    .values() on analyzed text_en fields only returns the first token.
-            #    Query the Django model directly using db_id to get the correct URL value.
-            if results:
-                # Collect all db_ids from the results
-                db_ids = [r.get('db_id') for r in results if r.get('db_id')]
-                
-                if db_ids:
-                    # Query the Django model directly to get correct URL values
-                    # This bypasses Solr's tokenized storage and gets the actual value
-                    from .models import Activity
-                    activities = Activity.objects.filter(id__in=db_ids)
-                    url_map = {str(act.id): act.url for act in activities if act.url}
-                    
-                    # Replace truncated url values with correct values from the database
-                    for record in results:
-                        db_id = record.get('db_id')
-                        if db_id and str(db_id) in url_map:
-                            record['url'] = url_map[str(db_id)]
-
-            # 6. Construct a structured JSON response with pagination metadata.
-            response_data = {
-                'count': paginator.count,
-                'total_pages': paginator.num_pages,
-                'current_page': page_obj.number,
-                'next_page': page_obj.next_page_number() if page_obj.has_next() else None,
-                'previous_page': page_obj.previous_page_number() if page_obj.has_previous() else None,
-                'results': results
-            }
-            
-            return Response(response_data)
+        # Pages are not cached, but have their own last-good fallback
+        try:
+            response_data, stale = resilience.serve_page(
+                f'page:{page_number}:{page_size}', filters,
+                lambda: self.get_page(filters, page_number, page_size),
+            )
+            return _result_response(response_data, stale)
 
         except (ValueError, EmptyPage) as e:
             # Handle cases where the page number is not an integer or is out of range.
             return Response({'error': f'Invalid page number: {str(e)}'}, status=400)
-            
+
+        except SolrError as e:
+            return _backend_unavailable(e)
+
         except Exception as e:
-            # Generic error handler for unexpected issues (e.g., Solr connection error).
+            # Generic error handler for unexpected issues.
             return Response({'error': f'An unexpected error occurred: {str(e)}'}, status=500)
 
-class StackedDatasetView(APIView):
-    queryset = SearchQuerySet().all().order_by('-start_date')
+    def get_page(self, filters, page_number, page_size):
+        # 1. Start with a SearchQuerySet to get all documents.
+        #    Using .values() is the key to selecting specific fields.
+        base_sqs = _apply_common_filters(SearchQuerySet().all(), filters)
+        all_records_sqs = base_sqs.order_by('-start_date').values(*self.SOLR_FIELDS_TO_RETRIEVE)
+
+        # 2. Use Django's built-in Paginator.
+        #    It efficiently handles slicing the queryset for the correct page.
+        paginator = Paginator(all_records_sqs, page_size)
+        page_obj = paginator.get_page(page_number)
+
+        # 3. Prepare the data for the JSON response.
+        #    The page_obj.object_list contains a list of dictionaries
+        #    with the fields we requested.
+        results = list(page_obj.object_list)
+
+        # 4. Use the exact (untokenized) url values
+        _fix_urls(results)
+
+        # 5. Construct a structured JSON response with pagination metadata.
+        return {
+            'count': paginator.count,
+            'total_pages': paginator.num_pages,
+            'current_page': page_obj.number,
+            'next_page': page_obj.next_page_number() if page_obj.has_next() else None,
+            'previous_page': page_obj.previous_page_number() if page_obj.has_previous() else None,
+            'results': results
+        }
+
+    def get_cursor_page(self, request, filters):
+        cursor = request.GET.get('cursor') or '*'
+        include_count = request.GET.get('include_count', '').lower() in ('1', 'true', 'yes')
+
+        try:
+            page_size = int(request.GET.get('per_page', 10))
+            if page_size < 1:
+                raise ValueError('per_page must be a positive integer')
+        except ValueError as e:
+            return Response({'error': f'Invalid page size: {str(e)}'}, status=400)
+
+        if not solr.valid_cursor(cursor):
+            return Response({'error': f"Invalid cursor: '{cursor}'"}, status=400)
+
+        try:
+            response_data, stale = resilience.serve_page(
+                f'cursor:{cursor}:{page_size}:{include_count}', filters,
+                lambda: self.build_cursor_page(filters, cursor, page_size, include_count),
+            )
+        except SolrError as e:
+            # Solr rejects cursorMark values it did not hand out with HTTP 400
+            if getattr(e, 'status_code', None) == 400:
+                return Response({'error': f'Invalid cursor: {str(e)}'}, status=400)
+            return _backend_unavailable(e)
+        return _result_response(response_data, stale)
+
+    def build_cursor_page(self, filters, cursor, page_size, include_count):
+        page = solr.cursor_page(filters, cursor, page_size, self.SOLR_FIELDS_TO_RETRIEVE)
+        results = page['results']
+        _fix_urls(results)
+
+        response_data = {
+            'next_cursor': page['next_cursor'],
+            'results': results,
+        }
+        if include_count:
+            response_data['count'] = page['count']
+        return response_data
+
+class ExportActivitiesView(APIView):
+    """
+    Streams every activity matching the dashboard filters as CSV
+    (?output=csv, the default) or newline-delimited JSON (?output=ndjson),
+    gzip-compressed when the client accepts it. Rows are fetched and sent in
+    batches (see activities/export.py), so memory use does not grow with the
+    size of the export.
+    """
+
+    def get(self, request):
+        filters = get_filters(request)
+        output = request.GET.get('output', export.CSV)
+        if output not in export.ENCODERS:
+            return Response(
+                {'error': f"Invalid output '{output}', expected one of: {', '.join(export.ENCODERS)}."},
+                status=400,
+            )
+
+        try:
+            batches = export.activity_batches(filters, export.get_export_source(), prepare=_fix_urls)
+        except (SolrError, IOError) as e:
+            return _backend_unavailable(e)
+
+        content = export.ENCODERS[output](batches)
+        gzipped = re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if gzipped:
+            content = compress_sequence(content)
+
+        response = StreamingHttpResponse(content, content_type=export.CONTENT_TYPES[output])
+        response['Content-Disposition'] = (
+            f'attachment; filename="activities-{date.today().isoformat()}.{output}"'
+        )
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+class StackedDatasetView(DashboardConditionalMixin, APIView):
+    """
+    Returns country x thematic area counts as a Chart.js stacked bar dataset.
+    The counts come straight from a Solr pivot facet (or a grouped database
+    count, see activities/engines.py), so no documents are fetched.
+    """
     permission_classes = [IsAuthenticated]
-    SOLR_FIELDS_TO_RETRIEVE = [
-        'id', 'country_exact', 'thematic_exact'
-    ]
+    PIVOT_FIELDS = ('country_exact_str', 'thematic_exact_str')
 
+    @conditional_get
     def get(self, request):
+        filters = get_filters(request)
         try:
-            # 1. Start with a SearchQuerySet to get all documents.
-            #    Using .values() is the key to selecting specific fields.
-            base_sqs = _apply_common_filters(self.queryset, request)
-            all_records_sqs = base_sqs.values(*self.SOLR_FIELDS_TO_RETRIEVE)
-            # Convert ValuesSearchQuerySet to a list for JSON serialization
-            results = list(all_records_sqs)
-            
-            # 2. Format data for stacked bar chart (countries on y-axis, thematic areas as stacks)
-            #    Group by country and count thematic areas
-            country_thematic_counts = {}
-            all_thematic_areas = set()
-            
-            for record in results:
-                country = record.get('country_exact')
-                thematic = record.get('thematic_exact')
-                
-                # Skip records without required fields
-                if not country or not thematic:
-                    continue
-                
-                # Initialize country entry if needed
-                if country not in country_thematic_counts:
-                    country_thematic_counts[country] = {}
-                
-                # Count thematic areas per country
-                country_thematic_counts[country][thematic] = \
-                    country_thematic_counts[country].get(thematic, 0) + 1
-                
-                # Track all unique thematic areas
-                all_thematic_areas.add(thematic)
-            
-            # 3. Sort countries and thematic areas for consistent ordering
-            sorted_countries = sorted(country_thematic_counts.keys())
-            sorted_thematic_areas = sorted(all_thematic_areas)
-            
-            # 4. Format as Chart.js-compatible structure for stacked bar chart
-            #    labels = countries (y-axis), datasets = thematic areas (stacks)
-            chart_data = {
-                'labels': sorted_countries,
-                'datasets': []
+            chart_data, stale = _cached('stacked', filters, lambda: self.build_chart_data(filters))
+            return _result_response(chart_data, stale)
+        except SolrError as e:
+            return _backend_unavailable(e)
+        except Exception as e:
+            return Response({'error': f'An unexpected error occurred: {str(e)}'}, status=500)
+
+    def build_chart_data(self, filters):
+        # 1. Count thematic areas per country (a Solr pivot facet, or the
+        #    same tree aggregated by the database engine)
+        pivot = get_dashboard_engine().pivot_counts(filters, self.PIVOT_FIELDS)
+        return self.format_chart_data(pivot)
+
+    @staticmethod
+    def format_chart_data(pivot):
+        # 2. Format data for stacked bar chart (countries on y-axis, thematic areas as stacks)
+        country_thematic_counts = {}
+        all_thematic_areas = set()
+
+        for country_bucket in pivot:
+            country = country_bucket.get('value')
+            if not country:
+                continue
+
+            thematic_counts = {
+                bucket['value']: bucket['count']
+                for bucket in country_bucket.get('pivot', [])
+                if bucket.get('value')
+            }
+            if thematic_counts:
+                country_thematic_counts[country] = thematic_counts
+                all_thematic_areas.update(thematic_counts)
+        
+        # 3. Sort countries and thematic areas for consistent ordering
+        sorted_countries = sorted(country_thematic_counts.keys())
+        sorted_thematic_areas = sorted(all_thematic_areas)
+        
+        # 4. Format as Chart.js-compatible structure for stacked bar chart
+        #    labels = countries (y-axis), datasets = thematic areas (stacks)
+        chart_data = {
+            'labels': sorted_countries,
+            'datasets': []
+        }
+        
+        # Create a dataset for each thematic area
+        for thematic_area in sorted_thematic_areas:
+            dataset = {
+                'label': thematic_area,
+                'data': []
             }
             
-            # Create a dataset for each thematic area
-            for thematic_area in sorted_thematic_areas:
-                dataset = {
-                    'label': thematic_area,
-                    'data': []
-                }
-                
-                # For each country, add the count for this thematic area (0 if none)
-                for country in sorted_countries:
-                    count = country_thematic_counts[country].get(thematic_area, 0)
-                    dataset['data'].append(count)
-                
-                chart_data['datasets'].append(dataset)
+            # For each country, add the count for this thematic area (0 if none)
+            for country in sorted_countries:
+                count = country_thematic_counts[country].get(thematic_area, 0)
+                dataset['data'].append(count)
             
-            return Response(chart_data)
-        except Exception as e:
-            return Response({'error': f'An unexpected error occurred: {str(e)}'}, status=500)
+            chart_data['datasets'].append(dataset)
+        
+        return chart_data
 
-class ActivityById(RetrieveAPIView):
+class ActivityById(ConditionalMixin, RetrieveAPIView):
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticated]
 
+    def updated_at(self, db_id):
+        # One primary key lookup of a single column instead of the full row
+        if not hasattr(self, '_updated_at'):
+            self._updated_at = (Activity.objects.filter(pk=db_id)
+                                .values_list('updated_at', flat=True).first())
+        return self._updated_at
+
+    def get_etag(self, request, db_id):
+        # Sub-second precision, so two saves within a second differ
+        updated_at = self.updated_at(db_id)
+        return make_etag('activity', db_id, updated_at) if updated_at is not None else None
+
+    def get_last_modified(self, request, db_id):
+        updated_at = self.updated_at(db_id)
+        return int(updated_at.timestamp()) if updated_at is not None else None
+
+    @conditional_get
     def get(self, request, db_id):
 
         single_activity = get_object_or_404(Activity, pk=db_id)
@@ -336,6 +490,11 @@ class UpdateActivity(UpdateAPIView):
     lookup_field = 'id'
     lookup_url_kwarg = 'db_id'
 
+    def perform_update(self, serializer):
+        # Keep the row and its index outbox entry in one transaction
+        with transaction.atomic():
+            serializer.save()
+
 class DeleteActivity(DestroyAPIView):
     """
     Handles DELETE requests to delete a single Activity instance.
@@ -346,12 +505,27 @@ class DeleteActivity(DestroyAPIView):
     lookup_field = 'id'
     lookup_url_kwarg = 'db_id'
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
+class IndexOutboxStatsView(APIView):
+    """
+    Returns the search index outbox depth and lag (seconds since the oldest
+    pending change) for monitoring.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(IndexOutboxEntry.objects.stats())
+
 # class ActivityCSVUploadView(APIView):
 class BulkUploadActivitiesView(APIView):
     """
     Upload a CSV file and import rows into the Activity model.
-    Uses pandas for robust parsing, handles encodings automatically,
-    and returns a detailed summary of the import process.
+    The file is stored and processed by a background job (see
+    activities/jobs.py); the response is 202 Accepted with the job id and
+    the URL to poll for rows parsed, inserted, invalid and indexed.
     """
     parser_classes = [MultiPartParser, FormParser]
 
@@ -368,145 +542,21 @@ class BulkUploadActivitiesView(APIView):
                             status=status.HTTP_400_BAD_REQUEST)
         
 
-        try:
-            # ------------------------------------------------------------------
-            # 🔍 Step 1: Detect file encoding using chardet
-            # ------------------------------------------------------------------
-            raw_bytes = file.read()
-            detected = chardet.detect(raw_bytes)
-            encoding = detected.get("encoding", "utf-8") or "utf-8"
-            file.seek(0)
-
-            # ------------------------------------------------------------------
-            # 📖 Step 2: Try reading CSV using pandas
-            # ------------------------------------------------------------------
-            try:
-                df = pd.read_csv(file, encoding=encoding, dtype=str, keep_default_na=False)
-                                                 
-            except UnicodeDecodeError:
-                
-                # fallback encodings for Excel / Windows CSVs
-                file.seek(0)
-                df = pd.read_csv(file, encoding="cp1252", dtype=str, keep_default_na=False)
-                encoding = "cp1252"
-            except Exception as e:
-                return Response(
-                    {"error": f"Unable to read CSV: {str(e)}"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # ------------------------------------------------------------------
-            # 🧹 Step 3: Normalize DataFrame
-            # ------------------------------------------------------------------
-            # Strip whitespace and replace fancy quotes
-            df = df.applymap(lambda x: str(x).strip()
-                             .replace('\u2019', "'")
-                             .replace('\u201c', '"')
-                             .replace('\u201d', '"')
-                             if isinstance(x, str) else x)
-
-            # Optional: normalize column names to lowercase
-            df.columns = [c.strip().lower() for c in df.columns]
-
-            # Optional: auto-map alternate column names (if needed)
-            column_map = {
-                'start': 'start_date',
-                'startdate': 'start_date',
-                'end': 'end_date',
-                'enddate': 'end_date',
-                'country name': 'country',
-                'activity name': 'activity',
-            }
-            df.rename(columns=column_map, inplace=True)
-
-            # ------------------------------------------------------------------
-            # 🧩 Step 4: Parse rows into Activity objects
-            # ------------------------------------------------------------------
-            activities = []
-            invalid_rows = []
-            skipped_rows = 0
-
-            def parse_date(value, row_num, field):
-                if not value:
-                    return None
-                for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y"):
-                    try:
-                        return datetime.strptime(value.strip(), fmt).date()
-                    except ValueError:
-                        continue
-                invalid_rows.append(
-                    f"Row {row_num}: invalid {field} '{value}'")
-                return None
-
-            for i, row in df.iterrows():
-                row_num = i + 2  # header is row 1
-                try:
-                    print(row.get('country'), row_num)
-                    start_date = parse_date(row.get('start_date'), row_num, 'start_date')
-                    end_date = parse_date(row.get('end_date'), row_num, 'end_date')
-                    country = row.get('country', '').strip()
-                    region = row.get('region', '').strip()
-                    activity_name = row.get('activity', '').strip()
-
-                    if not activity_name or not country:
-                        skipped_rows += 1
-                        continue
-
-                    activities.append(Activity(
-                        start_date=start_date,
-                        end_date=end_date,
-                        country=country,
-                        region=region,
-                        activity=activity_name,
-                        objective=row.get('objective', '').strip(),
-                        thematic=row.get('thematic', '').strip(),
-                        directorate=row.get('directorate', '').strip(),
-                        url=row.get('url', '').strip(),
-                    ))
-                except Exception as e:
-                    invalid_rows.append(f"Row {row_num}: {str(e)}")
-
-            # ------------------------------------------------------------------
-            # 💾 Step 5: Bulk insert inside atomic transaction
-            # ------------------------------------------------------------------
-            existing_max_id = Activity.objects.aggregate(max_id=Max('id'))['max_id'] or 0
-
-            with transaction.atomic():
-                created = Activity.objects.bulk_create(
-                    activities, ignore_conflicts=True
-                )
-
-                if activities:
-                    def reindex_on_commit():
-                        backend = connections['default'].get_backend()
-                        index = connections['default'].get_unified_index().get_index(Activity)
-                        new_instances = list(Activity.objects.filter(id__gt=existing_max_id))
-                        if new_instances:
-                            backend.update(index, new_instances)
-
-                    transaction.on_commit(reindex_on_commit)
-
-            imported_count = len(created)
-
-            # ------------------------------------------------------------------
-            # 📊 Step 6: Build and return summary
-            # ------------------------------------------------------------------
-            summary = {
-                "message": "Upload complete.",
-                "imported": imported_count,
-                "skipped": skipped_rows,
-                "invalid_rows": invalid_rows,
-                "encoding_used": encoding,
-                "total_rows": len(df),
-            }
-            # ✅ Trigger partial reindex of just these records
-            # backend = connections['default'].get_backend()
-            # backend.update(Activity, created)
+        job = submit_upload(file)
+        status_url = reverse('upload_job', kwargs={'job_id': job.pk})
+        return Response(
+            {"job_id": str(job.pk), "status": job.status, "status_url": status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url},
+        )
 
-            return Response(summary, status=status.HTTP_201_CREATED)
 
-        except Exception as e:
-            return Response(
-                {"error": f"Unexpected error: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+class UploadJobStatusView(APIView):
+    """
+    Progress and outcome of a bulk upload job.
+    """
+    def get(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return Response({"detail": "Upload job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UploadJobSerializer(job).data)
@@ -0,0 +1,17 @@
+"""
+Load tests and micro-benchmarks of the dashboard API, bulk upload and
+reindex, runnable without Solr or MySQL.
+
+    python -m benchmarks                         # 1k and 10k activities, every scenario
+    python -m benchmarks --sizes 1000,100000 --scenarios summary,async-summary --concurrency 8
+    python -m benchmarks --list
+    python -m benchmarks.compare benchmarks/results/before.json benchmarks/results/after.json
+
+For each corpus size a child process migrates a throwaway SQLite database
+(or --database mysql), loads a synthetic corpus following the
+distributions of resources/au-data-test.csv (activities/synthetic.py), indexes it into an
+in-process fake Solr (benchmarks/fake_solr.py, or a real core with
+--solr-url) and runs the scenarios of benchmarks/scenarios.py. p50/p95/p99
+latency, throughput and peak RSS per scenario are printed and saved as JSON
+under benchmarks/results/ for comparing runs.
+"""
@@ -0,0 +1,88 @@
+"""
+Compare two benchmark result files.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 5]
+
+Prints, for every (size, scenario) present in both, the baseline and
+candidate p50/p99 latency and throughput with the relative change. Changes
+beyond the threshold (percent) are marked: '+' better, '-' worse.
+"""
+import argparse
+import json
+import sys
+
+# (result key, label, whether higher is better)
+METRICS = (
+    ('p50_ms', 'p50 ms', False),
+    ('p99_ms', 'p99 ms', False),
+    ('throughput_rps', 'req/s', True),
+    ('peak_rss_bytes', 'peak RSS MB', False),
+)
+
+def load(path):
+    with open(path) as file:
+        data = json.load(file)
+    return {
+        (run['size'], name): stats
+        for run in data['runs']
+        for name, stats in run['scenarios'].items()
+    }
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+def _format(key, value):
+    if value is None:
+        return '-'
+    if key == 'peak_rss_bytes':
+        return '%.1f' % (value / 2 ** 20)
+    return '%.2f' % value
+
+def compare(baseline, candidate, threshold=5.0, file=sys.stdout):
+    """
+    Print the comparison table; returns the number of regressions.
+    """
+    regressions = 0
+    header = f"{'size':>9}  {'scenario':<28}"
+    for _, label, _ in METRICS:
+        header += f" {label:>25}"
+    print(header, file=file)
+    for key in sorted(baseline.keys() & candidate.keys()):
+        size, name = key
+        line = f"{size:>9}  {name:<28}"
+        for metric, _, higher_is_better in METRICS:
+            before, after = baseline[key].get(metric), candidate[key].get(metric)
+            delta = change(before, after)
+            mark = ' '
+            if delta is not None and abs(delta) >= threshold:
+                better = (delta > 0) == higher_is_better
+                mark = '+' if better else '-'
+                regressions += not better
+            cell = f"{_format(metric, before)} -> {_format(metric, after)}"
+            if delta is not None:
+                cell += f" {delta:+.0f}%{mark}"
+            line += f" {cell:>25}"
+        print(line, file=file)
+
+    for key in sorted(baseline.keys() - candidate.keys()):
+        print(f"{key[0]:>9}  {key[1]:<28} only in the baseline", file=file)
+    for key in sorted(candidate.keys() - baseline.keys()):
+        print(f"{key[0]:>9}  {key[1]:<28} only in the candidate", file=file)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare',
+                                     description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help='Percent change marked as better or worse.')
+    options = parser.parse_args(argv)
+    compare(load(options.baseline), load(options.candidate), options.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,617 @@
+"""
+In-process stand-in for the eyeview_activities Solr core.
+
+FakeSolr serves, over real HTTP on a local port, the subset of Solr the
+project uses: select with fq (plain, {!terms} and {!tag} local params, date
+ranges with date math), rows/start/sort/fl, cursorMark, facet.field (with
+{!ex} exclusions), facet.range over dates (with facet.range.other),
+facet.pivot and min/max stats; XML add/delete/commit updates as sent by
+pysolr; and the ping and Schema API calls of
+`manage.py reindex_activities --ensure-schema`. Documents are kept in
+memory and are searchable as soon as they are added.
+
+It is meant for measuring the Django side (request handling, pysolr/httpx
+round trips, parsing, caching) without a JVM, not for measuring Solr: every
+query is a scan over all documents. Add a fixed delay per request with
+latency to mimic a remote Solr.
+
+    with FakeSolr(latency=0.005) as solr:
+        settings.HAYSTACK_CONNECTIONS['default']['URL'] = solr.url
+"""
+import base64
+import json
+import re
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from xml.etree import ElementTree
+
+# Field types that are not strings, as declared in schema.xml. Dates are kept
+# as Solr's ISO 8601 strings, which sort and compare chronologically.
+LONG_FIELDS = {'db_id'}
+
+# The core's managed schema copies string fields into docValues *_str fields,
+# which the dashboard filters and facets on; they are not stored.
+COPIED_FIELDS = re.compile(r'_exact$')
+COPY_SUFFIX = '_str'
+
+SOLR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+LOCAL_PARAMS_RE = re.compile(r'^\{!([^}]*)\}(.*)$', re.S)
+RANGE_RE = re.compile(r'^(\w+):([\[{])(\S+) TO (\S+?)([\]}])$')
+FIELD_RE = re.compile(r'^(\w+):(.+)$', re.S)
+TERM_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|([^\s()]+)')
+DATE_MATH_RE = re.compile(r'([+-])(\d+)(YEARS?|MONTHS?|DAYS?|HOURS?|MINUTES?|SECONDS?)|/(YEAR|MONTH|DAY|HOUR)')
+DATE_PREFIX_RE = re.compile(r'^(NOW|\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z)')
+CURSOR_PREFIX = 'fake:'
+
+
+class SolrRequestError(Exception):
+    """
+    A request Solr would reject with HTTP 400.
+    """
+
+
+def _add_months(value, months):
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    days = [31, 29 if year % 4 == 0 and (year % 100 or year % 400 == 0) else 28,
+            31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1]
+    return value.replace(year=year, month=month, day=min(value.day, days))
+
+def date_math(expression):
+    """
+    Evaluate a Solr date or date math expression ('NOW/YEAR+1YEAR',
+    '2020-01-01T00:00:00Z+1DAY') to a naive UTC datetime.
+    """
+    match = DATE_PREFIX_RE.match(expression)
+    if not match:
+        raise SolrRequestError("Invalid Date String:'%s'" % expression)
+    base = match.group(1)
+    if base == 'NOW':
+        value = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    else:
+        value = datetime.strptime(base.split('.')[0].rstrip('Z'), '%Y-%m-%dT%H:%M:%S')
+
+    rest = expression[match.end():]
+    position = 0
+    for op in DATE_MATH_RE.finditer(rest):
+        if op.start() != position:
+            break
+        position = op.end()
+        if op.group(4):
+            unit = op.group(4)
+            value = value.replace(microsecond=0, second=0)
+            if unit in ('DAY', 'MONTH', 'YEAR'):
+                value = value.replace(minute=0, hour=0)
+            if unit in ('MONTH', 'YEAR'):
+                value = value.replace(day=1)
+            if unit == 'YEAR':
+                value = value.replace(month=1)
+            continue
+        amount = int(op.group(2)) * (1 if op.group(1) == '+' else -1)
+        unit = op.group(3).rstrip('S')
+        if unit == 'YEAR':
+            value = _add_months(value, 12 * amount)
+        elif unit == 'MONTH':
+            value = _add_months(value, amount)
+        else:
+            value += timedelta(**{unit.lower() + 's': amount})
+    if position != len(rest):
+        raise SolrRequestError("Invalid Date Math String:'%s'" % expression)
+    return value
+
+def format_date(value):
+    return value.strftime(SOLR_DATE_FORMAT)
+
+def _bound(value):
+    """
+    A range bound as a comparable value: a date math expression becomes an
+    ISO string, a number an int, '*' None.
+    """
+    if value == '*':
+        return None
+    if re.match(r'^-?\d+$', value):
+        return int(value)
+    return format_date(date_math(value))
+
+def _unescape(value):
+    return re.sub(r'\\(.)', r'\1', value)
+
+def _values(doc, field):
+    value = doc.get(field)
+    if value is None:
+        return ()
+    return value if isinstance(value, list) else (value,)
+
+def parse_local_params(text):
+    """
+    Split '{!terms tag=a,b f=field}body' into ({'type': 'terms', 'tag': 'a,b',
+    'f': 'field'}, 'body'); text without local params gives ({}, text).
+    """
+    match = LOCAL_PARAMS_RE.match(text)
+    if not match:
+        return {}, text
+    params = {}
+    for word in match.group(1).split():
+        if '=' in word:
+            name, value = word.split('=', 1)
+            params[name] = value.strip('\'"')
+        else:
+            params['type'] = word
+    return params, match.group(2)
+
+def parse_query(text):
+    """
+    Compile the query syntax the project sends ('*:*', 'field:value',
+    'field:("a" OR "b")', 'field:[a TO b}' and the terms parser) into a
+    predicate over documents.
+    """
+    params, body = parse_local_params(text.strip())
+    if params.get('type') == 'terms':
+        field = params.get('f')
+        if not field:
+            raise SolrRequestError("Missing required parameter: f")
+        wanted = set(body.split(params.get('separator', ',')))
+        return lambda doc: any(str(value) in wanted for value in _values(doc, field))
+
+    body = body.strip()
+    if body in ('*:*', ''):
+        return lambda doc: True
+
+    match = RANGE_RE.match(body)
+    if match:
+        field, low_bracket, low, high, high_bracket = match.groups()
+        low, high = _bound(low), _bound(high)
+
+        def in_range(doc):
+            for value in _values(doc, field):
+                if low is not None and (value < low or (low_bracket == '{' and value == low)):
+                    continue
+                if high is not None and (value > high or (high_bracket == '}' and value == high)):
+                    continue
+                return True
+            return False
+        return in_range
+
+    match = FIELD_RE.match(body)
+    if not match:
+        raise SolrRequestError("Unsupported query syntax: %s" % text)
+    field, value = match.groups()
+    if value.startswith('(') and value.endswith(')'):
+        value = value[1:-1]
+    wanted = {
+        _unescape(phrase if phrase else token)
+        for phrase, token in TERM_RE.findall(value)
+        if phrase or token not in ('OR', '||')
+    }
+    return lambda doc: any(str(value) in wanted for value in _values(doc, field))
+
+
+class Params:
+    """
+    Multi-valued request parameters.
+    """
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def get(self, name, default=None):
+        for key, value in self.pairs:
+            if key == name:
+                return value
+        return default
+
+    def getlist(self, name):
+        return [value for key, value in self.pairs if key == name]
+
+    def get_int(self, name, default):
+        value = self.get(name)
+        try:
+            return default if value is None else int(value)
+        except ValueError:
+            raise SolrRequestError("Invalid Number: %s" % value)
+
+    def field_param(self, field, name, default=None):
+        """
+        A per-field facet parameter (f.<field>.<name>) or its global value.
+        """
+        return self.get('f.%s.%s' % (field, name), self.get(name, default))
+
+    def as_dict(self):
+        result = {}
+        for key, value in self.pairs:
+            if key in result:
+                result[key] = (result[key] if isinstance(result[key], list) else [result[key]]) + [value]
+            else:
+                result[key] = value
+        return result
+
+
+class FakeSolrIndex:
+    """
+    The documents of the core, by uniqueKey, and the queries over them.
+    """
+
+    def __init__(self):
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, docs):
+        with self._lock:
+            for doc in docs:
+                self._docs[doc['id']] = doc
+
+    def delete(self, ids=(), queries=()):
+        predicates = [parse_query(query) for query in queries]
+        with self._lock:
+            for doc_id in ids:
+                self._docs.pop(doc_id, None)
+            if predicates:
+                for doc_id in [doc_id for doc_id, doc in self._docs.items()
+                               if any(predicate(doc) for predicate in predicates)]:
+                    del self._docs[doc_id]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._docs.values())
+
+    def select(self, params):
+        """
+        Answer a select request, returning the decoded JSON response.
+        """
+        started = time.perf_counter()
+        docs = self.snapshot()
+        matches_q = parse_query(params.get('q', '*:*'))
+        filters = []
+        for fq in params.getlist('fq'):
+            local_params, _ = parse_local_params(fq)
+            tags = set(filter(None, local_params.get('tag', '').split(',')))
+            filters.append((tags, parse_query(fq)))
+
+        def matching(excluded_tags=()):
+            active = [predicate for tags, predicate in filters if not tags & set(excluded_tags)]
+            return [doc for doc in docs if matches_q(doc) and all(predicate(doc) for predicate in active)]
+
+        found = matching()
+        response = {'numFound': len(found), 'start': 0, 'numFoundExact': True, 'docs': []}
+        result = {'responseHeader': {'status': 0, 'QTime': 0, 'params': params.as_dict()},
+                  'response': response}
+
+        found = self.sort(found, params.get('sort'))
+        rows = params.get_int('rows', 10)
+        cursor = params.get('cursorMark')
+        if cursor is not None:
+            if 'id' not in (params.get('sort') or ''):
+                raise SolrRequestError("Cursor functionality requires a sort containing a uniqueKey "
+                                       "field tie breaker")
+            start = self.decode_cursor(cursor)
+            page = found[start:start + rows]
+            result['nextCursorMark'] = self.encode_cursor(start + len(page)) if page else cursor
+        else:
+            start = params.get_int('start', 0)
+            response['start'] = start
+            page = found[start:start + rows]
+        response['docs'] = [self.project(doc, params.get('fl')) for doc in page]
+
+        if params.get('facet') == 'true':
+            result['facet_counts'] = self.facet_counts(params, found, matching)
+        if params.get('stats') == 'true':
+            result['stats'] = self.stats(params, found)
+
+        result['responseHeader']['QTime'] = int((time.perf_counter() - started) * 1000)
+        return result
+
+    @staticmethod
+    def sort(docs, spec):
+        """
+        Sort docs by a Solr sort spec ('start_date desc,id asc'); documents
+        missing a sort field go last either way.
+        """
+        if not spec:
+            return docs
+        clauses = [clause.split() for clause in spec.split(',') if clause.strip()]
+        for clause in reversed(clauses):
+            if len(clause) != 2 or clause[1] not in ('asc', 'desc'):
+                raise SolrRequestError("Can't determine a Sort Order (asc or desc) in sort spec '%s'" % spec)
+            field, direction = clause
+            if field == 'score':
+                continue
+            present = [doc for doc in docs if doc.get(field) is not None]
+            missing = [doc for doc in docs if doc.get(field) is None]
+            present.sort(key=lambda doc: doc[field], reverse=direction == 'desc')
+            docs = present + missing
+        return docs
+
+    @staticmethod
+    def encode_cursor(offset):
+        return base64.urlsafe_b64encode(('%s%d' % (CURSOR_PREFIX, offset)).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if cursor == '*':
+            return 0
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode()).decode()
+            if value.startswith(CURSOR_PREFIX):
+                return int(value[len(CURSOR_PREFIX):])
+        except (ValueError, UnicodeDecodeError):
+            pass
+        raise SolrRequestError("Unable to parse 'cursorMark' after totem: value must either be '*' "
+                               "or the 'nextCursorMark' returned by a previous search: %s" % cursor)
+
+    @staticmethod
+    def project(doc, fl):
+        names = [name for name in re.split(r'[\s,]+', fl or '*') if name]
+        if '*' in names:
+            projected = {name: value for name, value in doc.items()
+                         if not (name.endswith(COPY_SUFFIX) and COPIED_FIELDS.search(name[:-len(COPY_SUFFIX)]))}
+        else:
+            projected = {name: doc[name] for name in names if name in doc}
+        if 'score' in names:
+            projected['score'] = 1.0
+        return projected
+
+    @staticmethod
+    def stats(params, found):
+        """
+        min/max/count of each stats.field (local params select nothing: all
+        three are always returned).
+        """
+        fields = {}
+        for spec in params.getlist('stats.field'):
+            _, field = parse_local_params(spec)
+            values = [value for doc in found for value in _values(doc, field)]
+            fields[field] = {'min': min(values, default=None), 'max': max(values, default=None),
+                             'count': len(values)}
+        return {'stats_fields': fields}
+
+    def facet_counts(self, params, found, matching):
+        facets = {'facet_queries': {}, 'facet_fields': {}, 'facet_ranges': {},
+                  'facet_intervals': {}, 'facet_heatmaps': {}, 'facet_pivot': {}}
+
+        for spec in params.getlist('facet.field'):
+            local_params, field = parse_local_params(spec)
+            docs = matching(local_params['ex'].split(',')) if 'ex' in local_params else found
+            counts = Counter(value for doc in docs for value in _values(doc, field))
+            mincount = int(params.field_param(field, 'facet.mincount', 0))
+            if mincount == 0:
+                for doc in self.snapshot():
+                    for value in _values(doc, field):
+                        counts.setdefault(value, 0)
+            items = [(value, count) for value, count in counts.items() if count >= mincount]
+            if params.field_param(field, 'facet.sort', 'count') == 'index':
+                items.sort(key=lambda item: item[0])
+            else:
+                items.sort(key=lambda item: (-item[1], item[0]))
+            limit = int(params.field_param(field, 'facet.limit', 100))
+            if limit >= 0:
+                items = items[:limit]
+            facets['facet_fields'][local_params.get('key', field)] = [x for item in items for x in item]
+
+        for spec in params.getlist('facet.range'):
+            local_params, field = parse_local_params(spec)
+            docs = matching(local_params['ex'].split(',')) if 'ex' in local_params else found
+            facets['facet_ranges'][field] = self.range_counts(params, field, docs)
+
+        for spec in params.getlist('facet.pivot'):
+            local_params, fields = parse_local_params(spec)
+            docs = matching(local_params['ex'].split(',')) if 'ex' in local_params else found
+            fields = fields.split(',')
+            facets['facet_pivot'][','.join(fields)] = self.pivot(params, fields, docs)
+        return facets
+
+    @staticmethod
+    def range_counts(params, field, docs):
+        start = params.field_param(field, 'facet.range.start')
+        end = params.field_param(field, 'facet.range.end')
+        gap = params.field_param(field, 'facet.range.gap')
+        if not (start and end and gap):
+            raise SolrRequestError("Missing required parameter: f.%s.facet.range.start/end/gap" % field)
+        mincount = int(params.field_param(field, 'facet.mincount', 0))
+
+        lower, upper = date_math(start), date_math(end)
+        if upper < lower:
+            raise SolrRequestError("range facet 'end' comes before 'start': %s < %s" % (end, start))
+        bounds = [format_date(lower)]
+        while lower < upper:
+            following = date_math(format_date(lower) + gap)
+            if following <= lower:
+                raise SolrRequestError("range facet infinite loop (is gap negative?)")
+            lower = following
+            bounds.append(format_date(lower))
+        counts = [0] * (len(bounds) - 1)
+        before = after = 0
+        for doc in docs:
+            for value in _values(doc, field):
+                position = bisect_right(bounds, value) - 1
+                if 0 <= position < len(counts):
+                    counts[position] += 1
+                elif position < 0:
+                    before += 1
+                else:
+                    after += 1
+        flat = []
+        for bucket, count in zip(bounds, counts):
+            if count >= mincount:
+                flat += [bucket, count]
+        result = {'counts': flat, 'gap': gap, 'start': bounds[0], 'end': bounds[-1]}
+        # facet.range.other: counts before the first and from the end of the last bucket
+        other = set(params.getlist('f.%s.facet.range.other' % field) or params.getlist('facet.range.other'))
+        if other & {'before', 'all'}:
+            result['before'] = before
+        if other & {'after', 'all'}:
+            result['after'] = after
+        return result
+
+    def pivot(self, params, fields, docs):
+        field, rest = fields[0], fields[1:]
+        groups = {}
+        for doc in docs:
+            for value in _values(doc, field):
+                groups.setdefault(value, []).append(doc)
+        mincount = int(params.field_param(field, 'facet.pivot.mincount', params.get('facet.mincount', 1)))
+        items = sorted(((value, group) for value, group in groups.items() if len(group) >= mincount),
+                       key=lambda item: (-len(item[1]), item[0]))
+        limit = int(params.field_param(field, 'facet.limit', 100))
+        if limit >= 0:
+            items = items[:limit]
+        tree = []
+        for value, group in items:
+            entry = {'field': field, 'value': value, 'count': len(group)}
+            if rest:
+                entry['pivot'] = self.pivot(params, rest, group)
+            tree.append(entry)
+        return tree
+
+    def update(self, body, content_type):
+        """
+        Apply an XML update message (add, delete, commit, optimize).
+        """
+        if 'json' in (content_type or ''):
+            message = json.loads(body or b'[]')
+            if isinstance(message, list):
+                self.add([self.prepare(doc) for doc in message])
+                return
+            raise SolrRequestError("Only JSON arrays of documents are supported")
+        if not body:
+            return
+        try:
+            root = ElementTree.fromstring(body)
+        except ElementTree.ParseError as e:
+            raise SolrRequestError("Invalid XML update message: %s" % e)
+        if root.tag == 'add':
+            docs = []
+            for element in root.iter('doc'):
+                doc = {}
+                for field in element.iter('field'):
+                    name, value = field.get('name'), field.text or ''
+                    if name in doc:
+                        doc[name] = (doc[name] if isinstance(doc[name], list) else [doc[name]]) + [value]
+                    else:
+                        doc[name] = value
+                docs.append(self.prepare(doc))
+            self.add(docs)
+        elif root.tag == 'delete':
+            self.delete(ids=[element.text for element in root.iter('id')],
+                        queries=[element.text for element in root.iter('query')])
+        elif root.tag not in ('commit', 'optimize', 'rollback'):
+            raise SolrRequestError("Unexpected tag <%s> in update message" % root.tag)
+
+    @staticmethod
+    def prepare(doc):
+        if 'id' not in doc:
+            raise SolrRequestError("Document is missing mandatory uniqueKey field: id")
+        for name in LONG_FIELDS & set(doc):
+            doc[name] = [int(v) for v in doc[name]] if isinstance(doc[name], list) else int(doc[name])
+        for name in [name for name in doc if COPIED_FIELDS.search(name)]:
+            doc[name + COPY_SUFFIX] = doc[name]
+        return doc
+
+
+class FakeSolrHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled sessions reuse connections as with Solr's Jetty
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without TCP_NODELAY delayed ACKs
+    # add ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.handle_request(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.handle_request(self.rfile.read(length) if length else b'')
+
+    def handle_request(self, body):
+        solr = self.server.solr
+        url = urlsplit(self.path)
+        prefix = '/solr/%s/' % solr.core
+        if not url.path.startswith(prefix):
+            return self.send_json(404, {'error': {'msg': 'Core not found', 'code': 404}})
+        handler = url.path[len(prefix):].strip('/')
+        content_type = self.headers.get('Content-Type', '')
+        pairs = parse_qsl(url.query, keep_blank_values=True)
+        if body and content_type.startswith('application/x-www-form-urlencoded'):
+            pairs += parse_qsl(body.decode('utf-8'), keep_blank_values=True)
+            body = b''
+        params = Params(pairs)
+
+        if solr.latency:
+            time.sleep(solr.latency)
+        try:
+            if handler == 'select':
+                return self.send_json(200, solr.index.select(params))
+            if handler == 'update':
+                started = time.perf_counter()
+                solr.index.update(body, content_type)
+                return self.send_json(200, {'responseHeader': {
+                    'status': 0, 'QTime': int((time.perf_counter() - started) * 1000)}})
+            if handler == 'admin/ping':
+                return self.send_json(200, {'responseHeader': {'status': 0, 'QTime': 0}, 'status': 'OK'})
+            if handler == 'schema' or handler.startswith('schema/fields/'):
+                # Every field the project adds through the Schema API exists already
+                return self.send_json(200, {'responseHeader': {'status': 0, 'QTime': 0},
+                                            'field': {'name': handler.rsplit('/', 1)[-1]}})
+        except SolrRequestError as e:
+            return self.send_json(400, {'responseHeader': {'status': 400, 'QTime': 0},
+                                        'error': {'msg': str(e), 'code': 400}})
+        self.send_json(404, {'error': {'msg': 'Unknown handler: /%s' % handler, 'code': 404}})
+
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSolr:
+    """
+    A FakeSolrIndex served on a local port from a background thread.
+    """
+
+    def __init__(self, core='eyeview_activities', host='127.0.0.1', port=0, latency=0.0):
+        self.core = core
+        self.latency = latency
+        self.index = FakeSolrIndex()
+        self.server = ThreadingHTTPServer((host, port), FakeSolrHandler)
+        self.server.daemon_threads = True
+        self.server.solr = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d/solr/%s' % (host, port, self.core)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-solr', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
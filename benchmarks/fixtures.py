@@ -0,0 +1,60 @@
+"""
+Benchmark corpora.
+
+Corpora are generated by activities/synthetic.py from the distributions of
+resources/au-data-test.csv with a fixed seed, so a corpus of a given size
+is identical across runs.
+"""
+from django.db import transaction
+from django.db.models import Count
+from haystack import connections
+
+from activities.cache import bump_index_generation
+from activities.indexing import reindex_queryset
+from activities.ingest import truncate_activities
+from activities.models import Activity, IndexOutboxEntry
+from activities.synthetic import ActivityDistribution, insert_activities
+from activities.synthetic import write_csv as write_rows
+
+_distribution = None
+
+def get_distribution():
+    global _distribution
+    if _distribution is None:
+        _distribution = ActivityDistribution.from_csv()
+    return _distribution
+
+def load_activities(count, seed=0, batch_size=5000):
+    """
+    Replace every activity with a generated corpus of count rows.
+    """
+    with transaction.atomic():
+        truncate_activities()
+        IndexOutboxEntry.objects.all().delete()
+    return insert_activities(get_distribution().activities(count, seed), batch_size=batch_size)
+
+def index_activities(batch_size=1000, using='default'):
+    """
+    Replace the Activity documents in Solr with the current table.
+    """
+    connections[using].get_backend().clear(models=[Activity], commit=False)
+    total = reindex_queryset(Activity.objects.all(), batch_size=batch_size, using=using)
+    bump_index_generation()
+    return total
+
+def write_csv(path, count, seed=0, first=0):
+    """
+    Write count generated activities, numbered from first, to path in the
+    bulk upload format.
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        write_rows(out, get_distribution().rows(count, seed, first))
+    return path
+
+def most_common(field):
+    """
+    The most frequent value of an Activity field, for filtered scenarios.
+    """
+    row = (Activity.objects.values(field).annotate(total=Count('id'))
+           .order_by('-total', field).first())
+    return row[field] if row else ''
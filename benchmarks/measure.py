@@ -0,0 +1,106 @@
+"""
+Latency percentiles, throughput and memory measurements.
+"""
+import os
+import resource
+import sys
+import threading
+
+# Seconds between resident set size samples while a scenario runs
+RSS_SAMPLE_INTERVAL = 0.005
+
+def percentile(sorted_values, fraction):
+    """
+    The fraction (0-1) percentile of sorted values, interpolating linearly
+    between the closest ranks like numpy's default.
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def summarize(latencies, wall_time, errors=0):
+    """
+    Summarize the latencies (seconds) of the requests made during wall_time
+    seconds: p50/p95/p99 and friends in milliseconds, and requests per second.
+    """
+    values = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'min_ms': ms(values[0] if values else None),
+        'mean_ms': ms(sum(values) / len(values) if values else None),
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1] if values else None),
+        'wall_s': round(wall_time, 3),
+        'throughput_rps': round(len(values) / wall_time, 2) if wall_time else None,
+    }
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, or None where /proc is not
+    available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss():
+    """
+    Peak resident set size of this process since it started, in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakRSS:
+    """
+    Track the peak resident set size while the block runs by sampling it
+    from a background thread. Falls back to the process-wide peak where the
+    current RSS cannot be read.
+
+        with PeakRSS() as rss:
+            ...
+        rss.peak
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._record(current_rss())
+
+    def _record(self, rss):
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def __enter__(self):
+        self.start = current_rss()
+        self._record(self.start)
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._record(current_rss())
+        else:
+            self.peak = max_rss()
@@ -0,0 +1,353 @@
+"""
+Run the benchmark scenarios at several corpus sizes and save the results.
+
+Each corpus size runs in a fresh child process (with its own database,
+in-process fake Solr and caches), so that peak RSS and warm caches of one
+size do not leak into the next. The parent collects the children's results
+into one JSON file.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .fake_solr import FakeSolr
+from .measure import PeakRSS, max_rss, summarize
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE_DIR / 'benchmarks' / 'results'
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Latency, throughput and memory benchmarks of the dashboard, upload and reindex.',
+    )
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='Comma-separated corpus sizes (activities), one child process each.')
+    parser.add_argument('--scenarios', default='',
+                        help="Comma-separated scenario names, 'async-*' style prefixes allowed (default: all).")
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Timed requests per endpoint scenario.')
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='Untimed requests before each endpoint scenario.')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Clients sending requests at once in endpoint scenarios.')
+    parser.add_argument('--cache', choices=('cold', 'warm'), default='cold',
+                        help='cold: invalidate the result cache before every request; '
+                             'warm: let repeated requests hit it.')
+    parser.add_argument('--engine', choices=('auto', 'solr', 'database', 'summary'),
+                        help='ACTIVITIES_DASHBOARD_ENGINE to benchmark (default: the settings).')
+    parser.add_argument('--database', choices=('sqlite', 'mysql'), default='sqlite',
+                        help='sqlite: a temporary file; mysql: --mysql-name on the my_secrets.py server.')
+    parser.add_argument('--mysql-name',
+                        help='MySQL schema for --database mysql. Its activities are replaced.')
+    parser.add_argument('--solr-url',
+                        help='Use this Solr core instead of the in-process fake. Its activities are replaced.')
+    parser.add_argument('--solr-latency', type=float, default=0.0,
+                        help='Milliseconds the fake Solr waits before answering each request.')
+    parser.add_argument('--upload-rows', type=int, default=1000,
+                        help='Rows per bulk-upload run.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the generated corpora.')
+    parser.add_argument('--output',
+                        help='Results file (default: benchmarks/results/<timestamp>.json).')
+    parser.add_argument('--list', action='store_true',
+                        help='List the scenarios and exit.')
+    # Internal: run one corpus size and write its results to a file
+    parser.add_argument('--child-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    return parser
+
+def _scenario_names(options):
+    return [name.strip() for name in options.scenarios.split(',') if name.strip()]
+
+def setup_django(options, solr_url, workdir):
+    os.environ['BENCH_DATABASE'] = options.database
+    os.environ['BENCH_SOLR_URL'] = solr_url
+    if options.database == 'mysql':
+        os.environ['BENCH_MYSQL_NAME'] = options.mysql_name
+    else:
+        os.environ['BENCH_SQLITE_PATH'] = os.path.join(workdir, 'db.sqlite3')
+    if options.engine:
+        os.environ['BENCH_ENGINE'] = options.engine
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+    import django
+    django.setup()
+
+def _run_sync(scenario, context, runs, warmups, concurrency):
+    from django.db import connection
+    from django.test import Client
+
+    for _ in range(warmups):
+        scenario.prepare(context)
+        try:
+            scenario.run(context, Client())
+        finally:
+            scenario.cleanup(context)
+
+    latencies = []
+    errors = 0
+    remaining = runs
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal errors, remaining
+        client = Client()
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                remaining -= 1
+            scenario.prepare(context)
+            started = time.perf_counter()
+            try:
+                ok = scenario.run(context, client)
+            except Exception:
+                log.exception("%s failed", scenario.name)
+                ok = False
+            elapsed = time.perf_counter() - started
+            scenario.cleanup(context)
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+    def thread_worker():
+        try:
+            worker()
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=thread_worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+async def _run_async(scenario, context, runs, warmups, concurrency):
+    from asgiref.sync import sync_to_async
+    from django.test import AsyncClient
+
+    # prepare() may touch the database (bumping the shared cache generation)
+    prepare = sync_to_async(scenario.prepare)
+    client = AsyncClient()
+    for _ in range(warmups):
+        await prepare(context)
+        try:
+            await scenario.run(context, client)
+        finally:
+            scenario.cleanup(context)
+
+    latencies = []
+    errors = 0
+    remaining = runs
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining:
+            remaining -= 1
+            await prepare(context)
+            started = time.perf_counter()
+            try:
+                ok = await scenario.run(context, client)
+            except Exception:
+                log.exception("%s failed", scenario.name)
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+            scenario.cleanup(context)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+def run_scenario(scenario, context, options):
+    """
+    Run a scenario and summarize it: latency percentiles, throughput and the
+    peak RSS while it ran.
+    """
+    runs = scenario.runs if scenario.runs is not None else options.requests
+    warmups = scenario.warmups if scenario.warmups is not None else options.warmup
+    concurrency = options.concurrency if scenario.concurrent else 1
+
+    with PeakRSS() as rss:
+        if scenario.is_async:
+            latencies, errors, wall_time = asyncio.run(
+                _run_async(scenario, context, runs, warmups, concurrency))
+        else:
+            latencies, errors, wall_time = _run_sync(scenario, context, runs, warmups, concurrency)
+
+    stats = summarize(latencies, wall_time, errors)
+    stats.update(concurrency=concurrency, rss_before_bytes=rss.start, peak_rss_bytes=rss.peak)
+    return stats
+
+def run_corpus(size, options):
+    """
+    Load a corpus of size activities and run the selected scenarios on it.
+    Runs in a child process.
+    """
+    solr = None
+    if not options.solr_url:
+        solr = FakeSolr(latency=options.solr_latency / 1000).start()
+    workdir = tempfile.mkdtemp(prefix='eyeview-bench-')
+    setup_django(options, options.solr_url or solr.url, workdir)
+
+    from django.core.management import call_command
+
+    from accounts.models import CustomUser
+    from accounts.serializers import CustomTokenObtainPairSerializer
+
+    from . import fixtures
+    from .scenarios import Context, get_scenarios
+
+    scenarios = get_scenarios(_scenario_names(options))
+    call_command('migrate', verbosity=0, interactive=False)
+
+    load = {}
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        fixtures.load_activities(size, seed=options.seed)
+        load['insert_s'] = round(time.perf_counter() - started, 3)
+        started = time.perf_counter()
+        load['indexed'] = fixtures.index_activities()
+        load['index_s'] = round(time.perf_counter() - started, 3)
+    load['peak_rss_bytes'] = rss.peak
+
+    user = CustomUser.objects.filter(email='bench@example.com').first()
+    if user is None:
+        user = CustomUser.objects.create_user('bench@example.com', 'bench-password')
+    token = str(CustomTokenObtainPairSerializer.get_token(user).access_token)
+    filters = {
+        'f.countries': fixtures.most_common('country'),
+        'f.thematics': fixtures.most_common('thematic'),
+        'f.date_from': '2020-01-01',
+    }
+    context = Context(size, options, token, filters)
+
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(scenario, context, options)
+        stats = results[scenario.name]
+        print(f"  {size:>9} {scenario.name:<28} p50 {stats['p50_ms']:>9.2f}ms "
+              f"p99 {stats['p99_ms']:>9.2f}ms {stats['throughput_rps']:>8.1f}/s"
+              f"{'  %d errors' % stats['errors'] if stats['errors'] else ''}",
+              file=sys.stderr, flush=True)
+
+    if solr:
+        solr.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'size': size,
+        'load': load,
+        'scenarios': results,
+        'peak_rss_bytes': max_rss(),
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _metadata(options):
+    import django
+
+    settings = {name: value for name, value in vars(options).items()
+                if not name.startswith('child_') and name not in ('output', 'list')}
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'options': settings,
+    }
+
+def print_table(runs, file=sys.stdout):
+    print(f"{'size':>9}  {'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>8} {'peak RSS MB':>11} {'errors':>6}", file=file)
+    for run in runs:
+        for name, stats in run['scenarios'].items():
+            peak = stats['peak_rss_bytes'] / 2 ** 20 if stats['peak_rss_bytes'] else float('nan')
+            print(f"{run['size']:>9}  {name:<28} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f} {stats['throughput_rps']:>8.1f} {peak:>11.1f} "
+                  f"{stats['errors']:>6}", file=file)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options = get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if options.database == 'mysql' and not options.mysql_name:
+        get_parser().error('--database mysql requires --mysql-name')
+
+    if options.child_size is not None:
+        result = run_corpus(options.child_size, options)
+        with open(options.child_output, 'w') as out:
+            json.dump(result, out)
+        return 0
+
+    # Only to list and check scenario names; each size sets up its own
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from .scenarios import SCENARIOS, get_scenarios
+
+    if options.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<28} {getattr(scenario, 'path', '') or ''} {scenario.description}")
+        return 0
+    try:
+        get_scenarios(_scenario_names(options))
+    except ValueError as e:
+        get_parser().error(str(e))
+
+    sizes = [int(size) for size in options.sizes.split(',') if size.strip()]
+    runs = []
+    for size in sizes:
+        print(f"Corpus of {size} activities...", file=sys.stderr, flush=True)
+        fd, child_output = tempfile.mkstemp(suffix='.json', prefix='bench-')
+        os.close(fd)
+        try:
+            completed = subprocess.run(
+                [sys.executable, '-m', 'benchmarks', *argv,
+                 '--child-size', str(size), '--child-output', child_output],
+                cwd=BASE_DIR,
+            )
+            if completed.returncode:
+                print(f"Benchmark of size {size} failed (exit status {completed.returncode}).",
+                      file=sys.stderr)
+                return completed.returncode
+            with open(child_output) as result:
+                runs.append(json.load(result))
+        finally:
+            os.remove(child_output)
+
+    output = Path(options.output) if options.output else (
+        RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as out:
+        json.dump({'meta': _metadata(options), 'runs': runs}, out, indent=2)
+
+    print_table(runs)
+    print(f"\nResults saved to {output}", file=sys.stderr)
+    return 0
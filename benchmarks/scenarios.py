@@ -0,0 +1,224 @@
+"""
+Benchmark scenarios: every dashboard endpoint (sync and async), bulk upload
+and reindex.
+
+A scenario's run() performs the one operation that is timed; prepare() runs
+untimed before each one. Read scenarios can be run by several clients at
+once (--concurrency); the write scenarios always run alone, after the
+reads, since they change the corpus.
+"""
+import io
+import os
+import tempfile
+import time
+
+from django.core.management import call_command
+
+from activities.cache import bump_index_generation
+
+from . import fixtures
+
+# Seconds an upload job may take before the run counts as failed
+UPLOAD_TIMEOUT = 600
+
+
+class Context:
+    """
+    State shared by the scenarios of one corpus: its size, the run options,
+    an access token and the filter values of the filtered scenarios.
+    """
+
+    def __init__(self, size, options, token, filters):
+        self.size = size
+        self.options = options
+        self.token = token
+        self.filters = filters
+        # Number of the next generated activity, so uploads add new rows
+        self.next_activity = size
+
+    @property
+    def cold(self):
+        return self.options.cache == 'cold'
+
+
+class Scenario:
+    name = None
+    description = ''
+    # Several clients may run it at once
+    concurrent = True
+    # Timed runs and warmup runs, overriding --requests and --warmup
+    runs = None
+    warmups = None
+    is_async = False
+
+    def prepare(self, context):
+        pass
+
+    def run(self, context, client):
+        """
+        Perform the timed operation with a test client; return whether it
+        succeeded.
+        """
+        raise NotImplementedError
+
+    def cleanup(self, context):
+        pass
+
+
+class Endpoint(Scenario):
+    """
+    GET an API endpoint. Parameter values may be callables of the context.
+    With the cold cache option the result cache is invalidated before each
+    request, so every request computes its result.
+    """
+
+    def __init__(self, name, path, params=None, filtered=False, authenticated=False,
+                 description='', runs=None, warmups=None):
+        self.name = name
+        self.path = path
+        self.params = params or {}
+        self.filtered = filtered
+        self.authenticated = authenticated
+        self.description = description
+        self.runs = runs
+        self.warmups = warmups
+
+    def get_params(self, context):
+        params = {name: value(context) if callable(value) else value
+                  for name, value in self.params.items()}
+        if self.filtered:
+            params.update(context.filters)
+        return params
+
+    def get_headers(self, context):
+        return {'Authorization': f'Bearer {context.token}'} if self.authenticated else {}
+
+    def prepare(self, context):
+        if context.cold:
+            bump_index_generation()
+
+    def run(self, context, client):
+        response = client.get(self.path, self.get_params(context), headers=self.get_headers(context))
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response.status_code < 400
+
+
+class AsyncEndpoint(Endpoint):
+    """
+    GET an async endpoint through Django's ASGI handler (AsyncClient).
+    """
+    is_async = True
+
+    async def run(self, context, client):
+        response = await client.get(self.path, self.get_params(context),
+                                    headers=self.get_headers(context))
+        return response.status_code < 400
+
+
+class Reindex(Scenario):
+    name = 'reindex'
+    description = 'manage.py reindex_activities over the whole corpus'
+    concurrent = False
+    runs = 3
+    warmups = 0
+
+    def run(self, context, client):
+        call_command('reindex_activities', stdout=io.StringIO())
+        return True
+
+
+class BulkUpload(Scenario):
+    """
+    POST a CSV of new activities and wait for its job to finish, through
+    the upload, insert and reindex of those rows.
+    """
+    name = 'bulk-upload'
+    description = 'POST activities/bulk-upload and poll the job until it is done'
+    concurrent = False
+    runs = 3
+    warmups = 0
+    path = None
+
+    def prepare(self, context):
+        fd, self.path = tempfile.mkstemp(suffix='.csv', prefix='bench-upload-')
+        os.close(fd)
+        fixtures.write_csv(self.path, context.options.upload_rows, context.options.seed,
+                           first=context.next_activity)
+        context.next_activity += context.options.upload_rows
+
+    def run(self, context, client):
+        headers = {'Authorization': f'Bearer {context.token}'}
+        with open(self.path, 'rb') as file:
+            response = client.post('/api/activities/bulk-upload', {'file': file}, headers=headers)
+        if response.status_code != 202:
+            return False
+
+        deadline = time.monotonic() + UPLOAD_TIMEOUT
+        while time.monotonic() < deadline:
+            job = client.get(response['Location'], headers=headers).json()
+            if job['status'] in ('succeeded', 'failed'):
+                return job['status'] == 'succeeded'
+            time.sleep(0.01)
+        return False
+
+    def cleanup(self, context):
+        if self.path:
+            os.remove(self.path)
+            self.path = None
+
+
+def _middle_page(context):
+    return max(context.size // 10 // 2, 1)
+
+# (name, path under /api/dashboard/, Endpoint options) of every dashboard endpoint
+DASHBOARD_ENDPOINTS = (
+    ('thematic-facets', 'thematic-facets/', {}),
+    ('country-facets', 'country-facets/', {}),
+    ('region-facets', 'region-facets/', {}),
+    ('directorate-facets', 'directorate-facets/', {}),
+    ('yearly-facets', 'yearly-facets/', {}),
+    ('time-series', 'time-series/', {'params': {'gap': 'month'}}),
+    ('summary', 'summary/', {}),
+    ('summary-filtered', 'summary/', {
+        'filtered': True, 'description': 'summary with country, thematic and date filters'}),
+    ('activities', 'activities/', {'params': {'page': 1}}),
+    ('activities-deep-page', 'activities/', {
+        'params': {'page': _middle_page}, 'description': 'page in the middle of the corpus'}),
+    ('activities-cursor', 'activities/', {'params': {'cursor': '*'}}),
+    ('stacked-dataset', 'stacked-dataset/', {'authenticated': True}),
+    ('export-csv', 'export/', {
+        'params': {'output': 'csv'}, 'description': 'whole corpus as CSV', 'runs': 5, 'warmups': 1}),
+)
+
+# Endpoints with an async version in activities/async_views.py
+ASYNC_ENDPOINTS = ('thematic-facets', 'country-facets', 'region-facets', 'directorate-facets',
+                   'summary', 'summary-filtered', 'stacked-dataset')
+
+SCENARIOS = (
+    [Endpoint(name, f'/api/dashboard/{path}', **options)
+     for name, path, options in DASHBOARD_ENDPOINTS]
+    + [AsyncEndpoint(f'async-{name}', f'/api/async/dashboard/{path}', **options)
+       for name, path, options in DASHBOARD_ENDPOINTS if name in ASYNC_ENDPOINTS]
+    + [Reindex(), BulkUpload()]
+)
+
+def get_scenarios(names=None):
+    """
+    The scenarios to run, in SCENARIOS order; names may end with '*' to
+    select every scenario with that prefix.
+    """
+    if not names:
+        return list(SCENARIOS)
+    selected = []
+    for scenario in SCENARIOS:
+        for name in names:
+            if scenario.name == name or (name.endswith('*') and scenario.name.startswith(name[:-1])):
+                selected.append(scenario)
+                break
+    unknown = [name for name in names if not name.endswith('*')
+               and name not in {scenario.name for scenario in SCENARIOS}]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+    return selected
@@ -0,0 +1,64 @@
+"""
+Settings for the benchmark suite: the project settings with a throwaway
+database and the Solr core served by benchmarks/fake_solr.py (or the one
+given with --solr-url). benchmarks/run.py sets the variables below before
+Django starts; each corpus size runs in its own process.
+
+    BENCH_DATABASE       'sqlite' (default) or 'mysql'
+    BENCH_SQLITE_PATH    SQLite database file
+    BENCH_MYSQL_NAME     MySQL schema to use, on the server of my_secrets.py.
+                         Its activities are replaced, so never the app's own.
+    BENCH_SOLR_URL       Solr core URL
+    BENCH_ENGINE         ACTIVITIES_DASHBOARD_ENGINE override
+"""
+import os
+import sys
+import types
+
+try:
+    import my_secrets  # noqa: F401
+except ImportError:
+    # MySQL credentials are only needed for BENCH_DATABASE=mysql
+    my_secrets = types.ModuleType('my_secrets')
+    my_secrets.mysql_secrets = {}
+    sys.modules['my_secrets'] = my_secrets
+
+from eyeview.settings import *  # noqa: E402,F401,F403
+from eyeview.settings import DATABASES, HAYSTACK_CONNECTIONS  # noqa: E402
+
+# Keeping every SQL query in connection.queries would skew time and memory
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', '127.0.0.1', 'localhost']
+
+if os.environ.get('BENCH_DATABASE', 'sqlite') == 'mysql':
+    DATABASES = {'default': {**DATABASES['default'], 'NAME': os.environ['BENCH_MYSQL_NAME']}}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BENCH_SQLITE_PATH', ':memory:'),
+            # Upload jobs write from a worker thread while requests read
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+
+HAYSTACK_CONNECTIONS = {
+    'default': {
+        **HAYSTACK_CONNECTIONS['default'],
+        'URL': os.environ.get('BENCH_SOLR_URL', HAYSTACK_CONNECTIONS['default']['URL']),
+    },
+}
+
+if os.environ.get('BENCH_ENGINE'):
+    ACTIVITIES_DASHBOARD_ENGINE = os.environ['BENCH_ENGINE']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        # Failed requests are counted in the results instead
+        'django.request': {'level': 'ERROR'},
+    },
+}
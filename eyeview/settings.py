@@ -42,7 +42,8 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'accounts.CustomUser'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with a short-lived in-process user cache
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 20
@@ -57,6 +58,9 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# Seconds CachedJWTAuthentication keeps a resolved user (see accounts/authentication.py)
+ACCOUNTS_USER_CACHE_TTL = 60
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -143,10 +147,63 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
+        # Pooled keep-alive session, timeouts and retries: see activities/solr_backend.py
+        'ENGINE': 'activities.solr_backend.ManagedSolrEngine',
         'URL': 'http://localhost:8983/solr/eyeview_activities',
         'INCLUDE_SPELLING': True,
+        'TIMEOUT': 10,
+        'CONNECT_TIMEOUT': 2,
+        'MAX_RETRIES': 2,
+        'POOL_MAXSIZE': 10,
+        # Raise Solr errors instead of returning empty results, so views can
+        # fall back to stale results and the outbox retries failed syncs
+        'SILENTLY_FAIL': False,
     },
 }
 
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
\ No newline at end of file
+# Records saves/deletes in the index outbox inside the writing transaction;
+# run `python manage.py index_worker` to push them to Solr. Use
+# 'activities.signal_processors.BatchedSignalProcessor' to update Solr on commit instead.
+HAYSTACK_SIGNAL_PROCESSOR = 'activities.signal_processors.OutboxSignalProcessor'
+
+# Milliseconds within which Solr makes batched index changes searchable
+ACTIVITIES_INDEX_COMMIT_WITHIN = 1000
+
+# Where dashboard aggregations come from: 'solr', 'database', 'summary' (the
+# pre-aggregated ActivityCount table) or 'auto'
+# (Solr, falling back to the database when Solr is down). See activities/engines.py.
+ACTIVITIES_DASHBOARD_ENGINE = 'auto'
+
+# Rows parsed and bulk inserted per chunk by the CSV upload (see activities/ingest.py)
+ACTIVITIES_UPLOAD_CHUNK_SIZE = 5000
+
+# Uploads are imported by a background thread pool; jobs running at once per process
+ACTIVITIES_UPLOAD_WORKERS = 2
+
+# Seconds after which a pending/running upload job of a process on another host is
+# considered lost and failed (see activities/jobs.py)
+ACTIVITIES_UPLOAD_JOB_TIMEOUT = 6 * 3600
+
+# Threads sending batches to Solr in parallel when reindexing imported rows
+ACTIVITIES_REINDEX_WORKERS = 4
+
+# Rows fetched from Solr or the database per batch by the streaming export (see activities/export.py)
+ACTIVITIES_EXPORT_BATCH_SIZE = 1000
+
+# Dashboard result cache, invalidated whenever the index changes (see activities/cache.py).
+# The generation is shared through the database, so 'local' works with several worker
+# processes; use 'shared' with a Redis/Memcached CACHES entry to share the entries too.
+ACTIVITIES_RESULT_CACHE = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 512,
+    'TIMEOUT': 3600,
+}
+
+# Circuit breaker in front of Solr and last-good results served while it is
+# failing (see activities/resilience.py)
+ACTIVITIES_SOLR_RESILIENCE = {
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 30,
+    'STALE_TIMEOUT': 24 * 3600,
+    'PAGE_STALE_MAX_ENTRIES': 256,
+}